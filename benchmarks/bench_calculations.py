@@ -0,0 +1,68 @@
+"""
+Convert & classify 1M readings: scalar functions called per reading (as it is for one report)
+against array versions which handle whole column in one call
+
+Usage: python benchmarks/bench_calculations.py [readings]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import numpy  # noqa: E402
+
+import calculations  # noqa: E402
+
+
+def bench(
+    func,
+    *args,
+) -> float:
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def scalar_column(
+    column: list,
+    func,
+) -> list:
+    return [func(value) for value in column]
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    rng = numpy.random.default_rng(42)
+    columns = {
+        "uv": rng.uniform(0, 12, count).round(2),
+        "aqi": rng.integers(0, 300, count).astype(float),
+        "kp": rng.integers(0, 10, count).astype(float),
+        "temp": rng.uniform(-30, 40, count).round(1),
+        "pres": rng.uniform(950, 1050, count),
+    }
+    lists = {name: column.tolist() for name, column in columns.items()}
+
+    cases = [
+        ("UV level", calculations.calculate_uv_level, calculations.calculate_uv_levels, "uv"),
+        ("AQI level", calculations.calculate_aqi_level, calculations.calculate_aqi_levels, "aqi"),
+        ("Kp level", calculations.calculate_kp_level, calculations.calculate_kp_levels, "kp"),
+        ("Fahrenheit", calculations.celsius_to_fahrenheit, calculations.celsius_to_fahrenheit, "temp"),
+        ("Kelvin", calculations.celsius_to_kelvin, calculations.celsius_to_kelvin, "temp"),
+        (
+            "Pressure mmHg & kPa",
+            lambda value: (value * calculations.MMHG, value * calculations.KPA),
+            calculations.convert_pressure,
+            "pres",
+        ),
+    ]
+
+    print(f"Readings: {count}")
+    for title, scalar, vectorized, name in cases:
+        scalar_time = bench(scalar_column, lists[name], scalar)
+        vectorized_time = bench(vectorized, columns[name])
+        print(
+            f"{title:<20} scalar {scalar_time * 1e3:8.1f} ms | array {vectorized_time * 1e3:7.1f} ms "
+            f"| x{scalar_time / vectorized_time:.0f}"
+        )
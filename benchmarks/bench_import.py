@@ -0,0 +1,73 @@
+"""
+Measure how long importing weather_observer takes with python -X importtime
+Fails if heavy packages are imported on startup or import is slower than --max-ms, it is checked in CI
+
+Usage: python benchmarks/bench_import.py [--repeats 5] [--max-ms 400] [--top 10]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+# Imported only by code paths which need them
+LAZY_MODULES = [
+    "asyncio",
+    "geopy",
+    "httpx",
+    "numpy",
+    "pygismeteo",
+    "pytz",
+    "timezonefinder",
+]
+
+
+def import_times() -> list:
+    """
+    Import weather_observer in fresh interpreter
+    :return: Module name, self & cumulative microseconds for every imported module
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import weather_observer"],
+        cwd=SRC,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    return modules
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--max-ms", dest="max_ms", type=float)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    runs = [import_times() for _ in range(args.repeats)]
+    totals = [dict((name, cumulative) for name, _, cumulative in modules)["weather_observer"] for modules in runs]
+    best = min(range(len(runs)), key=lambda run: totals[run])
+
+    print(f"Import of weather_observer: best {totals[best] / 1e3:.1f} ms, worst {max(totals) / 1e3:.1f} ms")
+    print("Slowest modules by self time:")
+    for name, self_us, cumulative_us in sorted(runs[best], key=lambda module: module[1], reverse=True)[: args.top]:
+        print(f"  {name:<40} self {self_us / 1e3:6.1f} ms | cumulative {cumulative_us / 1e3:6.1f} ms")
+
+    failed = False
+    imported = {name.split(".")[0] for name, _, _ in runs[best]}
+    eager = [name for name in LAZY_MODULES if name in imported]
+    if eager:
+        print(f"Imported on startup, but must be imported lazily: {', '.join(eager)}")
+        failed = True
+    if args.max_ms is not None and totals[best] / 1e3 > args.max_ms:
+        print(f"Import is slower than {args.max_ms} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,234 @@
+"""
+Run weather_observer against local stub of every provider, no live API is called
+Every scenario runs in fresh process inside temporary directory, so caches are cold and peak memory is its own
+Reports throughput, p50/p99 latency of every stage & peak memory
+
+Usage: python benchmarks/bench_offline.py [--scenarios 1,100,10000] [--latency-ms 0] [--jitter-ms 0] [--error-rate 0]
+                                          [--engine threads] [--workers 8] [--telegram] [--json]
+"""
+
+import argparse
+import functools
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCHMARKS)
+sys.path.insert(0, os.path.join(BENCHMARKS, "..", "src"))
+
+import stub_server  # noqa: E402
+
+STAGES = ["ipinfo", "locate", "prefetch", "weather", "elevation", "gismeteo", "report", "deliver"]
+
+stage_times: Dict[str, List[float]] = defaultdict(list)
+stage_times_lock = threading.Lock()
+
+
+def record_time(
+    stage: str,
+    seconds: float,
+):
+    with stage_times_lock:
+        stage_times[stage].append(seconds)
+
+
+def timed(
+    stage: str,
+    func: Callable,
+) -> Callable:
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            record_time(stage, time.perf_counter() - started)
+
+    return wrapper
+
+
+def timed_async(
+    stage: str,
+    func: Callable,
+) -> Callable:
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            record_time(stage, time.perf_counter() - started)
+
+    return wrapper
+
+
+def percentile(
+    values: List[float],
+    share: float,
+) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(share * (len(ordered) - 1))))]
+
+
+def run_scenario(
+    cities: int,
+    args: argparse.Namespace,
+) -> dict:
+    """
+    Report about passed number of cities, called in child process inside temporary directory
+    :param cities:
+    :param args:
+    :return: Measurements of the run
+    """
+    stub = stub_server.StubServer(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate)
+    stub.start()
+    stub.redirect_providers()
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "bench")
+    os.environ.setdefault("TELEGRAM_CHAT_ID", "bench")
+    os.environ.setdefault("GISMETEO_TOKEN", "bench")
+
+    import get_info
+    import rate_limit
+    import telegram_queue
+    import weather_observer
+
+    # Stub has no limits, so the harness measures the code and not waiting for tokens
+    for provider in rate_limit.LIMITS:
+        rate_limit.LIMITS[provider] = (1e9, 10**9, None)
+    telegram_queue.CHAT_MESSAGES_PER_MINUTE = 1e12
+
+    with open(get_info.CITIES_FILE, "w", encoding="utf-8") as cities_file:
+        cities_file.writelines(f"Benchcity{number}\n" for number in range(cities))
+
+    weather_observer.namespace = weather_observer.get_args().parse_args(
+        ["--api-key", "bench", "--input-file", "--output-file", "--engine", args.engine, "--workers", str(args.workers)]
+    )
+    weather_observer.locate_city = timed("locate", weather_observer.locate_city)
+    weather_observer.prefetch_batches = timed("prefetch", weather_observer.prefetch_batches)
+    weather_observer.fetch_weather_data = timed("weather", weather_observer.fetch_weather_data)
+    weather_observer.fetch_elevation = timed("elevation", weather_observer.fetch_elevation)
+    weather_observer.fetch_water_temp_and_geomagnetic_field = timed(
+        "gismeteo", weather_observer.fetch_water_temp_and_geomagnetic_field
+    )
+    weather_observer.report_record = timed("report", weather_observer.report_record)
+    if args.telegram:
+        weather_observer.report_to_file = lambda report_time, weather_report: weather_observer.report_to_telegram(
+            weather_report
+        )
+    if args.engine == "async":
+        import async_engine
+
+        engine = async_engine.AsyncEngine
+        engine.request_weather_info = timed_async("weather", engine.request_weather_info)
+        engine.get_elevation_by_ll = timed_async("elevation", engine.get_elevation_by_ll)
+        engine.get_water_temp_and_geomagnetic_field_by_ll = timed_async(
+            "gismeteo", engine.get_water_temp_and_geomagnetic_field_by_ll
+        )
+
+    started = time.perf_counter()
+    timed("ipinfo", get_info.get_current_city)()
+    weather_observer.configure_providers()
+    city_names = weather_observer.remember_cities(get_info.load_cities_from_file())
+    if args.engine == "async":
+        import asyncio
+
+        asyncio.run(weather_observer.main_async(city_names))
+    else:
+        weather_observer.main_threads(city_names)
+    timed("deliver", weather_observer.close_outputs)()
+    wall = time.perf_counter() - started
+    stub.shutdown()
+
+    reported = len(stage_times["report"])
+    return {
+        "cities": cities,
+        "reported": reported,
+        "seconds": round(wall, 3),
+        "cities_per_second": round(reported / wall, 1),
+        "stages": {
+            stage: {
+                "calls": len(stage_times[stage]),
+                "p50_ms": round(percentile(stage_times[stage], 0.5) * 1000, 2),
+                "p99_ms": round(percentile(stage_times[stage], 0.99) * 1000, 2),
+            }
+            for stage in STAGES
+            if stage_times[stage]
+        },
+        # Kilobytes on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "stub_requests": {host: dict(counts) for host, counts in stub.counts.items()},
+    }
+
+
+def print_result(
+    result: dict,
+):
+    print(
+        f"\n{result['cities']} cities: reported {result['reported']} in {result['seconds']} s, "
+        f"{result['cities_per_second']} cities/s, peak RSS {result['peak_rss_mb']} MB"
+    )
+    print(f"  {'stage':<10} {'calls':>7} {'p50 ms':>9} {'p99 ms':>9}")
+    for stage, times in result["stages"].items():
+        print(f"  {stage:<10} {times['calls']:>7} {times['p50_ms']:>9} {times['p99_ms']:>9}")
+    print(
+        "  stub: "
+        + ", ".join(
+            f"{host} {' '.join(f'{counter} {value}' for counter, value in counts.items())}"
+            for host, counts in result["stub_requests"].items()
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark weather_observer against local stub of every provider")
+    parser.add_argument("--scenarios", default="1,100,10000", help="Comma separated numbers of cities")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Delay of every stub answer")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="Random delay added to every stub answer")
+    parser.add_argument("--error-rate", type=float, default=0, help="Share of stub answers which are 429 or 503")
+    parser.add_argument("--engine", choices=["threads", "async"], default="threads")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--telegram", action="store_true", help="Deliver reports to telegram instead of file")
+    parser.add_argument("--json", action="store_true", help="Print one JSON line per scenario")
+    parser.add_argument("--run", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run is not None:
+        result = run_scenario(args.run, args)
+        sys.stdout.write(json.dumps(result) + "\n")
+        return
+
+    child_args = [
+        f"--latency-ms={args.latency_ms}",
+        f"--jitter-ms={args.jitter_ms}",
+        f"--error-rate={args.error_rate}",
+        f"--engine={args.engine}",
+        f"--workers={args.workers}",
+    ] + (["--telegram"] if args.telegram else [])
+    for cities in [int(number) for number in args.scenarios.split(",")]:
+        with tempfile.TemporaryDirectory() as work_dir:
+            completed = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--run", str(cities)] + child_args,
+                cwd=work_dir,
+                capture_output=True,
+                text=True,
+            )
+        if completed.returncode != 0:
+            print(completed.stderr[-2000:], file=sys.stderr)
+            sys.exit(completed.returncode)
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        if args.json:
+            print(json.dumps(result))
+        else:
+            print_result(result)
+
+
+if __name__ == "__main__":
+    main()
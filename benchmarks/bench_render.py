@@ -0,0 +1,144 @@
+"""
+Render 10k city reports: f-strings rebuilt line by line with conversions recalculated (as it was)
+against WeatherReport calculated once and rendered by f-string function of every sink
+
+Usage: python benchmarks/bench_render.py [reports]
+"""
+
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import calculations  # noqa: E402
+import report  # noqa: E402
+
+LOCAL_TIME = "2022-08-01 12:00:00 +0200"
+
+
+def random_weather_data(
+    rnd: random.Random,
+) -> dict:
+    return {
+        "pod": rnd.choice(["d", "n"]),
+        "pres": rnd.uniform(950, 1050),
+        "slp": rnd.uniform(950, 1050),
+        "wind_spd": round(rnd.uniform(0, 20), 1),
+        "wind_cdir": rnd.choice(["N", "NE", "E", "SE", "S", "SW", "W", "NW"]),
+        "rh": rnd.randint(0, 100),
+        "clouds": rnd.randint(0, 100),
+        "solar_rad": round(rnd.uniform(0, 900), 1),
+        "snow": 0,
+        "uv": round(rnd.uniform(0, 12), 1),
+        "aqi": rnd.randint(0, 300),
+        "temp": round(rnd.uniform(-30, 40), 1),
+        "app_temp": round(rnd.uniform(-30, 40), 1),
+    }
+
+
+def legacy_render(
+    out: io.StringIO,
+    w: dict,
+    city_name: str,
+    country_name: str,
+    elevation: int,
+    water_temp: float,
+    geomagnetic_field: int,
+):
+    """
+    Markdown section built the way report_to_file did it before WeatherReport
+    """
+    out.write(f"## Country: {country_name} | City name: {city_name.capitalize()}  \n")
+    out.write("### Timezone: Europe/Madrid  \n")
+    out.write(f"**Elevation under sea level:** {elevation} m  \n")
+    out.write(
+        f"Geomagnetic field: {geomagnetic_field} - {calculations.calculate_kp_level(geomagnetic_field).capitalize()}  \n"
+    )
+    out.write(f"Country: {country_name} | City name: {city_name.capitalize()}  \n")
+    out.write("Timezone: Europe/Madrid  \n")
+    out.write(f"Time: {LOCAL_TIME}  \n")
+    out.write("\n")
+    out.write(f"Part of a day: {w['pod']}  \n")
+    out.write(f"Elevation above sea level: {elevation} m  \n")
+    out.write(
+        f"Geomagnetic field: {geomagnetic_field} - {calculations.calculate_kp_level(geomagnetic_field).capitalize()}  \n"
+    )
+    out.write("\n")
+    out.write(
+        f"Pressure: {round(w['pres'], 2)} mb | {round(w['pres'] * calculations.MMHG, 2)} mmHg "
+        f"| {round(w['pres'] * calculations.KPA, 2)} kPa  \n"
+    )
+    out.write(
+        f"Sea level pressure: {round(w['slp'], 2)} mb | {round(w['slp'] * calculations.MMHG, 2)} mmHg "
+        f"| {round(w['slp'] * calculations.KPA, 2)} kPa  \n"
+    )
+    out.write("\n")
+    out.write(f"Wind speed: {w['wind_spd']} m/s  \n")
+    out.write(f"Wind direction: {w['wind_cdir']}  \n")
+    out.write(f"Relative humidity: {w['rh']}%  \n")
+    out.write(f"Cloud percents: {w['clouds']}%  \n")
+    out.write(f"**Solar radiation**: {w['solar_rad']} Watt/m^2  \n")
+    out.write(f"Snowfall: {w['snow']} mm/hr  \n")
+    out.write("\n")
+    out.write(f"UV (UltraViolet): {w['uv']} - {calculations.calculate_uv_level(round(w['uv'], 1)).capitalize()}  \n")
+    out.write(f"AQI (Air Quality Index): {w['aqi']} - {calculations.calculate_aqi_level(w['aqi']).capitalize()}  \n")
+    out.write("\n")
+    for name, value in (
+        ("Temperature", w["temp"]),
+        ("Apparent temperature", w["app_temp"]),
+        ("Water temperature", water_temp),
+    ):
+        out.write(
+            f"**{name}**: {value} C | {round(calculations.celsius_to_fahrenheit(value), 1)} F "
+            f"| {round(calculations.celsius_to_kelvin(value), 1)} K  \n"
+        )
+    out.write("\n")
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    rnd = random.Random(42)
+    cities = [
+        (
+            random_weather_data(rnd),
+            f"city{i}",
+            "Spain",
+            rnd.randint(0, 3000),
+            round(rnd.uniform(0, 30), 1),
+            rnd.randint(0, 9),
+        )
+        for i in range(count)
+    ]
+
+    start = time.perf_counter()
+    out = io.StringIO()
+    for w, city_name, country_name, elevation, water_temp, geomagnetic_field in cities:
+        legacy_render(out, w, city_name, country_name, elevation, water_temp, geomagnetic_field)
+    legacy = time.perf_counter() - start
+
+    start = time.perf_counter()
+    out = io.StringIO()
+    for w, city_name, country_name, elevation, water_temp, geomagnetic_field in cities:
+        weather_report = report.WeatherReport(
+            w, city_name, "Europe/Madrid", country_name, elevation, water_temp, geomagnetic_field, LOCAL_TIME
+        )
+        out.write(report.render_file(weather_report))
+    compiled = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for w, city_name, country_name, elevation, water_temp, geomagnetic_field in cities:
+        weather_report = report.WeatherReport(
+            w, city_name, "Europe/Madrid", country_name, elevation, water_temp, geomagnetic_field, LOCAL_TIME
+        )
+        report.render_console(weather_report)
+        report.render_telegram(weather_report)
+        report.render_file(weather_report)
+    all_sinks = time.perf_counter() - start
+
+    print(f"Reports: {count}")
+    print(f"Legacy f-strings, file sink:      {legacy * 1e3:.1f} ms ({legacy / count * 1e6:.1f} us/report)")
+    print(f"WeatherReport + render, file:     {compiled * 1e3:.1f} ms ({compiled / count * 1e6:.1f} us/report)")
+    print(f"WeatherReport + all three sinks:  {all_sinks * 1e3:.1f} ms ({all_sinks / count * 1e6:.1f} us/report)")
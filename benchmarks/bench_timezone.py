@@ -0,0 +1,58 @@
+"""
+Compare per-city timezone resolution cost:
+new TimezoneFinder per city (as it was) against shared finder with memo on rounded coordinates
+
+Usage: python benchmarks/bench_timezone.py [cities] [repeats]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from timezonefinder import TimezoneFinder  # noqa: E402
+
+import get_info  # noqa: E402
+
+
+def random_points(
+    count: int,
+) -> list:
+    rnd = random.Random(42)
+    return [(rnd.uniform(-60.0, 70.0), rnd.uniform(-180.0, 180.0)) for _ in range(count)]
+
+
+def bench_new_finder_per_city(
+    points: list,
+) -> float:
+    start = time.perf_counter()
+    for latitude, longitude in points:
+        TimezoneFinder().timezone_at(lng=longitude, lat=latitude)
+    return time.perf_counter() - start
+
+
+def bench_shared_finder(
+    points: list,
+) -> float:
+    start = time.perf_counter()
+    for latitude, longitude in points:
+        get_info.get_timezone_by_ll(latitude, longitude)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    cities = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    points = random_points(cities)
+
+    # Telegram loop resolves the same cities on every pass
+    before = bench_new_finder_per_city(points * repeats)
+    after = bench_shared_finder(points * repeats)
+
+    lookups = cities * repeats
+    print(f"Lookups: {lookups} ({cities} cities x {repeats} passes)")
+    print(f"New TimezoneFinder per city: {before / lookups * 1e6:.1f} us/city")
+    print(f"Shared finder with memo:     {after / lookups * 1e6:.1f} us/city")
+    print(f"Speedup: x{before / after:.1f}")
@@ -0,0 +1,332 @@
+"""
+Local server which answers like every provider does, responses are built from recorded fixtures
+Provider host is the first path segment, transports of the benchmarked process send requests of every provider here
+
+Usage: python benchmarks/stub_server.py [--port 8000] [--latency-ms 0] [--jitter-ms 0] [--error-rate 0]
+"""
+
+import argparse
+import copy
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+from urllib.parse import parse_qs, urlparse, urlunparse
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+HOST = "127.0.0.1"
+
+# Every provider which is called during the run & fixture it answers with
+PROVIDER_FIXTURES = {
+    "ipinfo.io": ["ipinfo.json"],
+    "nominatim.openstreetmap.org": ["nominatim_search.json", "nominatim_reverse.json"],
+    "api.open-elevation.com": ["open_elevation_lookup.json"],
+    "api.gismeteo.net": ["gismeteo_search_cities.json", "gismeteo_current.json"],
+    "api.weatherbit.io": ["weatherbit_current.json"],
+    "api.telegram.org": ["telegram_send_message.json"],
+}
+
+
+def load_fixture(
+    name: str,
+) -> any:
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as fixture:
+        return json.load(fixture)
+
+
+def coordinates_by_name(
+    name: str,
+) -> Tuple[float, float]:
+    """
+    Stable coordinates of city, so every city has its own timezone, elevation & Gismeteo id
+    :param name:
+    :return:
+    """
+    digest = hashlib.md5(name.lower().encode("utf-8")).digest()
+    latitude = int.from_bytes(digest[:4], "big") / 2**32 * 120 - 55
+    longitude = int.from_bytes(digest[4:8], "big") / 2**32 * 360 - 180
+    return round(latitude, 4), round(longitude, 4)
+
+
+def gismeteo_id_by_coordinates(
+    latitude: float,
+    longitude: float,
+) -> int:
+    digest = hashlib.md5(f"{round(latitude, 4)},{round(longitude, 4)}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:3], "big")
+
+
+class StubServer:
+    """
+    Answer every provider from fixtures with injected latency & errors
+    """
+
+    def __init__(
+        self,
+        host: str = HOST,
+        port: int = 0,
+        latency_ms: float = 0,
+        jitter_ms: float = 0,
+        error_rate: float = 0,
+        seed: int = 0,
+    ):
+        """
+        :param host:
+        :param port: Free port is taken if 0
+        :param latency_ms: Delay of every answer
+        :param jitter_ms: Random delay added to latency
+        :param error_rate: Share of requests answered with 429 or 503
+        :param seed:
+        """
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.counts: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.fixtures = {name: load_fixture(name) for names in PROVIDER_FIXTURES.values() for name in names}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.request_queue_size = 1024
+        self._httpd.stub_server = self
+        self._thread = None
+
+    @property
+    def address(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def rewrite_url(
+        self,
+        url: str,
+    ) -> str:
+        """
+        URL of this server which answers instead of provider, URL of any other host is kept
+        :param url:
+        :return:
+        """
+        parsed = urlparse(url)
+        if parsed.hostname not in PROVIDER_FIXTURES:
+            return url
+        base = urlparse(self.address)
+        return urlunparse(parsed._replace(scheme=base.scheme, netloc=base.netloc, path=f"/{parsed.hostname}{parsed.path}"))
+
+    def redirect_providers(self):
+        """
+        Send requests of every provider to this server, transports of requests & httpx are patched in this process
+        Sessions of http_session, geopy & async engine send through them, so production code knows nothing of stub
+        :return:
+        """
+        import httpx
+        from requests.adapters import HTTPAdapter
+
+        rewrite_url = self.rewrite_url
+        send = HTTPAdapter.send
+        handle_async_request = httpx.AsyncHTTPTransport.handle_async_request
+
+        def send_to_stub(adapter, request, *args, **kwargs):
+            request.url = rewrite_url(request.url)
+            return send(adapter, request, *args, **kwargs)
+
+        async def handle_async_request_to_stub(transport, request):
+            request.url = httpx.URL(rewrite_url(str(request.url)))
+            return await handle_async_request(transport, request)
+
+        HTTPAdapter.send = send_to_stub
+        httpx.AsyncHTTPTransport.handle_async_request = handle_async_request_to_stub
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def start(self):
+        """
+        Serve from background thread
+        :return:
+        """
+        self._thread = threading.Thread(target=self.serve_forever, name="stub", daemon=True)
+        self._thread.start()
+
+    def shutdown(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def count(
+        self,
+        host: str,
+        counter: str,
+    ):
+        with self._lock:
+            self.counts[host][counter] += 1
+
+    def delay(self) -> float:
+        with self._lock:
+            return (self.latency_ms + self._random.uniform(0, self.jitter_ms)) / 1000
+
+    def injected_error(self) -> int:
+        """
+        :return: Status code of error to answer with, 0 if request is answered normally
+        """
+        with self._lock:
+            if self._random.random() >= self.error_rate:
+                return 0
+            return self._random.choice([429, 503])
+
+    def answer(
+        self,
+        host: str,
+        path: str,
+        query: Dict[str, List[str]],
+        body: any,
+    ) -> Tuple[int, any]:
+        """
+        Build provider answer from fixture
+        :param host: Provider host
+        :param path: Path without host
+        :param query:
+        :param body: JSON body of POST request
+        :return: Status code & JSON body
+        """
+        if host == "ipinfo.io":
+            return 200, self.fixtures["ipinfo.json"]
+
+        if host == "nominatim.openstreetmap.org":
+            if path.startswith("/search"):
+                latitude, longitude = coordinates_by_name(query.get("q", [""])[0].split(",")[0])
+                found = copy.deepcopy(self.fixtures["nominatim_search.json"])
+                found[0].update(lat=str(latitude), lon=str(longitude), display_name=query.get("q", [""])[0])
+                return 200, found
+            if path.startswith("/reverse"):
+                address = copy.deepcopy(self.fixtures["nominatim_reverse.json"])
+                address.update(lat=query.get("lat", ["0"])[0], lon=query.get("lon", ["0"])[0])
+                return 200, address
+
+        if host == "api.open-elevation.com":
+            if body is not None:
+                locations = [(location["latitude"], location["longitude"]) for location in body["locations"]]
+            else:
+                locations = [
+                    tuple(float(value) for value in location.split(","))
+                    for location in query.get("locations", [""])[0].split("|")
+                ]
+            return 200, {
+                "results": [
+                    {"latitude": latitude, "longitude": longitude, "elevation": int(abs(latitude) * 40)}
+                    for latitude, longitude in locations
+                ]
+            }
+
+        if host == "api.gismeteo.net":
+            if path.startswith("/v2/search/cities"):
+                found = copy.deepcopy(self.fixtures["gismeteo_search_cities.json"])
+                found["response"][0]["id"] = gismeteo_id_by_coordinates(
+                    float(query.get("latitude", ["0"])[0]),
+                    float(query.get("longitude", ["0"])[0]),
+                )
+                return 200, found
+            if path.startswith("/v2/weather/current/"):
+                current = copy.deepcopy(self.fixtures["gismeteo_current.json"])
+                current["response"]["city"] = int(path.rstrip("/").rsplit("/", 1)[1])
+                return 200, current
+
+        if host == "api.weatherbit.io" and path.startswith("/v2.0/current"):
+            found = copy.deepcopy(self.fixtures["weatherbit_current.json"])
+            cities = query["cities"][0].split(",") if "cities" in query else query.get("city", [""])
+            found["data"] = [dict(found["data"][0], city_name=city) for city in cities]
+            found["count"] = len(found["data"])
+            return 200, found
+
+        if host == "api.telegram.org" and path.endswith("/sendMessage"):
+            return 200, self.fixtures["telegram_send_message.json"]
+
+        return 404, {"error": f"No fixture for {host}{path}"}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._answer(None)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self._answer(json.loads(self.rfile.read(length)) if length else {})
+
+    def _answer(
+        self,
+        body: any,
+    ):
+        stub_server = self.server.stub_server
+        url = urlparse(self.path)
+        _, host, path = url.path.split("/", 2) if url.path.count("/") >= 2 else ("", url.path.strip("/"), "")
+        path = "/" + path
+
+        time.sleep(stub_server.delay())
+        stub_server.count(host, "requests")
+        status = stub_server.injected_error()
+        if status:
+            stub_server.count(host, str(status))
+            self._send_json(status, {"error": "Injected error"}, {"Retry-After": "0"})
+            return
+        try:
+            status, answer = stub_server.answer(host, path, parse_qs(url.query), body)
+        except (KeyError, ValueError, IndexError) as err:
+            status, answer = 400, {"error": f"Bad request - {err}"}
+        if status != 200:
+            stub_server.count(host, str(status))
+        self._send_json(status, answer)
+
+    def _send_json(
+        self,
+        status: int,
+        body: any,
+        headers: Dict[str, str] = None,
+    ):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(
+        self,
+        format: str,
+        *args,
+    ):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer like every weather provider from recorded fixtures")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    args = parser.parse_args()
+
+    stub_server = StubServer(
+        port=args.port,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+    )
+    print(f"Answering as {', '.join(PROVIDER_FIXTURES)} on {stub_server.address}/<provider host>/...")
+    try:
+        stub_server.serve_forever()
+    except KeyboardInterrupt:
+        stub_server.shutdown()
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
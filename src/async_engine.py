@@ -0,0 +1,409 @@
+import asyncio
+import logging
+from typing import AsyncIterator, Awaitable, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+import httpx
+
+import geo_cache
+import get_info
+import http_session
+import metrics
+import rate_limit
+import response_cache
+import single_flight
+
+GISMETEO_API = "https://api.gismeteo.net/v2/"
+
+# Size of shared connection pool
+MAX_CONNECTIONS = 100
+
+# How many requests to every host may be in flight at the same time
+HOST_CONCURRENCY = {
+    "ipinfo.io": 2,
+    "nominatim.openstreetmap.org": 1,
+    "api.open-elevation.com": 8,
+    "api.gismeteo.net": 8,
+    "api.weatherbit.io": 8,
+}
+DEFAULT_HOST_CONCURRENCY = 4
+
+# Logging
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    level=logging.INFO,
+)
+
+
+class AsyncEngine:
+    """
+    Same lookups as get_info & request_weather_info, but as coroutines
+    One event loop, one shared connection pool and semaphore per host
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        weather_api: str,
+        locate: Callable,
+        clean_weather_data: Callable,
+        take_prefetched_weather: Optional[Callable] = None,
+    ):
+        """
+        :param api_key: weatherbit API key
+        :param weather_api: weatherbit base URL
+        :param locate: Blocking function which returns location info by city key, called in thread
+        City name is taken from location info if it is there, otherwise city key is city name
+        :param clean_weather_data: Function which prepares weatherbit response for reporting
+        :param take_prefetched_weather: Function which returns weather fetched in batch by city key or None
+        """
+        self._api_key = api_key
+        self._weather_api = weather_api
+        self._locate = locate
+        self._clean_weather_data = clean_weather_data
+        self._take_prefetched_weather = take_prefetched_weather
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._refresh_tasks = set()
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(http_session.settings["read_timeout"], connect=http_session.settings["connect_timeout"]),
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_CONNECTIONS,
+            ),
+        )
+
+    def _semaphore(
+        self,
+        host: str,
+    ) -> asyncio.Semaphore:
+        if host not in self._semaphores:
+            self._semaphores[host] = asyncio.Semaphore(HOST_CONCURRENCY.get(host, DEFAULT_HOST_CONCURRENCY))
+        return self._semaphores[host]
+
+    async def _get_json(
+        self,
+        url: str,
+        params: Optional[Dict[str, str]] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ):
+        """
+        GET request with the same retry policy as http_session has, every request here is idempotent
+        :param url:
+        :param params:
+        :param headers:
+        :return:
+        """
+        host = httpx.URL(url).host
+        retries = http_session.HOST_RETRIES.get(host, http_session.settings["retries"])
+        attempt = 0
+        while True:
+            await rate_limit.acquire_async(host)
+            http_session.count(host, "requests")
+            try:
+                async with self._semaphore(host):
+                    with metrics.timer("http", rate_limit.PROVIDER_HOSTS.get(host, host)) as labels:
+                        response = await self._client.get(url, params=params, headers=headers)
+                        labels["status"] = response.status_code
+            except httpx.TransportError as transport_err:
+                delay = http_session.retry_delay(
+                    host,
+                    attempt,
+                    retries,
+                    idempotent=True,
+                    error=transport_err,
+                )
+                if delay is None:
+                    raise
+            else:
+                delay = http_session.retry_delay(
+                    host,
+                    attempt,
+                    retries,
+                    idempotent=True,
+                    status_code=response.status_code,
+                    retry_after=response.headers.get("Retry-After"),
+                )
+                if delay is None:
+                    response.raise_for_status()
+                    return response.json()
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def _cached(
+        self,
+        cache_name: str,
+        key: Hashable,
+        fetch: Callable[[], Awaitable],
+    ):
+        """
+        Serve response from provider cache, stale one is returned at once and refreshed in background task
+        :param cache_name:
+        :param key:
+        :param fetch: Function without arguments which returns coroutine requesting provider, called once for concurrent misses
+        :return:
+        """
+        cache = response_cache.get_cache(cache_name)
+        value, state = cache.lookup(key)
+        if state == response_cache.FRESH:
+            return value
+        if state == response_cache.STALE:
+            if cache.start_refresh(key):
+                task = asyncio.create_task(self._refresh(cache, key, fetch))
+                self._refresh_tasks.add(task)
+                task.add_done_callback(self._refresh_tasks.discard)
+            return value
+        value = await single_flight.get_group(cache_name).do_async(key, fetch)
+        cache.store(key, value)
+        return value
+
+    async def _refresh(
+        self,
+        cache: response_cache.ResponseCache,
+        key: Hashable,
+        fetch: Callable[[], Awaitable],
+    ):
+        value = None
+        try:
+            value = await fetch()
+        except Exception as err:
+            logging.error(f"Err while refreshing {cache.name} cache - {err}")
+        finally:
+            cache.finish_refresh(key, value)
+
+    async def get_current_city(self) -> str:
+        """
+        Return city name by trusted provider info
+        :return:
+        """
+        try:
+            return (await self._get_json(get_info.IP_SITE))["city"]
+        except httpx.HTTPError as http_err:
+            logging.error(f"Request Err while getting current city from API - {http_err}")
+            return None
+        except Exception as base_err:
+            logging.error(f"Base Err while getting current city from API - {base_err}")
+            return None
+
+    async def get_elevation_by_ll(
+        self,
+        latitude: str,
+        longitude: str,
+    ) -> int:
+        """
+        Get elevation(altitude) from open API by latitude & longitude, cache is shared with get_info
+        :param latitude:
+        :param longitude:
+        :return:
+        """
+        key = get_info.coordinates_key(latitude, longitude)
+        cached = geo_cache.get_default_cache().get_elevations([key])
+        if key in cached:
+            return cached[key]
+        try:
+            elevation = await single_flight.get_group("open-elevation").do_async(
+                key,
+                lambda: self._request_elevation(latitude, longitude),
+            )
+            geo_cache.get_default_cache().put_elevations({key: elevation})
+            return elevation
+        except httpx.HTTPError as http_err:
+            logging.error(f"Request Err while getting elevation from API - {http_err}")
+            return None
+        except Exception as base_err:
+            logging.error(f"Base Err while getting elevation from API - {base_err}")
+            return None
+
+    async def _request_elevation(
+        self,
+        latitude: str,
+        longitude: str,
+    ) -> int:
+        return (await self._get_json(get_info.OPEN_ELEVATION_API + latitude + "," + longitude))["results"][0]["elevation"]
+
+    async def _get_gismeteo(
+        self,
+        endpoint: str,
+        params: Optional[Dict[str, str]] = None,
+    ):
+        return (
+            await self._get_json(
+                f"{GISMETEO_API}{endpoint}/",
+                params=params,
+                headers={"X-Gismeteo-Token": get_info.get_gismeteo_token()},
+            )
+        )["response"]
+
+    async def _get_water_temp_and_geomagnetic_field_by_id(
+        self,
+        city_id: int,
+    ) -> Tuple[float, int]:
+        current = await self._get_gismeteo(f"weather/current/{city_id}")
+        return current["temperature"]["water"]["C"], current["gm"]
+
+    async def _search_gismeteo_city_id(
+        self,
+        latitude: float,
+        longitude: float,
+    ) -> int:
+        """
+        Find id of the nearest Gismeteo city
+        :param latitude:
+        :param longitude:
+        :return:
+        """
+        cities = await self._get_gismeteo(
+            "search/cities",
+            params={
+                "latitude": str(latitude),
+                "longitude": str(longitude),
+                "limit": "1",
+            },
+        )
+        return cities[0]["id"]
+
+    async def get_water_temp_and_geomagnetic_field_by_ll(
+        self,
+        latitude: float,
+        longitude: float,
+    ) -> Tuple[float, int]:
+        """
+        Get water temperature & geomagnetic field from https://www.gismeteo.com/api/ by latitude & longitude
+        City id cache is shared with get_info
+        :param latitude:
+        :param longitude:
+        :return: None & None if there is no Gismeteo token
+        """
+        if get_info.get_gismeteo_token() is None:
+            return None, None
+        try:
+            key = get_info.coordinates_key(latitude, longitude)
+            if key not in get_info.gismeteo_city_ids:
+                # Coordinates key is a tuple, so it does not meet city ids of the same group
+                get_info.gismeteo_city_ids[key] = await single_flight.get_group("gismeteo").do_async(
+                    key,
+                    lambda: self._search_gismeteo_city_id(latitude, longitude),
+                )
+            city_id = get_info.gismeteo_city_ids[key]
+            return await self._cached(
+                "gismeteo",
+                city_id,
+                lambda: self._get_water_temp_and_geomagnetic_field_by_id(city_id),
+            )
+        except Exception as base_err:
+            logging.error(f"Base Err while getting water temp & geomagnetic field from API - {base_err}")
+            return None, None
+
+    async def get_water_temp_by_ll(
+        self,
+        latitude: float,
+        longitude: float,
+    ) -> float:
+        return (await self.get_water_temp_and_geomagnetic_field_by_ll(latitude, longitude))[0]
+
+    async def get_geomagnetic_field_by_ll(
+        self,
+        latitude: float,
+        longitude: float,
+    ) -> int:
+        return (await self.get_water_temp_and_geomagnetic_field_by_ll(latitude, longitude))[1]
+
+    async def _request_weather_info(
+        self,
+        country_code: str,
+        city_name: str,
+    ) -> Dict[str, any]:
+        try:
+            return (
+                await self._get_json(
+                    f"{self._weather_api}current",
+                    params={
+                        "city": city_name,
+                        "country": country_code,
+                        "key": self._api_key,
+                    },
+                )
+            )["data"][0]
+        except httpx.HTTPError as http_err:
+            logging.error(f"Err while request weather info from API - {http_err}")
+            return None
+        except Exception as base_err:
+            logging.error(f"Base err while request weather info from API - {base_err}")
+            return None
+
+    async def request_weather_info(
+        self,
+        country_code: str,
+        city_name: str,
+    ) -> Dict[str, any]:
+        """
+        Fetch info about weather in passed country & city from weatherbit
+        Response is served from the same provider cache as threads engine uses
+        :param country_code:
+        :param city_name:
+        :return:
+        """
+        return await self._cached(
+            "weatherbit",
+            (country_code, city_name),
+            lambda: self._request_weather_info(country_code, city_name),
+        )
+
+    async def fetch_city(
+        self,
+        city_name: str,
+        prepared_t_l_i: Optional[Dict[str, any]] = None,
+    ) -> Optional[Dict[str, any]]:
+        """
+        Assemble one record about city, the same as FetchPipeline does
+        :param city_name:
+        :param prepared_t_l_i:
+        :return:
+        """
+        if prepared_t_l_i is None:
+            async with self._semaphore("nominatim.openstreetmap.org"):
+                prepared_t_l_i = await asyncio.to_thread(self._locate, city_name)
+            if prepared_t_l_i is None:
+                logging.error(f"Skip {city_name}, location info is not available")
+                return None
+
+        weather_data = self._take_prefetched_weather(city_name) if self._take_prefetched_weather else None
+        weather_data, elevation, (water_temp, geomagnetic_field) = await asyncio.gather(
+            (
+                asyncio.sleep(0, result=weather_data)
+                if weather_data is not None
+                else self.request_weather_info(prepared_t_l_i["country_name"], prepared_t_l_i.get("city_name", city_name))
+            ),
+            self.get_elevation_by_ll(prepared_t_l_i["latitude"], prepared_t_l_i["longitude"]),
+            self.get_water_temp_and_geomagnetic_field_by_ll(
+                float(prepared_t_l_i["latitude"]),
+                float(prepared_t_l_i["longitude"]),
+            ),
+        )
+        return {
+            "city_name": city_name,
+            **prepared_t_l_i,
+            "weather_data": self._clean_weather_data(weather_data),
+            "elevation": elevation,
+            "water_temp": water_temp,
+            "geomagnetic_field": geomagnetic_field,
+        }
+
+    async def fetch_cities(
+        self,
+        cities: Iterable[Tuple[str, Optional[Dict[str, any]]]],
+    ) -> AsyncIterator[Dict[str, any]]:
+        """
+        Fetch records about many cities concurrently, yield them as soon as they are ready
+        :param cities: City key & location info, which may be None
+        :return:
+        """
+        for future in asyncio.as_completed([self.fetch_city(city_name, prepared) for city_name, prepared in cities]):
+            try:
+                record = await future
+            except Exception as base_err:
+                logging.error(f"Base Err while fetching city info - {base_err}")
+                continue
+            if record is not None:
+                yield record
+
+    async def aclose(self):
+        await self._client.aclose()
@@ -1,3 +1,60 @@
+from bisect import bisect_right
+from typing import TYPE_CHECKING, List, Optional, Sequence
+
+# NumPy is imported by array functions only, reports about single city do not need it
+if TYPE_CHECKING:
+    import numpy
+
+# Conversion for pressure
+KPA = 0.1  # Kilo Pascal
+MMHG = 0.750062  # Millimeter of mercury
+
+# Level starts at its breakpoint and lasts till the next one, values under the first breakpoint have no level
+# Scale has no gaps, value between levels like UV 2.95, AQI 33.5 or Kp 3.5 gets the lower level instead of None
+# Reports pass UV rounded to 1 digit, integer AQI & Kp, so their levels are the same as before
+UV_BREAKPOINTS = [0.0, 3.0, 6.0, 8.0, 11.0]
+UV_LEVELS = ["green", "yellow", "orange", "red", "purple"]
+
+AQI_BREAKPOINTS = [0, 34, 67, 100, 150, 201]
+AQI_LEVELS = ["very good", "good", "fair", "poor", "very poor", "hazardous"]
+
+KP_BREAKPOINTS = [0, 3, 4, 5, 6, 7, 8, 9]
+KP_LEVELS = [
+    "quiet",
+    "unsettled",
+    "active",
+    "minor storm",
+    "moderate storm",
+    "strong storm",
+    "severe storm",
+    "intense storm",
+]
+
+
+def _classify(
+    value: float,
+    breakpoints: List[float],
+    levels: List[str],
+) -> Optional[str]:
+    if not value >= breakpoints[0]:
+        return None
+    return levels[bisect_right(breakpoints, value) - 1]
+
+
+def _classify_array(
+    values: Sequence[float],
+    breakpoints: List[float],
+    levels: List[str],
+) -> "numpy.ndarray":
+    import numpy
+
+    values = numpy.asarray(values, dtype=float)
+    indexes = numpy.searchsorted(breakpoints, values, side="right")
+    # NaN is sorted after every breakpoint, it is a missing reading and has no level as values under the scale
+    indexes[numpy.isnan(values)] = 0
+    return numpy.array([None] + levels, dtype=object)[indexes]
+
+
 def calculate_uv_level(
     uv_value: float,
 ) -> str:
@@ -6,16 +63,18 @@ def calculate_uv_level(
     :param uv_value:
     :return:
     """
-    if 0.0 <= uv_value <= 2.9:
-        return "green"
-    elif 3.0 <= uv_value <= 5.9:
-        return "yellow"
-    elif 6.0 <= uv_value <= 7.9:
-        return "orange"
-    elif 8.0 <= uv_value <= 10.9:
-        return "red"
-    elif 11.0 <= uv_value:
-        return "purple"
+    return _classify(uv_value, UV_BREAKPOINTS, UV_LEVELS)
+
+
+def calculate_uv_levels(
+    uv_values: Sequence[float],
+) -> "numpy.ndarray":
+    """
+    Passed array of UV values and return array of string values on the scale, None for NaN
+    :param uv_values:
+    :return:
+    """
+    return _classify_array(uv_values, UV_BREAKPOINTS, UV_LEVELS)
 
 
 def calculate_aqi_level(
@@ -26,18 +85,18 @@ def calculate_aqi_level(
     :param aqi_value:
     :return:
     """
-    if 0 <= aqi_value <= 33:
-        return "very good"
-    elif 34 <= aqi_value <= 66:
-        return "good"
-    elif 67 <= aqi_value <= 99:
-        return "fair"
-    elif 100 <= aqi_value <= 149:
-        return "poor"
-    elif 150 <= aqi_value <= 200:
-        return "very poor"
-    elif 200 <= aqi_value:
-        return "hazardous"
+    return _classify(aqi_value, AQI_BREAKPOINTS, AQI_LEVELS)
+
+
+def calculate_aqi_levels(
+    aqi_values: Sequence[float],
+) -> "numpy.ndarray":
+    """
+    Passed array of Air Quality Index values and return array of string values on the scale, None for NaN
+    :param aqi_values:
+    :return:
+    """
+    return _classify_array(aqi_values, AQI_BREAKPOINTS, AQI_LEVELS)
 
 
 def calculate_kp_level(
@@ -49,29 +108,25 @@ def calculate_kp_level(
     :param kp_value:
     :return:
     """
-    if 0 <= kp_value < 3:
-        return "quiet"
-    elif kp_value == 3:
-        return "unsettled"
-    elif kp_value == 4:
-        return "active"
-    elif kp_value == 5:
-        return "minor storm"
-    elif kp_value == 6:
-        return "moderate storm"
-    elif kp_value == 7:
-        return "strong storm"
-    elif kp_value == 8:
-        return "severe storm"
-    elif kp_value >= 9:
-        return "intense storm"
+    return _classify(kp_value, KP_BREAKPOINTS, KP_LEVELS)
+
+
+def calculate_kp_levels(
+    kp_values: Sequence[float],
+) -> "numpy.ndarray":
+    """
+    Passed array of Kp values and return array of string values on the scale, None for NaN
+    :param kp_values:
+    :return:
+    """
+    return _classify_array(kp_values, KP_BREAKPOINTS, KP_LEVELS)
 
 
 def celsius_to_fahrenheit(
     celsius: float,
 ) -> float:
     """
-    Convert celsius to fahrenheit
+    Convert celsius to fahrenheit, numpy array is converted as a whole
     :param celsius:
     :return:
     """
@@ -82,12 +137,25 @@ def celsius_to_kelvin(
     celsius: float,
 ) -> float:
     """
-    Convert celsius to kelvin
+    Convert celsius to kelvin, numpy array is converted as a whole
     :param celsius:
     :return:
     """
     return celsius + 273.15
 
 
+def convert_pressure(
+    millibars: Sequence[float],
+) -> "numpy.ndarray":
+    """
+    Convert pressure in millibars to mmHg & kPa
+    :param millibars: Number or array
+    :return: Array of two rows, mmHg & kPa
+    """
+    import numpy
+
+    return numpy.multiply.outer([MMHG, KPA], numpy.asarray(millibars, dtype=float))
+
+
 if __name__ == "__main__":
     pass
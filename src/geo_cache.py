@@ -0,0 +1,179 @@
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+# Cache file, lives next to cities.txt
+GEOCODING_CACHE_FILE = "geocoding_cache.db"
+
+# Logging
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    level=logging.INFO,
+)
+
+
+def normalize_city_name(
+    city_name: str,
+) -> str:
+    """
+    Normalize city name to use it as cache key
+    :param city_name:
+    :return:
+    """
+    return " ".join(city_name.split()).casefold()
+
+
+class GeocodingCache:
+    """
+    On-disk cache of location info resolved by geocoder
+    City coordinates, country and timezone never change, so entries live forever unless ttl passed
+    """
+
+    def __init__(
+        self,
+        path: str = GEOCODING_CACHE_FILE,
+        ttl: Optional[float] = None,
+    ):
+        """
+        :param path: SQLite database file
+        :param ttl: Seconds after which entry is resolved again, None means never
+        """
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        # Processes of sharded run read while another one writes
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS locations (
+                city TEXT PRIMARY KEY,
+                latitude REAL NOT NULL,
+                longitude REAL NOT NULL,
+                country_name TEXT NOT NULL,
+                country_code TEXT NOT NULL,
+                timezone TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """)
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS elevations (
+                latitude REAL NOT NULL,
+                longitude REAL NOT NULL,
+                elevation INTEGER NOT NULL,
+                PRIMARY KEY (latitude, longitude)
+            )
+            """)
+        self._connection.commit()
+
+    def get(
+        self,
+        city_name: str,
+    ) -> Optional[Dict[str, str]]:
+        """
+        Return cached location info in the same shape as prepare_target_location_info does
+        None if there is no entry or it is expired
+        :param city_name:
+        :return:
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT latitude, longitude, country_name, country_code, timezone, updated_at "
+                "FROM locations WHERE city = ?",
+                (normalize_city_name(city_name),),
+            ).fetchone()
+        if row is None:
+            return None
+        latitude, longitude, country_name, country_code, timezone_by_city, updated_at = row
+        if self.ttl is not None and time.time() - updated_at > self.ttl:
+            logging.info(f"Cached location of {city_name} is expired")
+            return None
+        return {
+            "longitude": str(longitude),
+            "latitude": str(latitude),
+            "country_name": country_name,
+            "country_code": country_code,
+            "timezone_by_city": timezone_by_city,
+        }
+
+    def put(
+        self,
+        city_name: str,
+        location_info: Dict[str, str],
+    ):
+        """
+        Save location info resolved by geocoder
+        :param city_name:
+        :param location_info:
+        :return:
+        """
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO locations VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    normalize_city_name(city_name),
+                    float(location_info["latitude"]),
+                    float(location_info["longitude"]),
+                    location_info["country_name"],
+                    location_info["country_code"],
+                    location_info["timezone_by_city"],
+                    time.time(),
+                ),
+            )
+            self._connection.commit()
+
+    def get_elevations(
+        self,
+        keys: Iterable[Tuple[float, float]],
+    ) -> Dict[Tuple[float, float], int]:
+        """
+        Return cached elevations, elevation never changes so entries never expire
+        :param keys: Rounded latitude & longitude
+        :return: Elevation by key, keys which are not cached are absent
+        """
+        elevations = {}
+        with self._lock:
+            for latitude, longitude in keys:
+                row = self._connection.execute(
+                    "SELECT elevation FROM elevations WHERE latitude = ? AND longitude = ?",
+                    (latitude, longitude),
+                ).fetchone()
+                if row is not None:
+                    elevations[(latitude, longitude)] = row[0]
+        return elevations
+
+    def put_elevations(
+        self,
+        elevations: Dict[Tuple[float, float], int],
+    ):
+        """
+        Save elevations fetched from API
+        :param elevations: Elevation by rounded latitude & longitude
+        :return:
+        """
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO elevations VALUES (?, ?, ?)",
+                [(latitude, longitude, elevation) for (latitude, longitude), elevation in elevations.items()],
+            )
+            self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+default_cache = None
+default_cache_lock = threading.Lock()
+
+
+def get_default_cache() -> GeocodingCache:
+    """
+    Open cache next to cities.txt once per process
+    :return:
+    """
+    global default_cache
+    with default_cache_lock:
+        if default_cache is None:
+            default_cache = GeocodingCache(GEOCODING_CACHE_FILE)
+        return default_cache
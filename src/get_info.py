@@ -1,18 +1,50 @@
 import logging
 import os
-from datetime import datetime
-from typing import List
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, Iterator, List, NamedTuple, Optional, Tuple
 
 import requests
-from pygismeteo import Gismeteo
-from pytz import timezone
+
+import geo_cache
+import http_session
+import metrics
+import response_cache
+import single_flight
+
+# Heavy packages are imported on first use, so runs which do not need them start faster
+if TYPE_CHECKING:
+    from pygismeteo import Gismeteo
+    from timezonefinder import TimezoneFinder
 
 # Using in get_current_city func to retrieve current city name
 IP_SITE = "http://ipinfo.io/"
 OPEN_ELEVATION_API = "https://api.open-elevation.com/api/v1/lookup?locations="
+OPEN_ELEVATION_BATCH_API = "https://api.open-elevation.com/api/v1/lookup"
+GISMETEO_HOST = "api.gismeteo.net"
+# Gismeteo API answers only with token, Gismeteo fields are skipped without it
+GISMETEO_TOKEN_VARIABLE = "GISMETEO_TOKEN"
+
+# How many locations are sent to open-elevation in one request
+ELEVATION_BATCH_SIZE = 100
 
 # Input file
 CITIES_FILE = "cities.txt"
+# Long-running process checks whether cities file is changed that often, in seconds
+CITIES_POLL_INTERVAL = 60
+
+# Coordinates are rounded to ~11 m before lookups, so nearby points share memo entry
+COORDINATES_PRECISION = 4
+TIMEZONE_MEMO_SIZE = 4096
+
+# Loading polygon data is expensive, so there is only one finder per process
+timezone_finder = None
+timezone_finder_in_memory = False
+
+# One Gismeteo client per run and city id resolved once per coordinates
+gismeteo_client = None
+gismeteo_city_ids = {}
+gismeteo_token_reported = False
 
 # Logging
 logging.basicConfig(
@@ -39,25 +71,101 @@ def get_time_by_timezone(
     :param timezone_name: The name like Europe/Madrid
     :return:
     """
+    import pytz
+
     try:
         date_time_format = "%Y-%m-%d %H:%M:%S %z"
 
-        now_utc = datetime.now(timezone("UTC"))
+        now_utc = datetime.now(timezone.utc)
 
-        now_timezone = now_utc.astimezone(timezone(timezone_name))
+        now_timezone = now_utc.astimezone(pytz.timezone(timezone_name))
         return now_timezone.strftime(date_time_format)
     except BaseException as base_err:
         logging.error(f"Base Err while getting time by timezone - {base_err}")
         return None
 
 
+def coordinates_key(
+    latitude: float,
+    longitude: float,
+) -> Tuple[float, float]:
+    """
+    Round coordinates to use them as memo key
+    :param latitude:
+    :param longitude:
+    :return:
+    """
+    return (
+        round(float(latitude), COORDINATES_PRECISION),
+        round(float(longitude), COORDINATES_PRECISION),
+    )
+
+
+def configure_timezone_finder(
+    in_memory: bool,
+):
+    """
+    Decide how finder is created, without creating it until timezone is really looked up
+    :param in_memory: Load all polygon data into memory, faster lookups for the price of RAM
+    :return:
+    """
+    global timezone_finder_in_memory
+    timezone_finder_in_memory = in_memory
+
+
+def get_timezone_finder(
+    in_memory: Optional[bool] = None,
+) -> "TimezoneFinder":
+    """
+    Lazily create process-wide TimezoneFinder
+    The first call decides whether polygon data is read into memory
+    :param in_memory: Load all polygon data into memory, configured value is used if not passed
+    :return:
+    """
+    global timezone_finder
+    if timezone_finder is None:
+        from timezonefinder import TimezoneFinder
+
+        timezone_finder = TimezoneFinder(in_memory=timezone_finder_in_memory if in_memory is None else in_memory)
+    return timezone_finder
+
+
+@lru_cache(maxsize=TIMEZONE_MEMO_SIZE)
+def _timezone_at_rounded(
+    latitude: float,
+    longitude: float,
+) -> str:
+    finder = get_timezone_finder()
+    with metrics.timer("timezone", "timezonefinder"):
+        return finder.timezone_at(
+            lng=longitude,
+            lat=latitude,
+        )
+
+
+def get_timezone_by_ll(
+    latitude: float,
+    longitude: float,
+) -> str:
+    """
+    Get timezone name by latitude & longitude, memoized on rounded coordinates
+    :param latitude:
+    :param longitude:
+    :return: The name like Europe/Madrid
+    """
+    return _timezone_at_rounded(*coordinates_key(latitude, longitude))
+
+
 def get_current_city() -> str:
     """
     Return city name by trusted provider info
     :return:
     """
     try:
-        return requests.get(IP_SITE).json()["city"]
+        return single_flight.get_group("ipinfo").do(
+            IP_SITE,
+            lambda: http_session.get(IP_SITE).json()["city"],
+        )
     except requests.exceptions.RequestException as request_exception:
         logging.error(f"Request Err while getting current city from API - {request_exception}")
         return None
@@ -66,24 +174,149 @@ def get_current_city() -> str:
         return None
 
 
+def get_elevations_by_ll(
+    coordinates: List[Tuple[float, float]],
+    batch_size: int = ELEVATION_BATCH_SIZE,
+) -> List[int]:
+    """
+    Get elevations(altitudes) from open API by latitudes & longitudes in as few requests as possible
+    Elevation never changes, so it is cached forever and only never seen coordinates reach the network
+    :param coordinates: Latitude & longitude pairs
+    :param batch_size: How many locations are sent in one request
+    :return: Elevations in the same order as coordinates, None if not fetched
+    """
+    keys = [coordinates_key(latitude, longitude) for latitude, longitude in coordinates]
+    cache = geo_cache.get_default_cache()
+    elevations = cache.get_elevations(set(keys))
+    missing = [key for key in dict.fromkeys(keys) if key not in elevations]
+    for start in range(0, len(missing), batch_size):
+        chunk = missing[start : start + batch_size]
+        try:
+            results = http_session.post(
+                OPEN_ELEVATION_BATCH_API,
+                json={"locations": [{"latitude": latitude, "longitude": longitude} for latitude, longitude in chunk]},
+            ).json()["results"]
+        except requests.exceptions.RequestException as req_ex:
+            logging.error(f"Request Err while getting elevations from API - {req_ex}")
+            continue
+        except BaseException as base_err:
+            logging.error(f"Base Err while getting elevations from API - {base_err}")
+            continue
+        if len(results) != len(chunk):
+            logging.error(f"Elevations batch has {len(results)} results instead of {len(chunk)}, batch is dropped")
+            continue
+        fetched = {key: result["elevation"] for key, result in zip(chunk, results)}
+        cache.put_elevations(fetched)
+        elevations.update(fetched)
+    return [elevations.get(key) for key in keys]
+
+
 def get_elevation_by_ll(
     latitude: str,
     longitude: str,
 ) -> int:
     """
     Get elevation(altitude) from open API by latitude & longitude
+    Cities sharing coordinates at the same time wait for one request
+    :param latitude:
+    :param longitude:
+    :return:
+    """
+    return single_flight.get_group("open-elevation").do(
+        coordinates_key(latitude, longitude),
+        lambda: get_elevations_by_ll([(float(latitude), float(longitude))])[0],
+    )
+
+
+def get_gismeteo_token() -> Optional[str]:
+    """
+    Token of Gismeteo API from GISMETEO_TOKEN environment variable, missing token is reported once per run
+    :return: None if variable is not set
+    """
+    global gismeteo_token_reported
+    token = os.environ.get(GISMETEO_TOKEN_VARIABLE)
+    if not token and not gismeteo_token_reported:
+        gismeteo_token_reported = True
+        logging.error(f"{GISMETEO_TOKEN_VARIABLE} is not set, water temperature & geomagnetic field are skipped")
+    return token or None
+
+
+def get_gismeteo_client() -> "Gismeteo":
+    """
+    Lazily create Gismeteo client shared across the run
+    :return:
+    """
+    global gismeteo_client
+    if gismeteo_client is None:
+        from pygismeteo import Gismeteo
+
+        gismeteo_client = Gismeteo(
+            token=get_gismeteo_token(),
+            session=http_session.get_session(GISMETEO_HOST),
+        )
+    return gismeteo_client
+
+
+def get_gismeteo_city_id_by_ll(
+    latitude: float,
+    longitude: float,
+):
+    """
+    Resolve Gismeteo city id by latitude & longitude, only once per coordinates
     :param latitude:
     :param longitude:
     :return:
     """
+    key = coordinates_key(latitude, longitude)
+    if key not in gismeteo_city_ids:
+        gismeteo_city_ids[key] = single_flight.get_group("gismeteo-search").do(
+            key,
+            lambda: get_gismeteo_client()
+            .search.by_coordinates(
+                latitude=latitude,
+                longitude=longitude,
+                limit=1,
+            )[0]
+            .id,
+        )
+    return gismeteo_city_ids[key]
+
+
+def get_water_temp_and_geomagnetic_field_by_id(
+    city_id: int,
+) -> Tuple[float, int]:
+    current = get_gismeteo_client().current.by_id(city_id)
+    return current.temperature.water.c, current.gm
+
+
+def get_water_temp_and_geomagnetic_field_by_ll(
+    latitude: float,
+    longitude: float,
+) -> Tuple[float, int]:
+    """
+    Get water temperature & geomagnetic field from https://www.gismeteo.com/api/ by latitude & longitude
+    Both values are taken from one current weather response, which is served from cache while it is fresh
+    :param latitude:
+    :param longitude:
+    :return: None & None if there is no Gismeteo token
+    """
+    if get_gismeteo_token() is None:
+        return None, None
     try:
-        return requests.get(OPEN_ELEVATION_API + latitude + "," + longitude).json()["results"][0]["elevation"]
-    except requests.exceptions.RequestException as req_ex:
-        logging.error(f"Request Err while getting elevation from API - {req_ex}")
-        return None
+        city_id = get_gismeteo_city_id_by_ll(
+            latitude=latitude,
+            longitude=longitude,
+        )
+        return response_cache.get_cache("gismeteo").get_or_fetch(
+            city_id,
+            lambda: single_flight.get_group("gismeteo").do(
+                city_id,
+                lambda: get_water_temp_and_geomagnetic_field_by_id(city_id),
+            ),
+        )
     except BaseException as base_err:
-        logging.error(f"Base Err while getting elevation from API - {base_err}")
-        return None
+        logging.error(f"Base Err while getting water temp & geomagnetic field from API - {base_err}")
+        return None, None
 
 
 def get_water_temp_by_ll(
@@ -96,17 +329,7 @@ def get_water_temp_by_ll(
     :param longitude:
     :return:
     """
-    try:
-        gm = Gismeteo()
-        city_id = gm.search.by_coordinates(
-            latitude=latitude,
-            longitude=longitude,
-            limit=1,
-        )[0].id
-        return gm.current.by_id(city_id).temperature.water.c
-    except BaseException as base_err:
-        logging.error(f"Base Err while getting water temp from API - {base_err}")
-        return None
+    return get_water_temp_and_geomagnetic_field_by_ll(latitude, longitude)[0]
 
 
 def get_geomagnetic_field_by_ll(
@@ -114,60 +337,168 @@ def get_geomagnetic_field_by_ll(
     longitude: float,
 ) -> int:
     """
-    Get water temperature from https://www.gismeteo.com/api/ by latitude & longitude
+    Get geomagnetic field from https://www.gismeteo.com/api/ by latitude & longitude
     :param latitude:
     :param longitude:
     :return:
     """
+    return get_water_temp_and_geomagnetic_field_by_ll(latitude, longitude)[1]
+
+
+class CityEntry(NamedTuple):
+    """
+    City from cities file, country & coordinates are optional columns
+    """
+
+    name: str
+    country: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+
+    @property
+    def key(self) -> str:
+        """
+        Cities with the same name are told apart by country & coordinates, like Paris,FR & Paris,US
+        :return:
+        """
+        columns = [self.name]
+        if self.country:
+            columns.append(self.country)
+        if self.latitude is not None:
+            columns.extend([str(self.latitude), str(self.longitude)])
+        return geo_cache.normalize_city_name(", ".join(columns))
+
+
+def _to_coordinate(
+    value: str,
+) -> Optional[float]:
     try:
-        gm = Gismeteo()
-        city_id = gm.search.by_coordinates(
-            latitude=latitude,
-            longitude=longitude,
-            limit=1,
-        )[0].id
-        return gm.current.by_id(city_id).gm
-    except BaseException as base_err:
-        logging.error(f"Base Err while getting geomagnetic field from API - {base_err}")
+        return float(value)
+    except ValueError:
+        return None
+
+
+def parse_city_line(
+    line: str,
+) -> Optional[CityEntry]:
+    """
+    Parse one line of cities file: city, city,country, city,lat,lon or city,country,lat,lon
+    Empty lines & lines starting with # are skipped
+    :param line:
+    :return:
+    """
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    columns = [" ".join(column.split()) for column in line.split(",")]
+    name = columns[0]
+    if not name:
+        return None
+
+    country, latitude, longitude = None, None, None
+    if len(columns) >= 3:
+        latitude, longitude = _to_coordinate(columns[-2]), _to_coordinate(columns[-1])
+        if latitude is None or longitude is None or not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            logging.error(f"Wrong coordinates of {name} - {line}")
+            return None
+        if len(columns) == 4:
+            country = columns[1] or None
+    elif len(columns) == 2:
+        country = columns[1] or None
+    if len(columns) > 4:
+        logging.error(f"Too many columns - {line}")
         return None
+    return CityEntry(name, country, latitude, longitude)
 
 
-def load_cities_from_file() -> List[str]:
+def read_cities(
+    path: str = CITIES_FILE,
+) -> Iterator[CityEntry]:
+    """
+    Read cities file line by line, every city is yielded once, the first line wins
+    Cities with the same name & different country or coordinates are different cities
+    :param path:
+    :return:
+    """
+    seen = set()
+    with open(path, "r", encoding="utf-8") as cities_file:
+        for line in cities_file:
+            entry = parse_city_line(line)
+            if entry is None:
+                continue
+            if entry.key in seen:
+                logging.warning(f"City {entry.key} is listed more than once in {path}")
+                continue
+            seen.add(entry.key)
+            yield entry
+
+
+def load_cities_from_file(
+    path: str = CITIES_FILE,
+) -> Iterator[CityEntry]:
     """
     Load cities from file
-    Try to load from file, if exception caught, send message about err
-    Finally create new file with current city and return it
+    If there is no file, create new file with current city
+    Empty file is reported, but never deleted
+    :param path:
     :return:
     """
     logging.info("Going to load cities from file...")
-    try:
-        if os.stat(CITIES_FILE).st_size == 0:
-            logging.error(f"File - {CITIES_FILE} - is empty")
-            logging.warning(f"Going to delete {CITIES_FILE}")
-            os.remove(CITIES_FILE)
-            logging.info(f"File {CITIES_FILE} deleted")
-        else:
-            with open(CITIES_FILE, "r", encoding="utf-8") as cities_file:
-                cities = cities_file.read().split()
-                return cities
-    except FileNotFoundError as file_not_found_err:
-        logging.error(file_not_found_err)
-        logging.info(f"Will create {CITIES_FILE}...")
-    finally:
-        if os.path.exists(CITIES_FILE):
-            pass
-        else:
-            with open(
-                CITIES_FILE,
-                "w",
-            ) as cities_file:
-                cities_file.write(get_current_city())
-            with open(
-                CITIES_FILE,
-                "r",
-            ) as cities_file:
-                cities = cities_file.read().split()
-                return cities
+    if not os.path.exists(path):
+        logging.error(f"File - {path} - not found")
+        logging.info(f"Will create {path}...")
+        current_city = get_current_city()
+        if current_city is None:
+            return
+        with open(path, "w", encoding="utf-8") as cities_file:
+            cities_file.write(current_city + "\n")
+
+    empty = True
+    for entry in read_cities(path):
+        empty = False
+        yield entry
+    if empty:
+        logging.error(f"File - {path} - has no cities")
+
+
+class CitiesWatcher:
+    """
+    Reload cities file when it is changed, so long-running process picks up edits without restart
+    """
+
+    def __init__(
+        self,
+        path: str = CITIES_FILE,
+    ):
+        self.path = path
+        self._mtime = None
+        self._entries: Dict[str, CityEntry] = {}
+
+    def poll(self) -> Tuple[List[CityEntry], List[CityEntry]]:
+        """
+        Read file again if its modification time is changed
+        :return: Cities which were added & removed since the previous poll, changed country is removal & addition
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return [], []
+        if mtime == self._mtime:
+            return [], []
+        first_poll = self._mtime is None
+        self._mtime = mtime
+
+        try:
+            entries = {entry.key: entry for entry in read_cities(self.path)}
+        except OSError as os_err:
+            logging.error(f"OS Err while reading {self.path} - {os_err}")
+            return [], []
+        added = [entry for key, entry in entries.items() if self._entries.get(key) != entry]
+        removed = [entry for key, entry in self._entries.items() if entries.get(key) != entry]
+        self._entries = entries
+        if not first_poll and (added or removed):
+            logging.info(f"Cities file {self.path} changed: {len(added)} added, {len(removed)} removed")
+        return added, removed
 
 
 if __name__ == "__main__":
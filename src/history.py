@@ -0,0 +1,169 @@
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import geo_cache
+import structured_output
+
+# History file, lives next to cities.txt
+HISTORY_FILE = "weather_history.db"
+
+# Observations are inserted by that many rows in one transaction
+INSERT_BATCH_SIZE = 100
+
+# Bucket size in seconds for downsampling
+BUCKETS = {
+    "hour": 3600,
+    "day": 86400,
+}
+
+# Numeric columns which can be downsampled
+METRICS = [name for name, column_type in structured_output.COLUMNS if column_type in (int, float)]
+
+# Text columns stored next to metrics, observed_at is stored as UNIX time
+TEXT_COLUMNS = [
+    name
+    for name, column_type in structured_output.COLUMNS
+    if column_type is str and name not in ("observed_at", "city_name")
+]
+
+# Logging
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    level=logging.INFO,
+)
+
+
+class HistoryStore:
+    """
+    Append-only store of every observation per city in SQLite with WAL
+    City is stored by its key, so cities with the same name & different country are separate series
+    """
+
+    def __init__(
+        self,
+        path: str = HISTORY_FILE,
+        batch_size: int = INSERT_BATCH_SIZE,
+    ):
+        self.batch_size = batch_size
+        self._pending: List[tuple] = []
+        self._lock = threading.Lock()
+        self._columns = ["city", "observed_at"] + TEXT_COLUMNS + METRICS
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        # Readers do not block appending while telegram loop runs
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        column_types = ["TEXT NOT NULL", "REAL NOT NULL"] + ["TEXT"] * len(TEXT_COLUMNS) + ["REAL"] * len(METRICS)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS observations ("
+            + ", ".join(f"{name} {column_type}" for name, column_type in zip(self._columns, column_types))
+            + ")"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS observations_city_time ON observations (city, observed_at)")
+        self._connection.commit()
+
+    def add(
+        self,
+        row: Dict[str, any],
+        city_key: Optional[str] = None,
+    ):
+        """
+        Buffer observation, rows are inserted in batches
+        :param row: Row built by structured_output.record_to_row
+        :param city_key: Key of city from cities file, city name of row if not passed
+        :return:
+        """
+        observed_at = datetime.fromisoformat(row["observed_at"]).timestamp()
+        values = (
+            (geo_cache.normalize_city_name(city_key or row["city_name"]), observed_at)
+            + tuple(row[name] for name in TEXT_COLUMNS)
+            + tuple(row[name] for name in METRICS)
+        )
+        with self._lock:
+            self._pending.append(values)
+            if len(self._pending) >= self.batch_size:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        with self._connection:
+            self._connection.executemany(
+                f"INSERT INTO observations ({', '.join(self._columns)}) VALUES ({', '.join('?' * len(self._columns))})",
+                self._pending,
+            )
+        self._pending.clear()
+
+    def query(
+        self,
+        city_key: str,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+    ) -> List[Dict[str, any]]:
+        """
+        Return observations about city in time range
+        :param city_key: Key of city from cities file, like paris, fr
+        :param since: UNIX time, from the beginning if not passed
+        :param until: UNIX time, till now if not passed
+        :return:
+        """
+        self.flush()
+        with self._lock:
+            cursor = self._connection.execute(
+                f"SELECT {', '.join(self._columns)} FROM observations "
+                "WHERE city = ? AND observed_at >= ? AND observed_at <= ? ORDER BY observed_at",
+                (
+                    geo_cache.normalize_city_name(city_key),
+                    since if since is not None else 0,
+                    until if until is not None else float("inf"),
+                ),
+            )
+            return [dict(zip(self._columns, values)) for values in cursor.fetchall()]
+
+    def downsample(
+        self,
+        city_key: str,
+        metric: str,
+        bucket: str = "hour",
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+    ) -> List[Dict[str, any]]:
+        """
+        Aggregate metric about city by hour or day
+        :param city_key: Key of city from cities file, like paris, fr
+        :param metric: One of METRICS, like temp
+        :param bucket: One of BUCKETS
+        :param since: UNIX time, from the beginning if not passed
+        :param until: UNIX time, till now if not passed
+        :return: Bucket start, min, max, mean & count of observations
+        """
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric - {metric}")
+        seconds = BUCKETS[bucket]
+        self.flush()
+        with self._lock:
+            cursor = self._connection.execute(
+                f"SELECT CAST(observed_at / {seconds} AS INTEGER) * {seconds} AS bucket, "
+                f"MIN({metric}), MAX({metric}), AVG({metric}), COUNT({metric}) FROM observations "
+                "WHERE city = ? AND observed_at >= ? AND observed_at <= ? GROUP BY bucket ORDER BY bucket",
+                (
+                    geo_cache.normalize_city_name(city_key),
+                    since if since is not None else 0,
+                    until if until is not None else float("inf"),
+                ),
+            )
+            return [
+                {"bucket": bucket_start, "min": minimum, "max": maximum, "mean": mean, "count": count}
+                for bucket_start, minimum, maximum, mean, count in cursor.fetchall()
+            ]
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._connection.close()
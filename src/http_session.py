@@ -0,0 +1,281 @@
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+import rate_limit
+
+# Timeouts for every request, seconds
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 15
+
+# Retry on rate limit & server errors with jittered exponential backoff
+RETRIES = 3
+BACKOFF = 0.5
+MAX_BACKOFF = 30
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+IDEMPOTENT_METHODS = ["GET", "HEAD", "OPTIONS"]
+# Hosts which callers retry by themselves, telegram_queue waits as long as telegram asks in retry_after
+HOST_RETRIES = {"api.telegram.org": 0}
+
+# Connections kept alive per provider host
+POOL_SIZE = 16
+
+# Logging
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    level=logging.INFO,
+)
+
+settings = {
+    "connect_timeout": CONNECT_TIMEOUT,
+    "read_timeout": READ_TIMEOUT,
+    "retries": RETRIES,
+    "backoff": BACKOFF,
+}
+
+sessions: Dict[str, requests.Session] = {}
+sessions_lock = threading.Lock()
+
+counters: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+counters_lock = threading.Lock()
+
+
+def configure(
+    connect_timeout: Optional[float] = None,
+    read_timeout: Optional[float] = None,
+    retries: Optional[int] = None,
+    backoff: Optional[float] = None,
+):
+    """
+    Change settings for sessions, values which are not passed stay the same
+    :param connect_timeout:
+    :param read_timeout:
+    :param retries:
+    :param backoff: Base of exponential backoff, seconds
+    :return:
+    """
+    for name, value in (
+        ("connect_timeout", connect_timeout),
+        ("read_timeout", read_timeout),
+        ("retries", retries),
+        ("backoff", backoff),
+    ):
+        if value is not None:
+            settings[name] = value
+
+
+def count(
+    host: str,
+    counter: str,
+    value: int = 1,
+):
+    with counters_lock:
+        counters[host][counter] += value
+
+
+def backoff_delay(
+    attempt: int,
+    retry_after: Optional[str] = None,
+) -> float:
+    """
+    Delay before next attempt, Retry-After header wins if server sent it
+    :param attempt: Number of failed attempt starting from 0
+    :param retry_after: Value of Retry-After header
+    :return:
+    """
+    if retry_after is not None:
+        try:
+            return min(float(retry_after), MAX_BACKOFF)
+        except ValueError:
+            pass
+    # Full jitter, so workers which failed together do not retry together
+    return random.uniform(0, min(MAX_BACKOFF, settings["backoff"] * 2**attempt))
+
+
+def retry_delay(
+    host: str,
+    attempt: int,
+    retries: int,
+    idempotent: bool,
+    status_code: Optional[int] = None,
+    retry_after: Optional[str] = None,
+    error: Optional[Exception] = None,
+    reached: bool = True,
+) -> Optional[float]:
+    """
+    Retry policy shared by sessions & async engine, attempt is counted & logged here
+    Rate limit is always retried, server error & failed request only if request may be sent twice
+    :param host:
+    :param attempt: Number of failed attempt starting from 0
+    :param retries: How many times request may be sent again
+    :param idempotent: Whether request may be sent twice
+    :param status_code: Status of response, None if there is no response
+    :param retry_after: Retry-After header of response
+    :param error: Exception raised instead of response
+    :param reached: Whether failed request may have reached the server, like after read timeout
+    :return: Seconds to wait before the next attempt, None if request is not sent again
+    """
+    if status_code is None:
+        retriable = idempotent or not reached
+    else:
+        retriable = status_code in RETRY_STATUSES and (status_code == 429 or idempotent)
+    if not retriable or attempt >= retries:
+        if status_code is None or status_code >= 400:
+            count(host, "failures")
+        return None
+
+    delay = backoff_delay(attempt, retry_after)
+    if status_code is None:
+        logging.warning(f"Err while requesting {host} - {error}, retry in {round(delay, 2)} seconds")
+    else:
+        logging.warning(f"{host} answered {status_code}, retry in {round(delay, 2)} seconds")
+    count(host, "retries")
+    return delay
+
+
+class ProviderAdapter(HTTPAdapter):
+    """
+    Keep-alive connection pool for one provider host with default timeouts and retries
+    """
+
+    def __init__(
+        self,
+        host: str,
+        retries: Optional[int] = None,
+    ):
+        """
+        :param host:
+        :param retries: How many times request is sent again, configured value is used if not passed
+        """
+        self.host = host
+        self.retries = retries
+        super().__init__(
+            pool_connections=1,
+            pool_maxsize=POOL_SIZE,
+        )
+
+    def send(
+        self,
+        request: requests.PreparedRequest,
+        timeout=None,
+        **kwargs,
+    ) -> requests.Response:
+        if timeout is None:
+            timeout = (settings["connect_timeout"], settings["read_timeout"])
+        idempotent = request.method in IDEMPOTENT_METHODS
+        retries = self.retries if self.retries is not None else settings["retries"]
+
+        attempt = 0
+        while True:
+            # Retry is a request as well, so it takes token too
+            rate_limit.acquire(self.host)
+            count(self.host, "requests")
+            try:
+                with metrics.timer("http", rate_limit.PROVIDER_HOSTS.get(self.host, self.host)) as labels:
+                    response = super().send(request, timeout=timeout, **kwargs)
+                    labels["status"] = response.status_code
+            except (requests.exceptions.ConnectionError, requests.exceptions.ReadTimeout) as conn_err:
+                delay = retry_delay(
+                    self.host,
+                    attempt,
+                    retries,
+                    idempotent,
+                    error=conn_err,
+                    reached=not isinstance(conn_err, requests.exceptions.ConnectTimeout),
+                )
+                if delay is None:
+                    raise
+            else:
+                delay = retry_delay(
+                    self.host,
+                    attempt,
+                    retries,
+                    idempotent,
+                    status_code=response.status_code,
+                    retry_after=response.headers.get("Retry-After"),
+                )
+                if delay is None:
+                    return response
+                response.close()
+            attempt += 1
+            time.sleep(delay)
+
+    def connection_stats(self) -> Dict[str, int]:
+        """
+        How many connections were opened and how many requests were sent through them
+        :return:
+        """
+        connections = 0
+        pool_requests = 0
+        for key in self.poolmanager.pools.keys():
+            pool = self.poolmanager.pools.get(key)
+            if pool is not None:
+                connections += pool.num_connections
+                pool_requests += pool.num_requests
+        return {
+            "connections": connections,
+            "reused": max(0, pool_requests - connections),
+        }
+
+
+def get_session(
+    host: str,
+) -> requests.Session:
+    """
+    Return session shared by everyone who calls passed provider host
+    :param host:
+    :return:
+    """
+    with sessions_lock:
+        if host not in sessions:
+            session = requests.Session()
+            adapter = ProviderAdapter(host, HOST_RETRIES.get(host))
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            sessions[host] = session
+        return sessions[host]
+
+
+def get(
+    url: str,
+    **kwargs,
+) -> requests.Response:
+    return get_session(urlparse(url).hostname).get(url, **kwargs)
+
+
+def post(
+    url: str,
+    **kwargs,
+) -> requests.Response:
+    return get_session(urlparse(url).hostname).post(url, **kwargs)
+
+
+def get_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Counters per provider host: requests, retries, failures, opened & reused connections
+    :return:
+    """
+    with counters_lock:
+        stats = {host: dict(host_counters) for host, host_counters in counters.items()}
+    with sessions_lock:
+        for host, session in sessions.items():
+            stats.setdefault(host, {}).update(session.get_adapter("https://").connection_stats())
+    return stats
+
+
+def log_stats():
+    for host, host_stats in get_stats().items():
+        sent = host_stats.get("requests", 0)
+        retry_rate = host_stats.get("retries", 0) / sent if sent else 0
+        logging.info(
+            f"HTTP {host}: requests {sent}, retry rate {round(retry_rate * 100, 1)}%, "
+            f"connections {host_stats.get('connections', 0)}, reused {host_stats.get('reused', 0)}"
+        )
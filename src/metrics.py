@@ -0,0 +1,218 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Upper bounds of histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Name of every histogram in Prometheus text format
+METRIC_NAME = "weather_observer_stage_seconds"
+
+# Long-running process logs stage timings that often, in seconds
+LOG_INTERVAL = 300
+
+# Logging
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    level=logging.INFO,
+)
+
+
+class Histogram:
+    """
+    Durations of one stage with the same labels, counted into fixed buckets like Prometheus does
+    """
+
+    def __init__(self):
+        # The last one is +Inf
+        self.counts: List[int] = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(
+        self,
+        seconds: float,
+    ):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+    def quantile(
+        self,
+        share: float,
+    ) -> float:
+        """
+        Upper bound of bucket where the quantile falls
+        :param share: Like 0.99
+        :return: Seconds, inf if it is above the last bucket
+        """
+        rank = share * self.count
+        seen = 0
+        for bound, bucket_count in zip(BUCKETS + (float("inf"),), self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+# Histogram by stage, provider & status
+histograms: Dict[Tuple[str, str, str], Histogram] = {}
+histograms_lock = threading.Lock()
+
+last_logged = time.monotonic()
+
+
+def observe(
+    stage: str,
+    seconds: float,
+    provider: str = "",
+    status: str = "ok",
+):
+    """
+    Record how long stage took
+    :param stage: Like http, geocode, timezone, render or deliver
+    :param seconds:
+    :param provider: Provider or sink name
+    :param status: HTTP status code, ok or error
+    :return:
+    """
+    key = (stage, provider, str(status))
+    with histograms_lock:
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = Histogram()
+        histogram.observe(seconds)
+
+
+@contextmanager
+def timer(
+    stage: str,
+    provider: str = "",
+) -> Iterator[Dict[str, str]]:
+    """
+    Time block of code, status is error if it raises, otherwise ok or what is set into yielded labels
+    :param stage:
+    :param provider:
+    :return: Labels which may be changed inside the block
+    """
+    labels = {"status": "ok"}
+    started = time.perf_counter()
+    try:
+        yield labels
+    except BaseException:
+        labels["status"] = "error"
+        raise
+    finally:
+        observe(stage, time.perf_counter() - started, provider, labels["status"])
+
+
+def _escape(
+    value: str,
+) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_prometheus() -> str:
+    """
+    Every histogram in Prometheus text exposition format
+    :return:
+    """
+    with histograms_lock:
+        snapshot = [(key, list(histogram.counts), histogram.total, histogram.count) for key, histogram in histograms.items()]
+    lines = [
+        f"# HELP {METRIC_NAME} Time spent in every stage of city report",
+        f"# TYPE {METRIC_NAME} histogram",
+    ]
+    for (stage, provider, status), counts, total, count in sorted(snapshot):
+        labels = f'stage="{_escape(stage)}",provider="{_escape(provider)}",status="{_escape(status)}"'
+        cumulative = 0
+        for bound, bucket_count in zip(BUCKETS + (float("inf"),), counts):
+            cumulative += bucket_count
+            le = "+Inf" if bound == float("inf") else repr(float(bound))
+            lines.append(f'{METRIC_NAME}_bucket{{{labels},le="{le}"}} {cumulative}')
+        lines.append(f"{METRIC_NAME}_sum{{{labels}}} {total}")
+        lines.append(f"{METRIC_NAME}_count{{{labels}}} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def get_stats() -> Dict[Tuple[str, str, str], Dict[str, float]]:
+    """
+    Count, mean & p50/p99 bucket bounds by stage, provider & status
+    :return:
+    """
+    with histograms_lock:
+        return {
+            key: {
+                "count": histogram.count,
+                "mean": histogram.total / histogram.count,
+                "p50": histogram.quantile(0.5),
+                "p99": histogram.quantile(0.99),
+            }
+            for key, histogram in histograms.items()
+        }
+
+
+def log_stats():
+    global last_logged
+    last_logged = time.monotonic()
+    for (stage, provider, status), stats in sorted(get_stats().items()):
+        logging.info(
+            f"Stage {stage} {provider} {status}: count {stats['count']}, mean {round(stats['mean'] * 1000, 2)} ms, "
+            f"p50 <= {stats['p50'] * 1000} ms, p99 <= {stats['p99'] * 1000} ms"
+        )
+
+
+def log_stats_periodically(
+    interval: float = LOG_INTERVAL,
+):
+    """
+    Log stage timings if interval is passed since they were logged last time
+    :param interval:
+    :return:
+    """
+    if time.monotonic() - last_logged >= interval:
+        log_stats()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        data = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(
+        self,
+        format: str,
+        *args,
+    ):
+        logging.debug(f"{self.address_string()} - {format % args}")
+
+
+metrics_server: Optional[ThreadingHTTPServer] = None
+
+
+def start_server(
+    host: str,
+    port: int,
+):
+    """
+    Serve /metrics for Prometheus from background thread
+    :param host:
+    :param port:
+    :return:
+    """
+    global metrics_server
+    metrics_server = ThreadingHTTPServer((host, port), _Handler)
+    metrics_server.daemon_threads = True
+    threading.Thread(target=metrics_server.serve_forever, name="metrics", daemon=True).start()
+    logging.info(f"Serving metrics on http://{host}:{metrics_server.server_address[1]}/metrics")
@@ -0,0 +1,112 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+# How many cities are handled at the same time
+CITY_WORKERS = 8
+
+# How many calls to every provider may be in flight at the same time
+PROVIDER_CONCURRENCY = {
+    "nominatim": 1,
+    "weatherbit": 4,
+    "open-elevation": 4,
+    "gismeteo": 4,
+}
+
+# Logging
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    level=logging.INFO,
+)
+
+
+class FetchPipeline:
+    """
+    Fetch everything needed for city report
+    Independent provider calls for one city run concurrently and many cities are handled in parallel
+    Every provider has its own concurrency limit, so per-API rate limits are respected
+    """
+
+    def __init__(
+        self,
+        locate: Tuple[str, Callable],
+        fetchers: Dict[str, Tuple[str, Callable]],
+        workers: int = CITY_WORKERS,
+    ):
+        """
+        :param locate: Provider name & function which returns location info by city key
+        City name is taken from location info if it is there, otherwise city key is city name
+        :param fetchers: Provider name & function by city key and location info, which returns dict to merge into record
+        :param workers: How many cities are handled at the same time
+        """
+        self._locate = locate
+        self._fetchers = fetchers
+        self._semaphores = {provider: threading.BoundedSemaphore(limit) for provider, limit in PROVIDER_CONCURRENCY.items()}
+        self._city_pool = ThreadPoolExecutor(
+            max_workers=workers,
+            thread_name_prefix="city",
+        )
+        self._provider_pool = ThreadPoolExecutor(
+            max_workers=sum(PROVIDER_CONCURRENCY.values()),
+            thread_name_prefix="provider",
+        )
+
+    def _call(
+        self,
+        provider: str,
+        func: Callable,
+        *args,
+    ):
+        with self._semaphores[provider]:
+            return func(*args)
+
+    def fetch_city(
+        self,
+        city_name: str,
+        prepared_t_l_i: Optional[Dict[str, any]] = None,
+    ) -> Optional[Dict[str, any]]:
+        """
+        Assemble one record about city, location is resolved first if not passed
+        :param city_name:
+        :param prepared_t_l_i:
+        :return:
+        """
+        if prepared_t_l_i is None:
+            provider, locate = self._locate
+            prepared_t_l_i = self._call(provider, locate, city_name)
+            if prepared_t_l_i is None:
+                logging.error(f"Skip {city_name}, location info is not available")
+                return None
+
+        futures = [
+            self._provider_pool.submit(self._call, provider, fetcher, city_name, prepared_t_l_i)
+            for provider, fetcher in self._fetchers.values()
+        ]
+        record = {"city_name": city_name, **prepared_t_l_i}
+        for future in futures:
+            record.update(future.result())
+        return record
+
+    def fetch_cities(
+        self,
+        cities: Iterable[Tuple[str, Optional[Dict[str, any]]]],
+    ) -> Iterator[Dict[str, any]]:
+        """
+        Fetch records about many cities in parallel, yield them as soon as they are ready
+        :param cities: City key & location info, which may be None
+        :return:
+        """
+        futures = [self._city_pool.submit(self.fetch_city, city_name, prepared) for city_name, prepared in cities]
+        for future in as_completed(futures):
+            try:
+                record = future.result()
+            except BaseException as base_err:
+                logging.error(f"Base Err while fetching city info - {base_err}")
+                continue
+            if record is not None:
+                yield record
+
+    def shutdown(self):
+        self._city_pool.shutdown()
+        self._provider_pool.shutdown()
@@ -0,0 +1,279 @@
+import cProfile
+import linecache
+import logging
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+MODES = ["cprofile", "sampling"]
+
+# Summary shows functions of these modules
+SUMMARY_MODULES = ("get_info", "calculations")
+SUMMARY_TOP = 15
+
+# Seconds between stack samples
+SAMPLE_INTERVAL = 0.005
+
+# Built-in functions which block waiting for network, other threads or sleep, as cProfile names them
+WAIT_BUILTINS = re.compile(r"_socket|_ssl\.|'select\.|time\.sleep|_thread\.(lock|RLock)")
+# Python frames on top of waiting thread stack
+WAIT_MODULES = {"socket", "ssl", "selectors", "threading", "queue"}
+
+# Logging
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    level=logging.INFO,
+)
+
+
+def module_name(
+    filename: str,
+) -> str:
+    return os.path.splitext(os.path.basename(filename))[0]
+
+
+def function_name(
+    filename: str,
+    line: int,
+    name: str,
+) -> str:
+    """
+    Name like get_info.get_elevation_by_ll, lambdas & comprehensions get line number
+    :param filename:
+    :param line: First line of function
+    :param name:
+    :return:
+    """
+    if name.startswith("<"):
+        return f"{module_name(filename)}.{name}:{line}"
+    return f"{module_name(filename)}.{name}"
+
+
+class _Snapshot:
+    """
+    Stats of profile which may still be enabled in another thread, pstats reads them without disabling it
+    """
+
+    def __init__(
+        self,
+        profile: cProfile.Profile,
+    ):
+        profile.snapshot_stats()
+        self.stats = profile.stats
+
+    def create_stats(self):
+        pass
+
+
+class ThreadProfiler:
+    """
+    cProfile in main thread and in every thread started meanwhile, worker threads do most of the work
+    """
+
+    def __init__(self):
+        self._main = cProfile.Profile()
+        self._profiles: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    def _profile_thread(
+        self,
+        frame,
+        event: str,
+        arg,
+    ):
+        sys.setprofile(None)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError as value_err:
+            # Since Python 3.12 only one profile may be enabled at once
+            logging.debug(f"Err while profiling thread - {value_err}")
+            return
+        with self._lock:
+            self._profiles.append(profile)
+
+    def start(self):
+        threading.setprofile(self._profile_thread)
+        self._main.enable()
+
+    def stop(self) -> pstats.Stats:
+        self._main.disable()
+        threading.setprofile(None)
+        stats = pstats.Stats(self._main)
+        with self._lock:
+            for profile in self._profiles:
+                stats.add(_Snapshot(profile))
+        return stats
+
+    def write(
+        self,
+        stats: pstats.Stats,
+        path: str,
+    ):
+        stats.dump_stats(path)
+
+    @staticmethod
+    def summary(
+        stats: pstats.Stats,
+        modules: Tuple[str, ...] = SUMMARY_MODULES,
+    ) -> List[Tuple[str, int, float, float]]:
+        """
+        Cumulative time of functions from passed modules split into waiting & CPU
+        Time of blocking built-ins is spread to callers by their share of callee time, like gprof does
+        :param stats:
+        :param modules:
+        :return: Function, calls, cumulative & wait seconds
+        """
+        callees: Dict[tuple, Dict[tuple, float]] = defaultdict(dict)
+        for func, (_, _, _, _, callers) in stats.stats.items():
+            for caller, (_, _, _, edge_cumulative) in callers.items():
+                callees[caller][func] = edge_cumulative
+
+        wait_times: Dict[tuple, float] = {}
+
+        def wait_time(func: tuple) -> float:
+            if func in wait_times:
+                return wait_times[func]
+            # Recursion guard
+            wait_times[func] = 0.0
+            _, _, own, cumulative, _ = stats.stats[func]
+            total = own if func[0] == "~" and WAIT_BUILTINS.search(func[2]) else 0.0
+            for callee, edge_cumulative in callees[func].items():
+                callee_cumulative = stats.stats[callee][3]
+                if callee_cumulative:
+                    total += wait_time(callee) * edge_cumulative / callee_cumulative
+            wait_times[func] = min(total, cumulative)
+            return wait_times[func]
+
+        rows = []
+        for func, (_, calls, _, cumulative, _) in stats.stats.items():
+            if module_name(func[0]) in modules:
+                rows.append((function_name(*func), calls, cumulative, wait_time(func)))
+        return rows
+
+
+class StackSampler:
+    """
+    Sample stacks of every thread from background thread, overhead does not depend on how many calls are made
+    Stacks are written in collapsed format, which flamegraph.pl & speedscope read
+    """
+
+    def __init__(
+        self,
+        interval: float = SAMPLE_INTERVAL,
+    ):
+        """
+        :param interval: Seconds between samples
+        """
+        self.interval = interval
+        self.samples: Dict[str, int] = defaultdict(int)
+        self.wait_samples: Dict[str, int] = defaultdict(int)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampler", daemon=True)
+
+    @staticmethod
+    def _is_waiting(
+        frame,
+    ) -> bool:
+        if module_name(frame.f_code.co_filename) in WAIT_MODULES:
+            return True
+        return "sleep(" in linecache.getline(frame.f_code.co_filename, frame.f_lineno)
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                waiting = self._is_waiting(frame)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(function_name(code.co_filename, code.co_firstlineno, code.co_name))
+                    frame = frame.f_back
+                key = ";".join(reversed(stack))
+                self.samples[key] += 1
+                if waiting:
+                    self.wait_samples[key] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> "StackSampler":
+        self._stop.set()
+        self._thread.join()
+        return self
+
+    def write(
+        self,
+        stats: "StackSampler",
+        path: str,
+    ):
+        with open(path, "w", encoding="utf-8") as collapsed:
+            for stack, count in sorted(stats.samples.items()):
+                collapsed.write(f"{stack} {count}\n")
+
+    @staticmethod
+    def summary(
+        stats: "StackSampler",
+        modules: Tuple[str, ...] = SUMMARY_MODULES,
+    ) -> List[Tuple[str, Optional[int], float, float]]:
+        """
+        Time of functions from passed modules, sample counts as waiting if thread is blocked in it
+        :param stats:
+        :param modules:
+        :return: Function, calls which are not known, cumulative & wait seconds
+        """
+        cumulative: Dict[str, int] = defaultdict(int)
+        waiting: Dict[str, int] = defaultdict(int)
+        for stack, count in stats.samples.items():
+            wait_count = stats.wait_samples.get(stack, 0)
+            for func in set(stack.split(";")):
+                if func.split(".")[0] in modules:
+                    cumulative[func] += count
+                    waiting[func] += wait_count
+        return [(func, None, count * stats.interval, waiting[func] * stats.interval) for func, count in cumulative.items()]
+
+
+def run(
+    func: Callable,
+    mode: str,
+    path_prefix: str,
+    top: int = SUMMARY_TOP,
+):
+    """
+    Call function under profiler, write profile next to report and print summary at exit
+    :param func: Function without arguments
+    :param mode: cprofile or sampling
+    :param path_prefix: Report path without extension
+    :param top: How many functions are printed
+    :return:
+    """
+    profiler = ThreadProfiler() if mode == "cprofile" else StackSampler()
+    path = f"{path_prefix}{'.prof' if mode == 'cprofile' else '.collapsed'}"
+    wall_started = time.perf_counter()
+    cpu_started = time.process_time()
+    profiler.start()
+    try:
+        func()
+    finally:
+        stats = profiler.stop()
+        wall = time.perf_counter() - wall_started
+        cpu = time.process_time() - cpu_started
+        profiler.write(stats, path)
+        rows = sorted(profiler.summary(stats), key=lambda row: row[2], reverse=True)[:top]
+
+        print(f"\nProfile is written to {path}")
+        print(f"Run took {round(wall, 2)} s, CPU of every thread {round(cpu, 2)} s")
+        print(f"Top functions of {', '.join(SUMMARY_MODULES)} by cumulative time, summed over threads:")
+        print(f"  {'cumulative s':>12} {'wait s':>8} {'CPU s':>8} {'calls':>8}  function")
+        for name, calls, cumulative, wait in rows:
+            print(
+                f"  {cumulative:>12.3f} {wait:>8.3f} {cumulative - wait:>8.3f} "
+                f"{calls if calls is not None else '-':>8}  {name}"
+            )
@@ -0,0 +1,376 @@
+import logging
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+import requests
+
+# Requests per second, burst & daily budget per provider, None means no budget
+# Budget depends on plan, so it is set from CLI only
+LIMITS = {
+    "ipinfo": (1, 5, None),
+    "nominatim": (1, 1, None),
+    "open-elevation": (5, 10, None),
+    "gismeteo": (5, 10, None),
+    "weatherbit": (5, 10, None),
+    "telegram": (1, 20, None),
+}
+
+PROVIDER_HOSTS = {
+    "ipinfo.io": "ipinfo",
+    "nominatim.openstreetmap.org": "nominatim",
+    "api.open-elevation.com": "open-elevation",
+    "api.gismeteo.net": "gismeteo",
+    "api.weatherbit.io": "weatherbit",
+    "api.telegram.org": "telegram",
+}
+
+# Requests sent within daily budget, lives next to cities.txt, so restarts & one-shot runs keep counting
+BUDGET_FILE = "daily_budget.db"
+
+# Budget is taken from budget file by that many requests, so disk is not touched on every request
+# Requests which are taken & not sent till exit are counted as used
+BUDGET_BLOCK = 50
+
+# Budget is low when less than that share of it is left, cached data is served instead of refreshing it
+LOW_BUDGET_SHARE = 0.1
+
+# Logging
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    level=logging.INFO,
+)
+
+
+class BudgetExhausted(requests.exceptions.RequestException):
+    """
+    Daily budget of provider is used up, request is not sent
+    """
+
+
+class BudgetStore:
+    """
+    On-disk count of requests sent to every provider per UTC day
+    Processes which run in the same directory count together
+    """
+
+    def __init__(
+        self,
+        path: str = BUDGET_FILE,
+    ):
+        """
+        :param path: SQLite database file
+        """
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        # Processes of sharded run take budget at the same time
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS budget_usage (
+                provider TEXT NOT NULL,
+                day TEXT NOT NULL,
+                used INTEGER NOT NULL,
+                PRIMARY KEY (provider, day)
+            )
+            """)
+        self._connection.commit()
+
+    def used(
+        self,
+        provider: str,
+        day: str,
+    ) -> int:
+        """
+        How many requests were sent to provider during the day
+        :param provider:
+        :param day: UTC date like 2024-01-31
+        :return:
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT used FROM budget_usage WHERE provider = ? AND day = ?",
+                (provider, day),
+            ).fetchone()
+        return row[0] if row is not None else 0
+
+    def reserve(
+        self,
+        provider: str,
+        day: str,
+        daily_budget: int,
+        block: int = BUDGET_BLOCK,
+    ) -> Tuple[int, int]:
+        """
+        Count up to block requests as used if budget of the day allows, other processes wait for the transaction
+        :param provider:
+        :param day: UTC date like 2024-01-31
+        :param daily_budget:
+        :param block:
+        :return: How many requests are reserved & how many are used by everyone after that
+        """
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._connection.execute(
+                    "SELECT used FROM budget_usage WHERE provider = ? AND day = ?",
+                    (provider, day),
+                ).fetchone()
+                used = row[0] if row is not None else 0
+                reserved = max(0, min(block, daily_budget - used))
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO budget_usage VALUES (?, ?, ?)",
+                    (provider, day, used + reserved),
+                )
+                self._connection.commit()
+            except BaseException:
+                self._connection.rollback()
+                raise
+        return reserved, used + reserved
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+budget_store = None
+budget_store_lock = threading.Lock()
+
+
+def get_budget_store() -> BudgetStore:
+    """
+    Open budget file once per process, only providers with daily budget need it
+    :return:
+    """
+    global budget_store
+    with budget_store_lock:
+        if budget_store is None:
+            budget_store = BudgetStore(BUDGET_FILE)
+        return budget_store
+
+
+class TokenBucket:
+    """
+    Token bucket with daily budget for one provider, budget is reset at UTC midnight
+    Budget usage is kept in budget file, so it survives restarts, bucket reserves it by blocks
+    and keeps what is left in memory
+    """
+
+    def __init__(
+        self,
+        provider: str,
+        rate: float,
+        burst: int,
+        daily_budget: Optional[int] = None,
+    ):
+        """
+        :param provider:
+        :param rate: Tokens added per second
+        :param burst: Most tokens which may be taken at once
+        :param daily_budget: Requests per day, no limit if not passed
+        """
+        self.provider = provider
+        self.rate = rate
+        self.burst = burst
+        self.daily_budget = daily_budget
+        self.metrics: Dict[str, float] = defaultdict(int)
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._day = self._today()
+        # Requests reserved in budget file & not sent yet, budget left for everyone including them
+        self._reserved = 0
+        self._remaining: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _today() -> str:
+        return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _check_day(self):
+        today = self._today()
+        if today != self._day:
+            self._day = today
+            self._reserved = 0
+            self._remaining = None
+
+    def _take_budget(self) -> bool:
+        """
+        Take one request from reserved block, next block is reserved when this one is used up
+        :return: Whether budget allows request
+        """
+        self._check_day()
+        if self._reserved == 0:
+            self._reserved, used = get_budget_store().reserve(self.provider, self._day, self.daily_budget)
+            self._remaining = self.daily_budget - used + self._reserved
+        if self._reserved == 0:
+            return False
+        self._reserved -= 1
+        self._remaining -= 1
+        return True
+
+    def remaining_budget(self) -> Optional[int]:
+        if self.daily_budget is None:
+            return None
+        with self._lock:
+            self._check_day()
+            if self._remaining is None:
+                self._remaining = self.daily_budget - get_budget_store().used(self.provider, self._day) + self._reserved
+            return max(0, self._remaining)
+
+    def is_budget_low(self) -> bool:
+        remaining = self.remaining_budget()
+        return remaining is not None and remaining < self.daily_budget * LOW_BUDGET_SHARE
+
+    def try_acquire(self) -> float:
+        """
+        Take token if there is one
+        :return: 0 if token is taken, otherwise seconds until the next token
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                return (1 - self._tokens) / self.rate
+            if self.daily_budget is not None and not self._take_budget():
+                self.metrics["rejected"] += 1
+                raise BudgetExhausted(f"Daily budget of {self.provider} - {self.daily_budget} requests - is used up")
+            self._tokens -= 1
+            self.metrics["acquired"] += 1
+            return 0
+
+    def acquire(self):
+        """
+        Wait until token is available, callers are slowed down instead of getting 429 from provider
+        :return:
+        """
+        while True:
+            delay = self.try_acquire()
+            if delay == 0:
+                return
+            self.metrics["waited"] += delay
+            time.sleep(delay)
+
+    async def acquire_async(self):
+        import asyncio
+
+        while True:
+            delay = self.try_acquire()
+            if delay == 0:
+                return
+            self.metrics["waited"] += delay
+            await asyncio.sleep(delay)
+
+
+buckets: Dict[str, TokenBucket] = {}
+buckets_lock = threading.Lock()
+
+
+def get_bucket(
+    name: str,
+) -> Optional[TokenBucket]:
+    """
+    Return bucket of provider, which is found by provider name or host
+    :param name: Provider name like weatherbit or host like api.weatherbit.io
+    :return: None if provider is not limited
+    """
+    provider = PROVIDER_HOSTS.get(name, name)
+    if provider not in LIMITS:
+        return None
+    with buckets_lock:
+        if provider not in buckets:
+            buckets[provider] = TokenBucket(provider, *LIMITS[provider])
+        return buckets[provider]
+
+
+def acquire(
+    name: str,
+):
+    bucket = get_bucket(name)
+    if bucket is not None:
+        bucket.acquire()
+
+
+async def acquire_async(
+    name: str,
+):
+    bucket = get_bucket(name)
+    if bucket is not None:
+        await bucket.acquire_async()
+
+
+def is_budget_low(
+    name: str,
+) -> bool:
+    bucket = get_bucket(name)
+    return bucket is not None and bucket.is_budget_low()
+
+
+def configure(
+    provider: str,
+    rate: Optional[float] = None,
+    burst: Optional[int] = None,
+    daily_budget: Optional[int] = None,
+):
+    """
+    Change limits of provider, values which are not passed stay the same
+    :param provider:
+    :param rate:
+    :param burst:
+    :param daily_budget:
+    :return:
+    """
+    default_rate, default_burst, default_budget = LIMITS[provider]
+    LIMITS[provider] = (
+        rate if rate is not None else default_rate,
+        burst if burst is not None else default_burst,
+        daily_budget if daily_budget is not None else default_budget,
+    )
+    with buckets_lock:
+        bucket = buckets.get(provider)
+        if bucket is not None:
+            bucket.rate, bucket.burst, bucket.daily_budget = LIMITS[provider]
+            # Budget left is counted again with the new budget
+            bucket._remaining = None
+
+
+def share_limits(
+    shares: int,
+    budget_shares: Optional[int] = None,
+):
+    """
+    Leave equal part of every provider limit to this process, so processes of sharded run keep the limit together
+    Processes which run in the same directory count daily budget together in one budget file
+    :param shares: How many processes share limits
+    :param budget_shares: How many budget files share daily budgets, shares if not passed
+    :return:
+    """
+    budget_shares = budget_shares or shares
+    for provider, (rate, burst, daily_budget) in list(LIMITS.items()):
+        configure(
+            provider,
+            rate=rate / shares,
+            burst=max(1, burst // shares),
+            daily_budget=daily_budget // budget_shares if daily_budget is not None else None,
+        )
+
+
+def get_stats() -> Dict[str, Dict[str, float]]:
+    with buckets_lock:
+        limited = list(buckets.values())
+    return {bucket.provider: {**bucket.metrics, "remaining_budget": bucket.remaining_budget()} for bucket in limited}
+
+
+def log_stats():
+    for provider, metrics in get_stats().items():
+        remaining = metrics["remaining_budget"]
+        logging.info(
+            f"Rate limit {provider}: requests {metrics.get('acquired', 0)}, "
+            f"waited {round(metrics.get('waited', 0), 1)} seconds, rejected {metrics.get('rejected', 0)}, "
+            f"budget left {remaining if remaining is not None else 'unlimited'}"
+        )
@@ -0,0 +1,237 @@
+from typing import Callable, Dict, Optional
+
+import calculations
+import get_info
+
+
+def _convert(
+    func: Callable,
+    value: Optional[float],
+    digits: int,
+) -> Optional[float]:
+    if value is None:
+        return None
+    return round(func(value), digits)
+
+
+def _level(
+    func: Callable,
+    value: Optional[float],
+) -> str:
+    if value is None:
+        return "Unknown"
+    level = func(value)
+    return level.capitalize() if level is not None else "Unknown"
+
+
+class WeatherReport:
+    """
+    Everything which is reported about city, unit conversions & levels are calculated once
+    Every sink renders it with its own f-string function
+    """
+
+    __slots__ = (
+        "country_name",
+        "city_name",
+        "timezone",
+        "time",
+        "pod",
+        "elevation",
+        "geomagnetic_field",
+        "kp_level",
+        "pres",
+        "pres_mmhg",
+        "pres_kpa",
+        "slp",
+        "slp_mmhg",
+        "slp_kpa",
+        "wind_spd",
+        "wind_cdir",
+        "rh",
+        "clouds",
+        "solar_rad",
+        "snow",
+        "uv",
+        "uv_level",
+        "aqi",
+        "aqi_level",
+        "temp",
+        "temp_f",
+        "temp_k",
+        "app_temp",
+        "app_temp_f",
+        "app_temp_k",
+        "water_temp",
+        "water_temp_f",
+        "water_temp_k",
+    )
+
+    def __init__(
+        self,
+        weather_data: Dict[str, any],
+        city_name: str,
+        timezone_by_city: str,
+        country_name: str,
+        elevation: int,
+        water_temp: float,
+        geomagnetic_field: int,
+        local_time: Optional[str] = None,
+    ):
+        """
+        :param weather_data: Weather info from weatherbit
+        :param city_name:
+        :param timezone_by_city:
+        :param country_name:
+        :param elevation:
+        :param water_temp:
+        :param geomagnetic_field:
+        :param local_time: Time in city, current time by timezone if not passed
+        """
+        self.country_name = country_name
+        self.city_name = city_name.capitalize()
+        self.timezone = timezone_by_city
+        self.time = local_time if local_time is not None else get_info.get_time_by_timezone(timezone_by_city)
+        self.pod = weather_data["pod"]
+        self.elevation = elevation
+        self.geomagnetic_field = geomagnetic_field
+        self.kp_level = _level(calculations.calculate_kp_level, geomagnetic_field)
+
+        self.pres = round(weather_data["pres"], 2)
+        self.pres_mmhg = round(weather_data["pres"] * calculations.MMHG, 2)
+        self.pres_kpa = round(weather_data["pres"] * calculations.KPA, 2)
+        self.slp = round(weather_data["slp"], 2)
+        self.slp_mmhg = round(weather_data["slp"] * calculations.MMHG, 2)
+        self.slp_kpa = round(weather_data["slp"] * calculations.KPA, 2)
+
+        self.wind_spd = weather_data["wind_spd"]
+        self.wind_cdir = weather_data["wind_cdir"]
+        self.rh = weather_data["rh"]
+        self.clouds = weather_data["clouds"]
+        self.solar_rad = weather_data["solar_rad"]
+        self.snow = weather_data["snow"]
+
+        self.uv = weather_data["uv"]
+        self.uv_level = _level(calculations.calculate_uv_level, _convert(float, self.uv, 1))
+        self.aqi = weather_data["aqi"]
+        self.aqi_level = _level(calculations.calculate_aqi_level, self.aqi)
+
+        self.temp = weather_data["temp"]
+        self.temp_f = _convert(calculations.celsius_to_fahrenheit, self.temp, 1)
+        self.temp_k = _convert(calculations.celsius_to_kelvin, self.temp, 1)
+        self.app_temp = weather_data["app_temp"]
+        self.app_temp_f = _convert(calculations.celsius_to_fahrenheit, self.app_temp, 1)
+        self.app_temp_k = _convert(calculations.celsius_to_kelvin, self.app_temp, 1)
+        self.water_temp = water_temp
+        self.water_temp_f = _convert(calculations.celsius_to_fahrenheit, water_temp, 1)
+        self.water_temp_k = _convert(calculations.celsius_to_kelvin, water_temp, 1)
+
+
+def render_console(
+    r: WeatherReport,
+) -> str:
+    """
+    Plain text report for console
+    :param r:
+    :return:
+    """
+    return (
+        "\n"
+        f"Country: {r.country_name} | City name: {r.city_name}\n"
+        f"Timezone: {r.timezone}\n"
+        f"Time: {r.time}\n"
+        "\n"
+        f"Part of a day: {r.pod}\n"
+        f"Elevation above sea level: {r.elevation} m\n"
+        f"Geomagnetic field: {r.geomagnetic_field} - {r.kp_level}\n"
+        "\n"
+        f"Pressure: {r.pres} mb | {r.pres_mmhg} mmHg | {r.pres_kpa} kPa\n"
+        f"Sea level pressure: {r.slp} mb | {r.slp_mmhg} mmHg | {r.slp_kpa} kPa\n"
+        "\n"
+        f"Wind speed: {r.wind_spd} m/s\n"
+        f"Wind direction: {r.wind_cdir}\n"
+        f"Relative humidity: {r.rh}%\n"
+        f"Cloud percents: {r.clouds}%\n"
+        f"Solar radiation: {r.solar_rad} Watt/m^2\n"
+        f"Snowfall: {r.snow} mm/hr\n"
+        "\n"
+        f"UV (UltraViolet): {r.uv} - {r.uv_level}\n"
+        f"AQI (Air Quality Index): {r.aqi} - {r.aqi_level}\n"
+        "\n"
+        f"Temperature: {r.temp} C | {r.temp_f} F | {r.temp_k} K\n"
+        f"Apparent temperature: {r.app_temp} C | {r.app_temp_f} F | {r.app_temp_k} K\n"
+        f"Water temperature: {r.water_temp} C | {r.water_temp_f} F | {r.water_temp_k} K\n"
+    )
+
+
+def render_telegram(
+    r: WeatherReport,
+) -> str:
+    """
+    Report for telegram, country & city are hashtags
+    :param r:
+    :return:
+    """
+    return (
+        f"Country: #{r.country_name} | City name: #{r.city_name}\n"
+        f"Timezone: {r.timezone}\n"
+        f"Time: {r.time}\n"
+        "\n"
+        f"Part of a day: {r.pod}\n"
+        f"Elevation above sea level: {r.elevation} m\n"
+        f"Geomagnetic field: {r.geomagnetic_field} - {r.kp_level}\n"
+        "\n"
+        f"Pressure: {r.pres} mb | {r.pres_mmhg} mmHg | {r.pres_kpa} kPa\n"
+        f"Sea level pressure: {r.slp} mb | {r.slp_mmhg} mmHg | {r.slp_kpa} kPa\n"
+        "\n"
+        f"Wind speed: {r.wind_spd} m/s\n"
+        f"Wind direction: {r.wind_cdir}\n"
+        f"Relative humidity: {r.rh}%\n"
+        f"Cloud percents: {r.clouds}%\n"
+        f"Solar radiation: {r.solar_rad} Watt/m^2\n"
+        f"Snowfall: {r.snow} mm/hr\n"
+        "\n"
+        f"UV (UltraViolet): {r.uv} - {r.uv_level}\n"
+        f"AQI (Air Quality Index): {r.aqi} - {r.aqi_level}\n"
+        "\n"
+        f"Temperature: {r.temp} C | {r.temp_f} F | {r.temp_k} K\n"
+        f"Apparent temperature: {r.app_temp} C | {r.app_temp_f} F | {r.app_temp_k} K\n"
+        f"Water temperature: {r.water_temp} C | {r.water_temp_f} F | {r.water_temp_k} K\n"
+    )
+
+
+# Two spaces at the end of line is line break in Markdown
+def render_file(
+    r: WeatherReport,
+) -> str:
+    """
+    Markdown section of report file
+    :param r:
+    :return:
+    """
+    return (
+        f"## Country: {r.country_name} | City name: {r.city_name}  \n"
+        f"### Timezone: {r.timezone}  \n"
+        f"Time: {r.time}  \n"
+        "  \n"
+        f"Part of a day: {r.pod}  \n"
+        f"**Elevation above sea level:** {r.elevation} m  \n"
+        f"Geomagnetic field: {r.geomagnetic_field} - {r.kp_level}  \n"
+        "  \n"
+        f"Pressure: {r.pres} mb | {r.pres_mmhg} mmHg | {r.pres_kpa} kPa  \n"
+        f"Sea level pressure: {r.slp} mb | {r.slp_mmhg} mmHg | {r.slp_kpa} kPa  \n"
+        "  \n"
+        f"Wind speed: {r.wind_spd} m/s  \n"
+        f"Wind direction: {r.wind_cdir}  \n"
+        f"Relative humidity: {r.rh}%  \n"
+        f"Cloud percents: {r.clouds}%  \n"
+        f"**Solar radiation**: {r.solar_rad} Watt/m^2  \n"
+        f"Snowfall: {r.snow} mm/hr  \n"
+        "  \n"
+        f"UV (UltraViolet): {r.uv} - {r.uv_level}  \n"
+        f"AQI (Air Quality Index): {r.aqi} - {r.aqi_level}  \n"
+        "  \n"
+        f"**Temperature**: {r.temp} C | {r.temp_f} F | {r.temp_k} K  \n"
+        f"**Apparent temperature**: {r.app_temp} C | {r.app_temp_f} F | {r.app_temp_k} K  \n"
+        f"**Water temperature**: {r.water_temp} C | {r.water_temp_f} F | {r.water_temp_k} K  \n"
+        "\n"
+    )
@@ -0,0 +1,121 @@
+import gzip
+import logging
+import os
+import threading
+from typing import List, Optional
+
+# Buffered city sections are written to disk every that many cities
+FLUSH_EVERY = 10
+
+# Logging
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    level=logging.INFO,
+)
+
+
+class ReportWriter:
+    """
+    Write rendered city sections into report file through one handle per run
+    Sections are buffered and the report is published atomically with temp file & rename,
+    so readers never see half-written report
+    Report is published on close & when it grows above max size, long-running process publishes
+    every flush as the next part, so nothing written is ever copied again
+    """
+
+    def __init__(
+        self,
+        name: str,
+        extension: str,
+        flush_every: int = FLUSH_EVERY,
+        compress: bool = False,
+        max_bytes: Optional[int] = None,
+    ):
+        """
+        :param name: Report file name without extension
+        :param extension: Like .md
+        :param flush_every: Write to temp file after that many cities
+        :param compress: Write gzip, every flush is a separate gzip member, so file is always valid
+        :param max_bytes: Start next file when report grows above that size, never if not passed
+        """
+        self.name = name
+        self.extension = extension + ".gz" if compress else extension
+        self.flush_every = flush_every
+        self.compress = compress
+        self.max_bytes = max_bytes
+        self.part = 0
+        self._buffer: List[str] = []
+        self._lock = threading.Lock()
+        self._handle = None
+        self._written = 0
+
+    @property
+    def path(self) -> str:
+        if self.part == 0:
+            return f"{self.name}{self.extension}"
+        return f"{self.name}.{self.part}{self.extension}"
+
+    def write(
+        self,
+        section: str,
+    ):
+        """
+        Buffer rendered city section
+        :param section:
+        :return:
+        """
+        with self._lock:
+            self._buffer.append(section)
+            if len(self._buffer) >= self.flush_every:
+                self._flush()
+
+    def flush(self):
+        """
+        Write what is buffered and publish it as the next part of report
+        :return:
+        """
+        with self._lock:
+            self._flush()
+            self._rotate()
+
+    def close(self):
+        """
+        Flush what is buffered and move complete report in place
+        :return:
+        """
+        with self._lock:
+            self._flush()
+            self._finish()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        data = "".join(self._buffer).encode("utf-8")
+        self._buffer.clear()
+        if self.compress:
+            data = gzip.compress(data)
+
+        if self._handle is None:
+            self._handle = open(self.path + ".tmp", "wb")
+            self._written = 0
+        self._handle.write(data)
+        self._handle.flush()
+        os.fsync(self._handle.fileno())
+        self._written += len(data)
+
+        if self.max_bytes is not None and self._written >= self.max_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        if self._handle is None:
+            return
+        self._finish()
+        self.part += 1
+
+    def _finish(self):
+        if self._handle is None:
+            return
+        self._handle.close()
+        self._handle = None
+        os.replace(self.path + ".tmp", self.path)
+        logging.info(f"Report saved to {self.path}")
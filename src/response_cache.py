@@ -0,0 +1,258 @@
+import logging
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+import rate_limit
+
+# Weatherbit observations are updated every few minutes
+TTL = 600
+# Expired entry is still served for that long while it is refreshed in background
+STALE_TTL = 600
+MAX_SIZE = 1024
+
+# Entry states returned by lookup
+FRESH = "fresh"
+STALE = "stale"
+MISSING = "missing"
+
+# Logging
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    level=logging.INFO,
+)
+
+
+class ResponseCache:
+    """
+    Bounded LRU cache of provider responses with TTL and stale-while-revalidate
+    """
+
+    def __init__(
+        self,
+        name: str,
+        ttl: float = TTL,
+        stale_ttl: float = STALE_TTL,
+        max_size: int = MAX_SIZE,
+    ):
+        """
+        :param name: Provider name, used in metrics
+        :param ttl: Seconds while entry is fresh
+        :param stale_ttl: Seconds after ttl while entry is served and refreshed in background
+        :param max_size: Least recently used entries are evicted above that size
+        """
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_size = max_size
+        self.metrics: Dict[str, int] = defaultdict(int)
+        self._entries: "OrderedDict[Hashable, Tuple[float, any]]" = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._refresh_pool = None
+
+    def lookup(
+        self,
+        key: Hashable,
+    ) -> Tuple[Optional[any], str]:
+        """
+        Return cached value and its state, metrics are counted here
+        :param key:
+        :return: Value & one of FRESH, STALE, MISSING
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                age = time.monotonic() - entry[0]
+                if age <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.metrics["hits"] += 1
+                    return entry[1], FRESH
+                if age <= self.ttl + self.stale_ttl:
+                    self._entries.move_to_end(key)
+                    self.metrics["stale_hits"] += 1
+                    return entry[1], STALE
+                if rate_limit.is_budget_low(self.name):
+                    # Old data is better than no data when provider budget is almost used up
+                    self._entries.move_to_end(key)
+                    self.metrics["degraded"] += 1
+                    return entry[1], STALE
+                del self._entries[key]
+            self.metrics["misses"] += 1
+            return None, MISSING
+
+    def store(
+        self,
+        key: Hashable,
+        value: any,
+    ):
+        """
+        Save value, None means failed request and is not cached
+        :param key:
+        :param value:
+        :return:
+        """
+        if value is None:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.metrics["evictions"] += 1
+
+    def start_refresh(
+        self,
+        key: Hashable,
+    ) -> bool:
+        """
+        Mark key as being refreshed, False if somebody refreshes it already or provider budget is low
+        :param key:
+        :return:
+        """
+        if rate_limit.is_budget_low(self.name):
+            return False
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            self.metrics["refreshes"] += 1
+            return True
+
+    def finish_refresh(
+        self,
+        key: Hashable,
+        value: any,
+    ):
+        self.store(key, value)
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def _refresh(
+        self,
+        key: Hashable,
+        fetch: Callable,
+    ):
+        value = None
+        try:
+            value = fetch()
+        except BaseException as base_err:
+            logging.error(f"Base Err while refreshing {self.name} cache - {base_err}")
+        finally:
+            self.finish_refresh(key, value)
+
+    def get_or_fetch(
+        self,
+        key: Hashable,
+        fetch: Callable,
+    ) -> any:
+        """
+        Return cached value, stale one is returned at once and refreshed in background
+        :param key:
+        :param fetch: Function without arguments which requests provider
+        :return:
+        """
+        value, state = self.lookup(key)
+        if state == FRESH:
+            return value
+        if state == STALE:
+            if self.start_refresh(key):
+                with self._lock:
+                    if self._refresh_pool is None:
+                        self._refresh_pool = ThreadPoolExecutor(
+                            max_workers=2,
+                            thread_name_prefix=f"{self.name}-refresh",
+                        )
+                self._refresh_pool.submit(self._refresh, key, fetch)
+            return value
+        value = fetch()
+        self.store(key, value)
+        return value
+
+    def close(self):
+        """
+        Wait for background refreshes which are running, refreshes which did not start are dropped
+        :return:
+        """
+        with self._lock:
+            refresh_pool, self._refresh_pool = self._refresh_pool, None
+        if refresh_pool is not None:
+            refresh_pool.shutdown(wait=True, cancel_futures=True)
+
+
+settings = {
+    "ttl": TTL,
+    "stale_ttl": STALE_TTL,
+    "max_size": MAX_SIZE,
+}
+
+caches: Dict[str, ResponseCache] = {}
+caches_lock = threading.Lock()
+
+
+def get_cache(
+    name: str,
+) -> ResponseCache:
+    """
+    Return cache of passed provider, created with default settings on first call
+    :param name:
+    :return:
+    """
+    with caches_lock:
+        if name not in caches:
+            caches[name] = ResponseCache(name, **settings)
+        return caches[name]
+
+
+def configure(
+    ttl: Optional[float] = None,
+    stale_ttl: Optional[float] = None,
+    max_size: Optional[int] = None,
+):
+    """
+    Change settings of every provider cache, values which are not passed stay the same
+    Caches which exist are closed, so they are created again with new settings
+    :param ttl:
+    :param stale_ttl:
+    :param max_size:
+    :return:
+    """
+    for name, value in (
+        ("ttl", ttl),
+        ("stale_ttl", stale_ttl),
+        ("max_size", max_size),
+    ):
+        if value is not None:
+            settings[name] = value
+    close()
+
+
+def close():
+    """
+    Close every provider cache, so no refresh thread outlives the run
+    :return:
+    """
+    with caches_lock:
+        closed = list(caches.values())
+        caches.clear()
+    for cache in closed:
+        cache.close()
+
+
+def get_stats() -> Dict[str, Dict[str, int]]:
+    with caches_lock:
+        return {name: dict(cache.metrics) for name, cache in caches.items()}
+
+
+def log_stats():
+    for name, metrics in get_stats().items():
+        lookups = metrics.get("hits", 0) + metrics.get("stale_hits", 0) + metrics.get("misses", 0)
+        hit_rate = (metrics.get("hits", 0) + metrics.get("stale_hits", 0)) / lookups if lookups else 0
+        logging.info(
+            f"Cache {name}: hits {metrics.get('hits', 0)}, stale hits {metrics.get('stale_hits', 0)}, "
+            f"misses {metrics.get('misses', 0)}, hit rate {round(hit_rate * 100, 1)}%, "
+            f"refreshes {metrics.get('refreshes', 0)}, evictions {metrics.get('evictions', 0)}, "
+            f"served expired on low budget {metrics.get('degraded', 0)}"
+        )
@@ -0,0 +1,129 @@
+import heapq
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+# Local hours when report have to be sent
+REPORT_HOURS = [6, 8, 10, 12, 14, 16, 18, 20, 22]
+
+# Logging
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    level=logging.INFO,
+)
+
+
+def next_report_time(
+    timezone_name: str,
+    after: datetime,
+) -> datetime:
+    """
+    Calculate next instant in UTC when local time in passed time zone hits one of REPORT_HOURS
+    :param timezone_name: The name like Europe/Madrid
+    :param after: Aware datetime, result will be strictly later
+    :return:
+    """
+    import pytz
+
+    local_tz = pytz.timezone(timezone_name)
+    local_now = after.astimezone(local_tz)
+    for day_offset in range(2):
+        day = local_now.date() + timedelta(days=day_offset)
+        for hour in REPORT_HOURS:
+            candidate = local_tz.localize(datetime(day.year, day.month, day.day, hour))
+            if candidate > local_now:
+                return candidate.astimezone(timezone.utc)
+
+
+class ReportScheduler:
+    """
+    Keep min-heap of next report instant per time zone
+    Cities are grouped by time zone, so one wake-up serves all cities which are due
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._cities_by_timezone: Dict[str, List[str]] = {}
+        self._logged_deadline = None
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def add_city(
+        self,
+        city_name: str,
+        timezone_name: Optional[str],
+    ) -> bool:
+        """
+        Register city, deadline is calculated once per time zone
+        :param city_name:
+        :param timezone_name: None if time zone of city was not found
+        :return: Whether city is scheduled, city without known time zone is skipped
+        """
+        if timezone_name not in self._cities_by_timezone:
+            import pytz
+
+            try:
+                deadline = next_report_time(timezone_name, datetime.now(timezone.utc))
+            except pytz.UnknownTimeZoneError as tz_err:
+                logging.error(f"Skip {city_name}, time zone is not known - {tz_err}")
+                return False
+            self._cities_by_timezone[timezone_name] = []
+            heapq.heappush(self._heap, (deadline, timezone_name))
+        if city_name not in self._cities_by_timezone[timezone_name]:
+            self._cities_by_timezone[timezone_name].append(city_name)
+        return True
+
+    def remove_city(
+        self,
+        city_name: str,
+    ):
+        """
+        Stop reporting about city, time zone stays scheduled even without cities
+        :param city_name:
+        :return:
+        """
+        for city_names in self._cities_by_timezone.values():
+            if city_name in city_names:
+                city_names.remove(city_name)
+
+    def seconds_until_due(self) -> float:
+        """
+        How long to sleep until the earliest deadline
+        :return:
+        """
+        return max(0.0, (self._heap[0][0] - datetime.now(timezone.utc)).total_seconds())
+
+    def pop_due(self) -> Dict[str, List[str]]:
+        """
+        Pop every time zone which is due and schedule it again
+        :return: Cities which have to be reported grouped by time zone
+        """
+        now = datetime.now(timezone.utc)
+        due = {}
+        while self._heap and self._heap[0][0] <= now:
+            _, timezone_name = heapq.heappop(self._heap)
+            due[timezone_name] = list(self._cities_by_timezone[timezone_name])
+            heapq.heappush(
+                self._heap,
+                (next_report_time(timezone_name, now), timezone_name),
+            )
+        return due
+
+    def wait_for_due(
+        self,
+        max_wait: Optional[float] = None,
+    ) -> Dict[str, List[str]]:
+        """
+        Sleep until the earliest deadline, then pop every time zone which is due
+        :param max_wait: Sleep not longer than that, nothing is due if woken up before deadline
+        :return: Cities which have to be reported grouped by time zone
+        """
+        delay = self.seconds_until_due()
+        if delay > 0:
+            if self._heap[0][0] != self._logged_deadline:
+                self._logged_deadline = self._heap[0][0]
+                logging.info(f"Next report at {self._heap[0][0]} UTC, sleeping {round(delay)} seconds...")
+            time.sleep(delay if max_wait is None else min(delay, max_wait))
+        return self.pop_due()
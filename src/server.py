@@ -0,0 +1,126 @@
+import json
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+import geo_cache
+import metrics
+import single_flight
+
+HOST = "127.0.0.1"
+PORT = 8080
+
+# Logging
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    level=logging.INFO,
+)
+
+
+class WeatherServer:
+    """
+    Answer weather about city over local HTTP, caches & sessions stay warm between requests
+    Concurrent requests about the same city wait for one fetch
+    """
+
+    def __init__(
+        self,
+        get_weather: Callable[[str], Optional[Dict[str, any]]],
+        host: str = HOST,
+        port: int = PORT,
+    ):
+        """
+        :param get_weather: Function which returns row about city or None if city is unknown
+        :param host:
+        :param port:
+        """
+        self._get_weather = get_weather
+        self._single_flight = single_flight.get_group("serve")
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.weather_server = self
+
+    @property
+    def address(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def get_weather(
+        self,
+        city_name: str,
+    ) -> Optional[Dict[str, any]]:
+        """
+        Fetch weather about city, the same city requested meanwhile is answered by the same fetch
+        :param city_name:
+        :return:
+        """
+        return self._single_flight.do(
+            geo_cache.normalize_city_name(city_name),
+            lambda: self._get_weather(city_name),
+        )
+
+    def serve_forever(self):
+        logging.info(f"Serving weather on {self.address}/weather?city=...")
+        self._httpd.serve_forever()
+
+    def shutdown(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/metrics":
+            self._send_text(200, metrics.render_prometheus())
+            return
+        if url.path != "/weather":
+            self._send_json(404, {"error": "Not found, use /weather?city=..."})
+            return
+        city_name = parse_qs(url.query).get("city", [""])[0].strip()
+        if not city_name:
+            self._send_json(400, {"error": "City is not passed"})
+            return
+
+        try:
+            row = self.server.weather_server.get_weather(city_name)
+        except BaseException as base_err:
+            logging.error(f"Base Err while answering about {city_name} - {base_err}")
+            self._send_json(502, {"error": f"Weather about {city_name} is not available"})
+            return
+        if row is None:
+            self._send_json(404, {"error": f"City {city_name} is not found"})
+            return
+        self._send_json(200, row)
+
+    def _send_json(
+        self,
+        status: int,
+        body: Dict[str, any],
+    ):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_text(
+        self,
+        status: int,
+        body: str,
+    ):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(
+        self,
+        format: str,
+        *args,
+    ):
+        logging.debug(f"{self.address_string()} - {format % args}")
@@ -0,0 +1,149 @@
+import argparse
+import logging
+import multiprocessing
+import queue
+import zlib
+from typing import Any, Callable, Iterator, List, Tuple
+
+import geo_cache
+
+# Appended to city key when cities are split between worker processes, so that split does not follow split of containers
+PROCESS_SALT = "#process"
+
+# Coordinator checks that workers are alive that often while waiting for results, in seconds
+WORKER_POLL_INTERVAL = 1.0
+
+# Logging
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    level=logging.INFO,
+)
+
+
+def parse_shard(
+    value: str,
+) -> Tuple[int, int]:
+    """
+    Parse shard passed like 0/2
+    :param value:
+    :return: Shard index & number of shards
+    """
+    try:
+        index, shards = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Shard {value} is not like 0/2")
+    if shards < 1:
+        raise argparse.ArgumentTypeError(f"Number of shards in {value} must be positive")
+    if not 0 <= index < shards:
+        raise argparse.ArgumentTypeError(f"Shard index of {value} must be from 0 to {shards - 1}")
+    return index, shards
+
+
+def shard_of(
+    city_key: str,
+    shards: int,
+    salt: str = "",
+) -> int:
+    """
+    Shard of city, stable across processes, runs & machines unlike hash()
+    :param city_key:
+    :param shards:
+    :param salt: Split with another salt is independent of this one
+    :return:
+    """
+    return zlib.crc32((geo_cache.normalize_city_name(city_key) + salt).encode("utf-8")) % shards
+
+
+def split(
+    items: List[Any],
+    city_key: Callable[[Any], str],
+    shards: int,
+    salt: str = "",
+) -> List[List[Any]]:
+    """
+    Split items between shards by city
+    :param items:
+    :param city_key: Function which returns city key of item
+    :param shards:
+    :param salt:
+    :return: Items of every shard
+    """
+    by_shard = [[] for _ in range(shards)]
+    for item in items:
+        by_shard[shard_of(city_key(item), shards, salt)].append(item)
+    return by_shard
+
+
+class ShardPool:
+    """
+    Worker processes, each handles its shard of cities with its own caches, sessions & timezone data
+    Coordinator sends tasks to workers and merges what they return
+    """
+
+    def __init__(
+        self,
+        worker: Callable,
+        worker_args: tuple,
+        processes: int,
+    ):
+        """
+        :param worker: Importable function called as worker(index, tasks, results, *worker_args)
+        It takes (task, items) from tasks until None, puts ("result", value) for every result and ("done", index) after task
+        :param worker_args: Picklable arguments of worker
+        :param processes:
+        """
+        # Workers do not inherit threads, locks & open connections of coordinator
+        context = multiprocessing.get_context("spawn")
+        self._tasks = [context.Queue() for _ in range(processes)]
+        self._results = context.Queue()
+        self._processes = [
+            context.Process(
+                target=worker,
+                args=(index, self._tasks[index], self._results, *worker_args),
+                name=f"shard-{index}",
+                daemon=True,
+            )
+            for index in range(processes)
+        ]
+        for process in self._processes:
+            process.start()
+
+    def __len__(self) -> int:
+        return len(self._processes)
+
+    def run(
+        self,
+        task: str,
+        items_by_shard: List[List[Any]],
+    ) -> Iterator[Any]:
+        """
+        Send items of every shard to its worker, yield results as soon as any worker returns them
+        :param task: Task name understood by worker
+        :param items_by_shard:
+        :return:
+        """
+        pending = set()
+        for index, items in enumerate(items_by_shard):
+            if items:
+                self._tasks[index].put((task, items))
+                pending.add(index)
+
+        while pending:
+            try:
+                kind, value = self._results.get(timeout=WORKER_POLL_INTERVAL)
+            except queue.Empty:
+                for index in list(pending):
+                    if not self._processes[index].is_alive():
+                        logging.error(f"Shard {index} worker exited with code {self._processes[index].exitcode}")
+                        pending.discard(index)
+                continue
+            if kind == "done":
+                pending.discard(value)
+            else:
+                yield value
+
+    def close(self):
+        for tasks in self._tasks:
+            tasks.put(None)
+        for process in self._processes:
+            process.join()
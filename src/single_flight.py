@@ -0,0 +1,131 @@
+import logging
+import threading
+from collections import defaultdict
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Dict, Hashable
+
+# Logging
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    level=logging.INFO,
+)
+
+
+class SingleFlight:
+    """
+    Identical calls which are in flight at the same time share one pending result
+    Nothing is kept after the call is finished, caching is up to response_cache & geo_cache
+    """
+
+    def __init__(
+        self,
+        name: str,
+    ):
+        """
+        :param name: Provider name, used in metrics
+        """
+        self.name = name
+        self.metrics: Dict[str, int] = defaultdict(int)
+        self._in_flight: Dict[Hashable, Future] = {}
+        self._in_flight_async: Dict[Hashable, Awaitable] = {}
+        self._lock = threading.Lock()
+
+    def do(
+        self,
+        key: Hashable,
+        fetch: Callable,
+    ) -> any:
+        """
+        Call fetch, or wait for the same key which is fetched by another thread
+        :param key:
+        :param fetch: Function without arguments which requests provider
+        :return:
+        """
+        with self._lock:
+            self.metrics["calls"] += 1
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.metrics["deduplicated"] += 1
+                leader = False
+            else:
+                future = Future()
+                self._in_flight[key] = future
+                leader = True
+
+        if not leader:
+            return future.result()
+
+        try:
+            future.set_result(fetch())
+        except BaseException as base_err:
+            future.set_exception(base_err)
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+        return future.result()
+
+    async def do_async(
+        self,
+        key: Hashable,
+        fetch: Callable[[], Awaitable],
+    ) -> any:
+        """
+        The same as do, but for coroutines running in one event loop
+        :param key:
+        :param fetch: Function without arguments which returns coroutine requesting provider
+        :return:
+        """
+        import asyncio
+
+        with self._lock:
+            self.metrics["calls"] += 1
+            future = self._in_flight_async.get(key)
+            if future is not None:
+                self.metrics["deduplicated"] += 1
+            else:
+                self._in_flight_async[key] = asyncio.get_running_loop().create_future()
+
+        if future is not None:
+            # Waiter which is cancelled must not cancel fetch for others
+            return await asyncio.shield(future)
+
+        future = self._in_flight_async[key]
+        try:
+            future.set_result(await fetch())
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as base_err:
+            future.set_exception(base_err)
+        finally:
+            with self._lock:
+                del self._in_flight_async[key]
+        return future.result()
+
+
+groups: Dict[str, SingleFlight] = {}
+groups_lock = threading.Lock()
+
+
+def get_group(
+    name: str,
+) -> SingleFlight:
+    """
+    Return single-flight group of passed provider, created on first call
+    :param name:
+    :return:
+    """
+    with groups_lock:
+        if name not in groups:
+            groups[name] = SingleFlight(name)
+        return groups[name]
+
+
+def get_stats() -> Dict[str, Dict[str, int]]:
+    with groups_lock:
+        return {name: dict(group.metrics) for name, group in groups.items()}
+
+
+def log_stats():
+    for name, metrics in get_stats().items():
+        logging.info(f"Single-flight {name}: calls {metrics.get('calls', 0)}, deduplicated {metrics.get('deduplicated', 0)}")
@@ -0,0 +1,187 @@
+import csv
+import json
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List
+
+# Rows are buffered in memory only up to that many for columnar format
+ROW_GROUP_SIZE = 10000
+
+# One row per city observation, column name & type
+COLUMNS = [
+    ("observed_at", str),
+    ("city_name", str),
+    ("country_name", str),
+    ("country_code", str),
+    ("timezone", str),
+    ("latitude", float),
+    ("longitude", float),
+    ("elevation", int),
+    ("geomagnetic_field", int),
+    ("water_temp", float),
+    ("pod", str),
+    ("pres", float),
+    ("slp", float),
+    ("wind_spd", float),
+    ("wind_cdir", str),
+    ("rh", float),
+    ("clouds", float),
+    ("solar_rad", float),
+    ("snow", float),
+    ("uv", float),
+    ("aqi", int),
+    ("temp", float),
+    ("app_temp", float),
+]
+
+FORMATS = ["jsonl", "csv", "parquet"]
+
+# Logging
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    level=logging.INFO,
+)
+
+
+def _cast(
+    value: any,
+    column_type: type,
+) -> any:
+    if value is None or value == "":
+        return None
+    try:
+        return column_type(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def record_to_row(
+    record: Dict[str, any],
+) -> Dict[str, any]:
+    """
+    Flatten record assembled by fetch into one typed row
+    :param record: City & location info, weather_data, elevation, water_temp & geomagnetic_field
+    :return:
+    """
+    weather_data = record.get("weather_data") or {}
+    values = {
+        "observed_at": datetime.now(timezone.utc).isoformat(),
+        "city_name": record.get("city_name"),
+        "country_name": record.get("country_name"),
+        "country_code": record.get("country_code"),
+        "timezone": record.get("timezone_by_city"),
+        "latitude": record.get("latitude"),
+        "longitude": record.get("longitude"),
+        "elevation": record.get("elevation"),
+        "geomagnetic_field": record.get("geomagnetic_field"),
+        "water_temp": record.get("water_temp"),
+    }
+    for name, _ in COLUMNS:
+        if name not in values:
+            values[name] = weather_data.get(name)
+    return {name: _cast(values[name], column_type) for name, column_type in COLUMNS}
+
+
+class JsonlSink:
+    def __init__(
+        self,
+        path: str,
+    ):
+        self.path = path
+        self._file = open(path, "w", encoding="utf-8")
+
+    def write(
+        self,
+        row: Dict[str, any],
+    ):
+        self._file.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class CsvSink:
+    def __init__(
+        self,
+        path: str,
+    ):
+        self.path = path
+        self._file = open(path, "w", encoding="utf-8", newline="")
+        self._writer = csv.DictWriter(self._file, fieldnames=[name for name, _ in COLUMNS])
+        self._writer.writeheader()
+
+    def write(
+        self,
+        row: Dict[str, any],
+    ):
+        self._writer.writerow(row)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetSink:
+    """
+    Rows are written in row groups, so memory is bounded by ROW_GROUP_SIZE whatever the number of cities
+    Needs pyarrow, which is not required for other formats
+    """
+
+    def __init__(
+        self,
+        path: str,
+        row_group_size: int = ROW_GROUP_SIZE,
+    ):
+        import pyarrow
+        import pyarrow.parquet
+
+        self.path = path
+        self._pyarrow = pyarrow
+        arrow_types = {str: pyarrow.string(), float: pyarrow.float64(), int: pyarrow.int64()}
+        self._schema = pyarrow.schema([(name, arrow_types[column_type]) for name, column_type in COLUMNS])
+        self._writer = pyarrow.parquet.ParquetWriter(path, self._schema)
+        self._row_group_size = row_group_size
+        self._rows: List[Dict[str, any]] = []
+
+    def write(
+        self,
+        row: Dict[str, any],
+    ):
+        self._rows.append(row)
+        if len(self._rows) >= self._row_group_size:
+            self.flush()
+
+    def flush(self):
+        if self._rows:
+            self._writer.write_table(self._pyarrow.Table.from_pylist(self._rows, schema=self._schema))
+            self._rows.clear()
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+
+
+def open_sink(
+    output_format: str,
+    name: str,
+):
+    """
+    Open sink of passed format, file extension is the format name
+    :param output_format: One of FORMATS
+    :param name: File name without extension
+    :return:
+    """
+    path = f"{name}.{output_format}"
+    logging.info(f"Going to write observations to {path}")
+    if output_format == "jsonl":
+        return JsonlSink(path)
+    if output_format == "csv":
+        return CsvSink(path)
+    if output_format == "parquet":
+        return ParquetSink(path)
+    raise ValueError(f"Unknown output format - {output_format}")
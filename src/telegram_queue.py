@@ -0,0 +1,203 @@
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+import http_session
+import metrics
+import rate_limit
+
+TELEGRAM_API = "https://api.telegram.org/"
+
+# Telegram does not accept longer messages
+MESSAGE_LIMIT = 4096
+# Reports are packed into one message with blank line between them
+SEPARATOR = "\n"
+
+# Telegram allows about 20 messages a minute into one group chat
+CHAT_MESSAGES_PER_MINUTE = 20
+# Worker waits that long for more reports before sending what it has
+COALESCE_DELAY = 1.0
+SEND_RETRIES = 5
+
+# Logging
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    level=logging.INFO,
+)
+
+_STOP = object()
+
+
+def _split(
+    text: str,
+    limit: int,
+) -> List[str]:
+    if len(text) <= limit:
+        return [text]
+    parts = []
+    current = ""
+    for line in text.splitlines(keepends=True):
+        while len(line) > limit:
+            if current:
+                parts.append(current)
+                current = ""
+            parts.append(line[:limit])
+            line = line[limit:]
+        if len(current) + len(line) > limit:
+            parts.append(current)
+            current = ""
+        current += line
+    if current:
+        parts.append(current)
+    return parts
+
+
+def pack_messages(
+    texts: List[str],
+    limit: int = MESSAGE_LIMIT,
+) -> List[str]:
+    """
+    Pack reports into as few messages as possible, report longer than limit is split by lines
+    :param texts:
+    :param limit:
+    :return:
+    """
+    messages = []
+    current = ""
+    for text in texts:
+        for part in _split(text, limit):
+            if current and len(current) + len(SEPARATOR) + len(part) > limit:
+                messages.append(current)
+                current = part
+            else:
+                current = current + SEPARATOR + part if current else part
+    if current:
+        messages.append(current)
+    return messages
+
+
+class TelegramQueue:
+    """
+    Deliver reports to telegram chat from its own worker thread, so fetching never waits for telegram
+    Reports which are queued together are sent as one message
+    """
+
+    def __init__(
+        self,
+        bot_token: str,
+        chat_id: str,
+        coalesce_delay: float = COALESCE_DELAY,
+        limit: int = MESSAGE_LIMIT,
+        messages_per_minute: float = CHAT_MESSAGES_PER_MINUTE,
+    ):
+        """
+        :param bot_token:
+        :param chat_id:
+        :param coalesce_delay: Seconds to wait for more reports before sending
+        :param limit: Longest message
+        :param messages_per_minute: Part of chat flood limit which this queue may use
+        """
+        self.chat_id = chat_id
+        self.coalesce_delay = coalesce_delay
+        self.limit = limit
+        self.metrics: Dict[str, int] = defaultdict(int)
+        self._url = f"{TELEGRAM_API}bot{bot_token}/sendMessage"
+        self._chat_bucket = rate_limit.TokenBucket(f"telegram chat {chat_id}", messages_per_minute / 60, 1)
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="telegram", daemon=True)
+        self._worker.start()
+
+    def put(
+        self,
+        text: str,
+    ):
+        """
+        Queue report, it is sent in background
+        :param text:
+        :return:
+        """
+        self.metrics["reports"] += 1
+        self._queue.put(text)
+
+    def flush(self):
+        """
+        Wait until everything which is queued is sent
+        :return:
+        """
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._worker.join()
+
+    def _run(self):
+        # Report which did not fit into previous message starts the next one
+        carry = None
+        while True:
+            text = carry if carry is not None else self._queue.get()
+            carry = None
+            if text is _STOP:
+                self._queue.task_done()
+                return
+            texts = [text]
+            size = len(text)
+            deadline = time.monotonic() + self.coalesce_delay
+            while True:
+                try:
+                    text = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if text is _STOP or size + len(SEPARATOR) + len(text) > self.limit:
+                    carry = text
+                    break
+                texts.append(text)
+                size += len(SEPARATOR) + len(text)
+
+            for message in pack_messages(texts, self.limit):
+                self._send(message)
+            for _ in texts:
+                self._queue.task_done()
+
+    def _send(
+        self,
+        message: str,
+    ):
+        for attempt in range(SEND_RETRIES + 1):
+            self._chat_bucket.acquire()
+            try:
+                with metrics.timer("deliver", "telegram") as labels:
+                    response = http_session.post(
+                        self._url,
+                        json={
+                            "chat_id": self.chat_id,
+                            "text": message,
+                        },
+                    )
+                    labels["status"] = response.status_code
+            except BaseException as err:
+                logging.error(f"Base err while posting to telegram: {err}")
+                break
+            if response.status_code == 200:
+                self.metrics["messages"] += 1
+                logging.info(f"Sent: {response.reason}. Status code: {response.status_code}")
+                return
+            if response.status_code != 429 or attempt == SEND_RETRIES:
+                logging.error(f"Not sent: {response.reason}. Status code: {response.status_code}")
+                break
+            try:
+                retry_after = float(response.json()["parameters"]["retry_after"])
+            except (ValueError, KeyError, TypeError):
+                retry_after = http_session.backoff_delay(attempt, response.headers.get("Retry-After"))
+            self.metrics["retries"] += 1
+            logging.warning(f"Telegram flood limit, retry in {retry_after} seconds")
+            time.sleep(retry_after)
+        self.metrics["dropped"] += 1
+
+    def log_stats(self):
+        logging.info(
+            f"Telegram: reports {self.metrics['reports']}, messages {self.metrics['messages']}, "
+            f"retries {self.metrics['retries']}, dropped {self.metrics['dropped']}"
+        )
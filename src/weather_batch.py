@@ -0,0 +1,144 @@
+import csv
+import logging
+import threading
+from typing import Dict, List, Optional
+
+import requests
+
+import geo_cache
+import http_session
+
+# Weatherbit current endpoint accepts up to this many city ids in one request
+WEATHER_BATCH_SIZE = 100
+
+# Logging
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    level=logging.INFO,
+)
+
+# Weatherbit city id by city key, resolved once per run, None if city is not in weatherbit city list
+city_ids: Dict[str, Optional[int]] = {}
+
+# Weather data fetched in batch, waiting to be taken by city fetch
+prefetched: Dict[str, Dict[str, any]] = {}
+prefetched_lock = threading.Lock()
+
+
+def resolve_city_ids(
+    weatherbit_cities_file: str,
+    locations: Dict[str, Dict[str, any]],
+) -> Dict[str, int]:
+    """
+    Resolve weatherbit city ids by name & country code using city list exported from weatherbit
+    File is streamed, only ids of passed cities are kept in memory
+    Cities which are not found are remembered too, so the file is not read again for them
+    :param weatherbit_cities_file: CSV with city_id, city_name & country_code columns
+    :param locations: Location info by city key
+    :return: Ids of passed cities which were found
+    """
+    wanted = {}
+    for city_key, prepared_t_l_i in locations.items():
+        if city_key not in city_ids:
+            key = (geo_cache.normalize_city_name(prepared_t_l_i["city_name"]), prepared_t_l_i["country_code"].casefold())
+            wanted.setdefault(key, []).append(city_key)
+
+    # Misses are remembered only if the whole file is read, otherwise they are looked up again next time
+    complete = True
+    if wanted:
+        try:
+            with open(weatherbit_cities_file, "r", encoding="utf-8", newline="") as cities_file:
+                for row in csv.DictReader(cities_file):
+                    key = (geo_cache.normalize_city_name(row["city_name"]), row["country_code"].casefold())
+                    for city_key in wanted.pop(key, []):
+                        city_ids[city_key] = int(row["city_id"])
+                    if not wanted:
+                        break
+        except FileNotFoundError as file_not_found_err:
+            logging.error(f"Weatherbit city list is not found - {file_not_found_err}")
+            complete = False
+        except (KeyError, ValueError) as parse_err:
+            logging.error(f"Err while parsing weatherbit city list - {parse_err}")
+            complete = False
+
+    for city_keys in wanted.values():
+        for city_key in city_keys:
+            logging.warning(f"Weatherbit id of {city_key} is not found, it will be requested alone")
+            if complete:
+                city_ids[city_key] = None
+    return {city_key: city_ids[city_key] for city_key in locations if city_ids.get(city_key) is not None}
+
+
+def request_weather_info_batch(
+    weather_api: str,
+    api_key: str,
+    ids_by_city: Dict[str, int],
+    batch_size: int = WEATHER_BATCH_SIZE,
+) -> Dict[str, Dict[str, any]]:
+    """
+    Fetch current weather for many cities with as few requests as possible
+    Weatherbit answers in the same order as ids were passed, so results are scattered back by position
+    :param weather_api: weatherbit base URL
+    :param api_key:
+    :param ids_by_city: Weatherbit city id by city key
+    :param batch_size:
+    :return: Weather info by city key, cities which were not fetched are absent
+    """
+    results = {}
+    items = list(ids_by_city.items())
+    for start in range(0, len(items), batch_size):
+        chunk: List = items[start : start + batch_size]
+        ids = ",".join(str(city_id) for _, city_id in chunk)
+        try:
+            data = http_session.get(f"{weather_api}current?cities={ids}&key={api_key}").json()["data"]
+        except requests.exceptions.RequestException as req_ex:
+            logging.error(f"Err while request weather info batch from API - {req_ex}")
+            continue
+        except BaseException as base_err:
+            logging.error(f"Base err while request weather info batch from API - {base_err}")
+            continue
+        if len(data) != len(chunk):
+            logging.error(f"Weather info batch has {len(data)} results instead of {len(chunk)}, batch is dropped")
+            continue
+        for (city_key, _), weather_data in zip(chunk, data):
+            results[city_key] = weather_data
+    return results
+
+
+def prefetch(
+    weather_api: str,
+    api_key: str,
+    weatherbit_cities_file: str,
+    locations: Dict[str, Dict[str, any]],
+    batch_size: int = WEATHER_BATCH_SIZE,
+):
+    """
+    Fetch weather for passed cities in batches, then city fetch takes it instead of own request
+    :param weather_api:
+    :param api_key:
+    :param weatherbit_cities_file:
+    :param locations: Location info by city key
+    :param batch_size:
+    :return:
+    """
+    results = request_weather_info_batch(
+        weather_api,
+        api_key,
+        resolve_city_ids(weatherbit_cities_file, locations),
+        batch_size,
+    )
+    with prefetched_lock:
+        prefetched.update(results)
+    logging.info(f"Weather info about {len(results)} of {len(locations)} cities fetched in batches")
+
+
+def take(
+    city_key: str,
+) -> Optional[Dict[str, any]]:
+    """
+    Take prefetched weather info about city, None if there is no such
+    :param city_key:
+    :return:
+    """
+    with prefetched_lock:
+        return prefetched.pop(city_key, None)
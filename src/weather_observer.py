@@ -1,19 +1,32 @@
 import argparse
+import functools
 import logging
 import os
 import sys
 import time
 from datetime import datetime
-from typing import Dict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 
 import requests
-import requests as rq
-from geopy.adapters import AdapterHTTPError
-from geopy.geocoders import Nominatim
-from timezonefinder import TimezoneFinder
 
-import calculations
+import geo_cache
 import get_info
+import history
+import http_session
+import metrics
+import pipeline
+import profiler
+import rate_limit
+import report
+import report_writer
+import response_cache
+import scheduler
+import server
+import sharding
+import single_flight
+import structured_output
+import telegram_queue
+import weather_batch
 
 # Logging
 logging.basicConfig(format="%(asctime)s - %(levelname)s - %(message)s", level=logging.INFO)
@@ -25,19 +38,11 @@ logging.basicConfig(format="%(asctime)s - %(levelname)s - %(message)s", level=lo
 REPORT_NAME = "weather_report_"
 REPORT_FORMAT = ".md"
 
-# Time when program execution started
-start_time = time.time()
-
 WEATHER_API = "https://api.weatherbit.io/v2.0/"
 
 
 report_time = datetime.now().strftime("%d.%m.%Y_%H.%M.%S")
 
-# Conversion for pressure
-KPA = 0.1  # Kilo Pascal
-MMHG = 0.750062  # Millimeter of mercury
-
-
 # required_values = [
 #     "wind direction",
 #     "relative humidity",
@@ -136,11 +141,267 @@ def get_args():
         help="Send messages about processing",
     )
 
+    root_parser.add_argument(
+        "--geocoding-cache-ttl",
+        dest="geocoding_cache_ttl",
+        type=float,
+        help="Hours after which cached location of the city is resolved again, never expire if not passed",
+    )
+
+    root_parser.add_argument(
+        "--warm-up-cache",
+        dest="warm_up_cache",
+        action=argparse.BooleanOptionalAction,
+        help="Resolve location of every city from the file into geocoding cache and exit",
+    )
+
+    root_parser.add_argument(
+        "--timezone-in-memory",
+        dest="timezone_in_memory",
+        action=argparse.BooleanOptionalAction,
+        help="Load timezone polygon data into memory, faster lookups for large city lists",
+    )
+
+    root_parser.add_argument(
+        "--workers",
+        dest="workers",
+        type=int,
+        default=pipeline.CITY_WORKERS,
+        help="How many cities are fetched in parallel",
+    )
+
+    root_parser.add_argument(
+        "--engine",
+        dest="engine",
+        choices=["threads", "async"],
+        default="threads",
+        help="Fetch with worker threads or with asyncio & httpx in one event loop",
+    )
+
+    root_parser.add_argument(
+        "--http-timeout",
+        dest="http_timeout",
+        type=float,
+        default=http_session.READ_TIMEOUT,
+        help="Seconds to wait for provider answer",
+    )
+
+    root_parser.add_argument(
+        "--http-retries",
+        dest="http_retries",
+        type=int,
+        default=http_session.RETRIES,
+        help="How many times request is sent again on rate limit, server or connection error",
+    )
+
+    root_parser.add_argument(
+        "--weatherbit-cities",
+        dest="weatherbit_cities",
+        type=str,
+        help="Path to city list exported from weatherbit, if passed weather is fetched in batches by city id",
+    )
+
+    root_parser.add_argument(
+        "--weather-batch-size",
+        dest="weather_batch_size",
+        type=int,
+        default=weather_batch.WEATHER_BATCH_SIZE,
+        help="How many cities are fetched from weatherbit in one request",
+    )
+
+    root_parser.add_argument(
+        "--cache-ttl",
+        dest="cache_ttl",
+        type=float,
+        default=response_cache.TTL,
+        help="Seconds while weather & Gismeteo responses are served from cache",
+    )
+
+    root_parser.add_argument(
+        "--cache-stale-ttl",
+        dest="cache_stale_ttl",
+        type=float,
+        default=response_cache.STALE_TTL,
+        help="Seconds after TTL while expired response is served and refreshed in background",
+    )
+
+    root_parser.add_argument(
+        "--cache-size",
+        dest="cache_size",
+        type=int,
+        default=response_cache.MAX_SIZE,
+        help="How many responses of every provider are kept in cache",
+    )
+
+    root_parser.add_argument(
+        "--flush-every",
+        dest="flush_every",
+        type=int,
+        default=report_writer.FLUSH_EVERY,
+        help="Report is written to disk after that many cities",
+    )
+
+    root_parser.add_argument(
+        "--report-gzip",
+        dest="report_gzip",
+        action=argparse.BooleanOptionalAction,
+        help="Compress report file with gzip",
+    )
+
+    root_parser.add_argument(
+        "--report-max-size",
+        dest="report_max_size",
+        type=float,
+        help="Megabytes after which report continues in the next file",
+    )
+
+    root_parser.add_argument(
+        "--format",
+        dest="format",
+        choices=["markdown"] + structured_output.FORMATS,
+        default="markdown",
+        help="Format of report file, structured formats have one row per city observation",
+    )
+
+    root_parser.add_argument(
+        "--history",
+        dest="history",
+        action=argparse.BooleanOptionalAction,
+        help="Save every observation into local history",
+    )
+
+    root_parser.add_argument(
+        "--history-query",
+        dest="history_query",
+        type=str,
+        help="Print observations about passed city from local history and exit, city is like a line of cities file",
+    )
+
+    root_parser.add_argument(
+        "--history-metric",
+        dest="history_metric",
+        choices=history.METRICS,
+        default="temp",
+        help="Which value to print from local history",
+    )
+
+    root_parser.add_argument(
+        "--history-bucket",
+        dest="history_bucket",
+        choices=list(history.BUCKETS),
+        default="hour",
+        help="Downsample history by hour or day",
+    )
+
+    root_parser.add_argument(
+        "--history-days",
+        dest="history_days",
+        type=float,
+        default=7,
+        help="How many last days of history to print",
+    )
+
+    root_parser.add_argument(
+        "--weatherbit-daily-budget",
+        dest="weatherbit_daily_budget",
+        type=int,
+        help="How many weatherbit requests a day the plan allows, cached weather is reported when it runs low",
+    )
+
+    root_parser.add_argument(
+        "--ipinfo-daily-budget",
+        dest="ipinfo_daily_budget",
+        type=int,
+        help="How many ipinfo requests a day the plan allows",
+    )
+
+    root_parser.add_argument(
+        "--serve",
+        dest="serve",
+        action=argparse.BooleanOptionalAction,
+        help="Keep running and answer weather about city on GET /weather?city=...",
+    )
+
+    root_parser.add_argument(
+        "--host",
+        dest="host",
+        type=str,
+        default=server.HOST,
+        help="Address to serve on",
+    )
+
+    root_parser.add_argument(
+        "--port",
+        dest="port",
+        type=int,
+        default=server.PORT,
+        help="Port to serve on",
+    )
+
+    root_parser.add_argument(
+        "--metrics-port",
+        dest="metrics_port",
+        type=int,
+        help="Serve timings of every stage for Prometheus on /metrics at that port",
+    )
+
+    root_parser.add_argument(
+        "--profile",
+        dest="profile",
+        nargs="?",
+        const="cprofile",
+        choices=profiler.MODES,
+        help="Profile the run with cProfile or by sampling stacks, profile is written next to the report",
+    )
+
+    root_parser.add_argument(
+        "--processes",
+        dest="processes",
+        type=int,
+        default=1,
+        help="Split cities between that many worker processes by stable hash, this process reports what they fetch",
+    )
+
+    root_parser.add_argument(
+        "--shard",
+        dest="shard",
+        type=sharding.parse_shard,
+        help="Report only about shard i of N cities, like 0/2, to run several containers on one cities file",
+    )
+
     return root_parser
 
 
-# Shortening
-namespace = get_args().parse_args(sys.argv[1:])
+# Shortening, parsed in main
+namespace = None
+
+# Cities loaded from file by city key, country & coordinates are used to locate city
+city_entries: Dict[str, get_info.CityEntry] = {}
+
+
+def get_geocoding_cache() -> geo_cache.GeocodingCache:
+    """
+    Geocoding cache shared with get_info, TTL is taken from CLI
+    :return:
+    """
+    cache = geo_cache.get_default_cache()
+    cache.ttl = namespace.geocoding_cache_ttl * 3600 if namespace.geocoding_cache_ttl is not None else None
+    return cache
+
+
+def warm_up_geocoding_cache():
+    """
+    Resolve every city from the file, so next runs need no geocoder calls at all
+    Geocoder is called only for cities which are not cached yet, rate limit of Nominatim is kept by rate_limit
+    :return:
+    """
+    cache = get_geocoding_cache()
+    for entry in get_info.load_cities_from_file():
+        if entry.latitude is not None or cache.get(location_query(entry.name, entry.country)) is not None:
+            continue
+        logging.info(f"Resolving location of {entry.name}...")
+        if prepare_target_location_info(entry.name, entry.country) is None:
+            logging.error(f"Location of {entry.name} was not resolved")
 
 
 def request_weather_info(
@@ -149,13 +410,18 @@ def request_weather_info(
 ) -> Dict[str, any]:
     """
     Send GET request to weatherbit resource fetching info about weather about transferred countries & cities
+    The same city requested meanwhile waits for this request
     :param country_code:
     :param city_name:
     :return:
     """
     try:
-        r = requests.get(f"{WEATHER_API}current?city={city_name}&country={country_code}&key={namespace.apikey}")
-        return r.json()["data"][0]
+        return single_flight.get_group("weatherbit").do(
+            (country_code, geo_cache.normalize_city_name(city_name)),
+            lambda: http_session.get(
+                f"{WEATHER_API}current?city={city_name}&country={country_code}&key={namespace.apikey}"
+            ).json()["data"][0],
+        )
     except requests.exceptions.RequestException as req_ex:
         logging.error(f"Err while request weather info from API - {req_ex}")
         return None
@@ -164,298 +430,210 @@ def request_weather_info(
         return None
 
 
-def prepare_weather_data(
-    country_code: str,
-    city_name: str,
+def clean_weather_data(
+    result: Dict[str, any],
 ) -> Dict[str, any]:
     """
-    Prepare weather information to better writing into report file
-    :param country_code:
-    :param city_name:
+    Drop values which are not needed in report
+    :param result: Weather info from API
     :return:
     """
-
-    result = request_weather_info(
-        country_code,
-        city_name,
-    )
-
+    if result is None:
+        return None
+    # Response may be cached, so it is not changed in place
+    result = dict(result)
     for v in VALUES_TO_DELETE:
         try:
             del result[v]
         except KeyError as key_err:
             logging.error(f"Key Err while deleting values - {key_err}")
             continue
-        except BaseException as base_err:
-            logging.error(f"Base Err while deleting values - {base_err}")
-            continue
-        return result
+    return result
 
 
-def report_to_console(
-    weather_data: dict,
+def prepare_weather_data(
+    country_code: str,
     city_name: str,
-    timezone_by_city: str,
-    country_name: str,
-    elevation: int,
-    water_temp: float,
-    geomagnetic_field: int,
-):
+) -> Dict[str, any]:
     """
-    Report info about weather to console
-    :param weather_data:
+    Prepare weather information to better writing into report file
+    Response is served from cache while it is fresh
+    :param country_code:
     :param city_name:
-    :param timezone_by_city:
-    :param country_name:
-    :param elevation:
-    :param water_temp:
-    :param geomagnetic_field:
     :return:
     """
-    print()
-    print(f"Country: {country_name} | City name: {city_name.capitalize()}")
-    print(f"Timezone: {timezone_by_city}")
-    print(f"Time: {get_info.get_time_by_timezone(timezone_name=timezone_by_city)}")
-    print()
-    print(f"Part of a day: {weather_data['pod']}")
-    print(f"Elevation above sea level: {elevation} m")
-    print(f"Geomagnetic field: {geomagnetic_field} - {calculations.calculate_kp_level(geomagnetic_field).capitalize()}")
-    print()
-    print(
-        f"Pressure: {round(weather_data['pres'], 2)} mb "
-        f"| {round(weather_data['pres'] * MMHG, 2)} mmHg "
-        f"| {round(weather_data['pres'] * KPA, 2)} kPa"
-    )
-    print(
-        f"Sea level pressure: {round(weather_data['slp'], 2)} mb "
-        f"| {round(weather_data['slp'] * MMHG, 2)} mmHg "
-        f"| {round(weather_data['slp'] * KPA, 2)} kPa"
-    )
-    print()
-    print(f"Wind speed: {weather_data['wind_spd']} m/s")
-    print(f"Wind direction: {weather_data['wind_cdir']}")
-    print(f"Relative humidity: {weather_data['rh']}%")
-    print(f"Cloud percents: {weather_data['clouds']}%")
-    print(f"Solar radiation: {weather_data['solar_rad']} Watt/m^2")
-    print(f"Snowfall: {weather_data['snow']} mm/hr")
-    print()
-    print(
-        f"UV (UltraViolet): {weather_data['uv']} - "
-        f"{calculations.calculate_uv_level(round(weather_data['uv'], 1)).capitalize()}"
-    )
-    print(
-        f"AQI (Air Quality Index): {weather_data['aqi']} - "
-        f"{calculations.calculate_aqi_level(weather_data['aqi']).capitalize()}"
-    )
-    print()
-    print(
-        f"Temperature: {weather_data['temp']} C "
-        f"| {round(calculations.celsius_to_fahrenheit(weather_data['temp']), 1)} F "
-        f"| {round(calculations.celsius_to_kelvin(weather_data['temp']), 1)} K"
-    )
-    print(
-        f"Apparent temperature: {weather_data['app_temp']} C "
-        f"| {round(calculations.celsius_to_fahrenheit(weather_data['app_temp']), 1)} F "
-        f"| {round(calculations.celsius_to_kelvin(weather_data['app_temp']), 1)} K "
-    )
-    print(
-        f"Water temperature: {water_temp} C "
-        f"| {round(calculations.celsius_to_fahrenheit(water_temp), 1)} F "
-        f"| {round(calculations.celsius_to_kelvin(water_temp), 1)} K  "
+    return clean_weather_data(
+        response_cache.get_cache("weatherbit").get_or_fetch(
+            (country_code, city_name),
+            lambda: request_weather_info(
+                country_code,
+                city_name,
+            ),
+        )
     )
-    input("Enter any key to escape...")
 
 
-def report_to_telegram(
-    weather_data: dict,
-    city_name: str,
-    timezone_by_city: str,
-    country_name: str,
-    elevation: int,
-    water_temp: float,
-    geomagnetic_field: int,
+def report_to_console(
+    weather_report: report.WeatherReport,
 ):
     """
-    Report info about weather to telegram
-    :param weather_data:
-    :param city_name:
-    :param timezone_by_city:
-    :param country_name:
-    :param elevation:
-    :param water_temp:
-    :param geomagnetic_field:
+    Report info about weather to console
+    :param weather_report:
     :return:
     """
-    try:
-        TELEGRAM_BOT_TOKEN = os.environ["TELEGRAM_BOT_TOKEN"]
-        TELEGRAM_API_URL = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-        TELEGRAM_CHAT_ID = os.environ["TELEGRAM_CHAT_ID"]
-        logging.info(f"Report about {city_name} in {country_name} !")
+    with metrics.timer("render", "console"):
+        text = report.render_console(weather_report)
+    print(text)
+    input("Enter any key to escape...")
+
+
+telegram_queue_instance = None
+
+
+def get_telegram_queue() -> Optional[telegram_queue.TelegramQueue]:
+    """
+    Start telegram delivery worker once per run
+    Containers of other shards send to the same chat, so flood limit is split between shards
+    :return: None if telegram environment variables are not set
+    """
+    global telegram_queue_instance
+    if telegram_queue_instance is None:
+        shards = namespace.shard[1] if namespace.shard is not None else 1
         try:
-            response = rq.post(
-                TELEGRAM_API_URL,
-                json={
-                    "chat_id": TELEGRAM_CHAT_ID,
-                    "text": f"Country: #{country_name} | City name: #{city_name.capitalize()}"
-                    f"\n"
-                    f"Timezone: {timezone_by_city}"
-                    f"\n"
-                    f"Time: {get_info.get_time_by_timezone(timezone_name=timezone_by_city)}"
-                    f"\n"
-                    f"\n"
-                    f"Part of a day: {weather_data['pod']}"
-                    f"\n"
-                    f"Elevation under sea level: {elevation} m"
-                    f"\n"
-                    f"Geomagnetic field: {geomagnetic_field} - "
-                    f"{calculations.calculate_kp_level(geomagnetic_field).capitalize()}"
-                    f"\n"
-                    f"\n"
-                    f"Pressure: {round(weather_data['pres'], 2)} mb "
-                    f"| {round(weather_data['pres']*MMHG,2)} mmHg "
-                    f"| {round(weather_data['pres']*KPA, 2)} kPa"
-                    f"\n"
-                    f"Sea level pressure: {round(weather_data['slp'],2)} mb "
-                    f"| {round(weather_data['slp'] * MMHG, 2)} mmHg "
-                    f"| {round(weather_data['slp'] * KPA, 2)} kPa"
-                    f"\n"
-                    f"\n"
-                    f"Wind speed: {weather_data['wind_spd']} m/s"
-                    f"\n"
-                    f"Wind direction: {weather_data['wind_cdir']}"
-                    f"\n"
-                    f"Relative humidity: {weather_data['rh']}%"
-                    f"\n"
-                    f"Cloud percents: {weather_data['clouds']}%"
-                    f"\n"
-                    f"Solar radiation: {weather_data['solar_rad']} Watt/m^2"
-                    f"\n"
-                    f"Snowfall: {weather_data['snow']} mm/hr\n"
-                    f"\n"
-                    f"\n"
-                    f"UV (UltraViolet): {weather_data['uv']} - "
-                    f"{calculations.calculate_uv_level(round(weather_data['uv'], 1)).capitalize()}"
-                    f"\n"
-                    f"AQI (Air Quality Index): {weather_data['aqi']} - "
-                    f"{calculations.calculate_aqi_level(weather_data['aqi']).capitalize()}"
-                    f"\n"
-                    f"\n"
-                    f"Temperature: {weather_data['temp']} C "
-                    f"| {round(calculations.celsius_to_fahrenheit(weather_data['temp']), 1)} F "
-                    f"| {round(calculations.celsius_to_kelvin(weather_data['temp']), 1)} K"
-                    f"\n"
-                    f"Apparent temperature: {weather_data['app_temp']} C "
-                    f"| {round(calculations.celsius_to_fahrenheit(weather_data['app_temp']), 1)} F "
-                    f"| {round(calculations.celsius_to_kelvin(weather_data['app_temp']), 1)} K "
-                    f"\n"
-                    f"Water temperature: {water_temp} C "
-                    f"| {round(calculations.celsius_to_fahrenheit(water_temp), 1)} F "
-                    f"| {round(calculations.celsius_to_kelvin(water_temp), 1)} K  "
-                    f"\n",
-                },
+            telegram_queue_instance = telegram_queue.TelegramQueue(
+                bot_token=os.environ["TELEGRAM_BOT_TOKEN"],
+                chat_id=os.environ["TELEGRAM_CHAT_ID"],
+                messages_per_minute=telegram_queue.CHAT_MESSAGES_PER_MINUTE / shards,
             )
-            if response.status_code == 200:
-                logging.info(f"Sent: {response.reason}. Status code: {response.status_code}")
-            else:
-                logging.error(f"Not sent: {response.reason}. Status code: {response.status_code}")
         except KeyError as key_err:
-            logging.error(f"Err while post to telegram: {key_err}")
-    except KeyError as key_err:
-        logging.error(f"Err while loading telegram environment variable: {key_err}")
-    except BaseException as err:
-        logging.error(f"Base err while loading telegram environment variable: {err}")
+            logging.error(f"Err while loading telegram environment variable: {key_err}")
+            return None
+    return telegram_queue_instance
+
+
+def report_to_telegram(
+    weather_report: report.WeatherReport,
+):
+    """
+    Queue report about weather to telegram, it is sent in background while next cities are fetched
+    :param weather_report:
+    :return:
+    """
+    delivery = get_telegram_queue()
+    if delivery is None:
+        return
+    logging.info(f"Report about {weather_report.city_name} in {weather_report.country_name} !")
+    with metrics.timer("render", "telegram"):
+        text = report.render_telegram(weather_report)
+    delivery.put(text)
+
+
+report_writer_instance = None
+
+
+def get_report_writer(
+    report_time: str,
+) -> report_writer.ReportWriter:
+    """
+    Open report file writer once per run
+    :param report_time:
+    :return:
+    """
+    global report_writer_instance
+    if report_writer_instance is None:
+        report_writer_instance = report_writer.ReportWriter(
+            f"{REPORT_NAME}{report_time}",
+            REPORT_FORMAT,
+            flush_every=namespace.flush_every,
+            compress=bool(namespace.report_gzip),
+            max_bytes=int(namespace.report_max_size * 1024 * 1024) if namespace.report_max_size else None,
+        )
+    return report_writer_instance
+
+
+observations_sink = None
+
+
+def get_observations_sink():
+    """
+    Open sink of structured format once per run
+    :return:
+    """
+    global observations_sink
+    if observations_sink is None:
+        observations_sink = structured_output.open_sink(namespace.format, f"{REPORT_NAME}{report_time}")
+    return observations_sink
+
+
+history_store = None
+
+
+def get_history_store() -> history.HistoryStore:
+    """
+    Open history of observations once per run
+    :return:
+    """
+    global history_store
+    if history_store is None:
+        history_store = history.HistoryStore(history.HISTORY_FILE)
+    return history_store
+
+
+def flush_outputs():
+    """
+    Flush everything which is written during the run
+    :return:
+    """
+    for output in (report_writer_instance, observations_sink, history_store):
+        if output is not None:
+            output.flush()
+
+
+def close_outputs():
+    for output in (report_writer_instance, observations_sink, history_store, telegram_queue_instance):
+        if output is not None:
+            output.close()
+    response_cache.close()
+
+
+def print_history():
+    """
+    Print observations about city downsampled by hour or day
+    :return:
+    """
+    since = time.time() - namespace.history_days * 86400
+    entry = get_info.parse_city_line(namespace.history_query)
+    rows = get_history_store().downsample(
+        entry.key if entry is not None else namespace.history_query,
+        metric=namespace.history_metric,
+        bucket=namespace.history_bucket,
+        since=since,
+    )
+    print(f"{namespace.history_metric} in {namespace.history_query.capitalize()} by {namespace.history_bucket}:")
+    for row in rows:
+        bucket_start = datetime.utcfromtimestamp(row["bucket"]).strftime("%Y-%m-%d %H:%M")
+        print(
+            f"{bucket_start} UTC | min {row['min']} | max {row['max']} "
+            f"| mean {round(row['mean'], 2) if row['mean'] is not None else None} | observations {row['count']}"
+        )
 
 
 def report_to_file(
     report_time: str,
-    weather_data: dict,
-    city_name: str,
-    timezone_by_city: str,
-    country_name: str,
-    elevation: int,
-    water_temp: float,
-    geomagnetic_field: int,
+    weather_report: report.WeatherReport,
 ):
     """
     Report info about weather to file with timestamp
     :param report_time:
-    :param weather_data:
-    :param city_name:
-    :param timezone_by_city:
-    :param country_name:
-    :param elevation:
-    :param water_temp:
-    :param geomagnetic_field:
+    :param weather_report:
     :return:
     """
-    with open(
-        f"{REPORT_NAME}{report_time}{REPORT_FORMAT}",
-        "a",
-        encoding="utf-8",
-    ) as report:
-        if namespace.verbosity:
-            print(f"Gathering info about {city_name.capitalize()} in {country_name}...")
-        report.write(f"## Country: {country_name} | City name: {city_name.capitalize()}  \n")
-        report.write(f"### Timezone: {timezone_by_city}  \n")
-        report.write(f"**Elevation under sea level:** {elevation} m  \n")
-        report.write(
-            f"Geomagnetic field: {geomagnetic_field} - {calculations.calculate_kp_level(geomagnetic_field).capitalize()}  \n"
-        )
-        report.write(f"Country: {country_name} | City name: {city_name.capitalize()}  \n")
-        report.write(f"Timezone: {timezone_by_city}  \n")
-        report.write(f"Time: {get_info.get_time_by_timezone(timezone_name=timezone_by_city)}  \n")
-        report.write("\n")
-        report.write(f"Part of a day: {weather_data['pod']}  \n")
-        report.write(f"Elevation above sea level: {elevation} m  \n")
-        report.write(
-            f"Geomagnetic field: {geomagnetic_field} - {calculations.calculate_kp_level(geomagnetic_field).capitalize()}  \n"
-        )
-        report.write("\n")
-        report.write(
-            f"Pressure: {round(weather_data['pres'], 2)} mb "
-            f"| {round(weather_data['pres'] * MMHG, 2)} mmHg "
-            f"| {round(weather_data['pres'] * KPA, 2)} kPa  \n"
-        )
-        report.write(
-            f"Sea level pressure: {round(weather_data['slp'], 2)} mb "
-            f"| {round(weather_data['slp'] * MMHG, 2)} mmHg "
-            f"| {round(weather_data['slp'] * KPA, 2)} kPa  \n"
-        )
-        report.write("\n")
-        report.write(f"Wind speed: {weather_data['wind_spd']} m/s  \n")
-        report.write(f"Wind direction: {weather_data['wind_cdir']}  \n")
-        report.write(f"Relative humidity: {weather_data['rh']}%  \n")
-        report.write(f"Cloud percents: {weather_data['clouds']}%  \n")
-        report.write(f"**Solar radiation**: {weather_data['solar_rad']} Watt/m^2  \n")
-        report.write(f"Snowfall: {weather_data['snow']} mm/hr  \n")
-        report.write("\n")
-        report.write(
-            f"UV (UltraViolet): {weather_data['uv']} - "
-            f"{calculations.calculate_uv_level(round(weather_data['uv'], 1)).capitalize()}  \n"
-        )
-        report.write(
-            f"AQI (Air Quality Index): {weather_data['aqi']} - "
-            f"{calculations.calculate_aqi_level(weather_data['aqi']).capitalize()}  \n"
-        )
-        report.write("\n")
-        report.write(
-            f"**Temperature**: {weather_data['temp']} C "
-            f"| {round(calculations.celsius_to_fahrenheit(weather_data['temp']), 1)} F "
-            f"| {round(calculations.celsius_to_kelvin(weather_data['temp']), 1)} K  \n"
-        )
-        report.write(
-            f"**Apparent temperature**: {weather_data['app_temp']} C "
-            f"| {round(calculations.celsius_to_fahrenheit(weather_data['app_temp']), 1)} F "
-            f"| {round(calculations.celsius_to_kelvin(weather_data['app_temp']), 1)} K  \n"
-        )
-        report.write(
-            f"**Water temperature**: {water_temp} C "
-            f"| {round(calculations.celsius_to_fahrenheit(water_temp), 1)} F "
-            f"| {round(calculations.celsius_to_kelvin(water_temp), 1)} K  \n"
-        )
-        if namespace.verbosity:
-            print("--- %s seconds ---" % (time.time() - start_time))
-        report.write("\n")
+    if namespace.verbosity:
+        print(f"Gathering info about {weather_report.city_name} in {weather_report.country_name}...")
+    with metrics.timer("render", "file"):
+        text = report.render_file(weather_report)
+    with metrics.timer("deliver", "file"):
+        get_report_writer(report_time).write(text)
 
 
 def report_weather_info(
@@ -483,60 +661,88 @@ def report_weather_info(
     :param geomagnetic_field:
     :return:
     """
+    if weather_data is None:
+        logging.error(f"Skip {city_name}, weather info is not available")
+        return
+
+    weather_report = report.WeatherReport(
+        weather_data,
+        city_name,
+        timezone_by_city,
+        country_name,
+        elevation,
+        water_temp,
+        geomagnetic_field,
+    )
     if namespace.outfile:
-        report_to_file(
-            report_time,
-            weather_data,
-            city_name,
-            timezone_by_city,
-            country_name,
-            elevation,
-            water_temp,
-            geomagnetic_field,
-        )
+        report_to_file(report_time, weather_report)
     elif namespace.telegram:
-        report_to_telegram(
-            weather_data,
-            city_name,
-            timezone_by_city,
-            country_name,
-            elevation,
-            water_temp,
-            geomagnetic_field,
-        )
+        report_to_telegram(weather_report)
     else:
-        report_to_console(
-            weather_data,
-            city_name,
-            timezone_by_city,
-            country_name,
-            elevation,
-            water_temp,
-            geomagnetic_field,
-        )
+        report_to_console(weather_report)
+
+
+def location_query(
+    city_name: str,
+    country: Optional[str] = None,
+) -> str:
+    """
+    Geocoder query & geocoding cache key, country tells apart cities with the same name
+    :param city_name:
+    :param country:
+    :return:
+    """
+    return f"{city_name}, {country}" if country else city_name
 
 
 def prepare_target_location_info(
     city_name: str,
+    country: Optional[str] = None,
 ) -> Dict[str, any]:
     """
     Prepare info such as country name, country code, city name and timezone for target city
+    The same city resolved meanwhile waits for one geocoder call
     :param city_name:
+    :param country: Country from cities file, optional
+    :return:
+    """
+    query = location_query(city_name, country)
+    cached = get_geocoding_cache().get(query)
+    if cached is not None:
+        return cached
+    return single_flight.get_group("nominatim").do(
+        geo_cache.normalize_city_name(query),
+        lambda: geocode_target_location(query),
+    )
+
+
+def geocode_target_location(
+    query: str,
+) -> Dict[str, any]:
+    """
+    Resolve target city with geocoder and save it into geocoding cache
+    :param query: City name, with country if it is known
     :return:
     """
+    from geopy.adapters import AdapterHTTPError
+    from geopy.geocoders import Nominatim
+
     try:
         geolocator = Nominatim(user_agent="geoapiExercises")
-        location = geolocator.geocode(city_name)
+        rate_limit.acquire("nominatim")
+        with metrics.timer("geocode", "nominatim"):
+            location = geolocator.geocode(query)
         longitude = str(location.longitude)
         latitude = str(location.latitude)
 
-        obj = TimezoneFinder()
-        timezone_by_city = obj.timezone_at(
-            lng=location.longitude,
-            lat=location.latitude,
+        timezone_by_city = get_info.get_timezone_by_ll(
+            latitude=location.latitude,
+            longitude=location.longitude,
         )
 
-        loc_ad = geolocator.reverse(latitude + "," + longitude)
+        rate_limit.acquire("nominatim")
+        with metrics.timer("geocode", "nominatim"):
+            loc_ad = geolocator.reverse(latitude + "," + longitude)
         full_address_by_ll = loc_ad.raw["address"]
 
         country_code = full_address_by_ll.get(
@@ -548,14 +754,15 @@ def prepare_target_location_info(
             "",
         )
 
-        return {
-            "location": location,
+        prepared_t_l_i = {
             "longitude": longitude,
             "latitude": latitude,
             "country_name": country_name,
             "country_code": country_code,
             "timezone_by_city": timezone_by_city,
         }
+        get_geocoding_cache().put(query, prepared_t_l_i)
+        return prepared_t_l_i
     except AdapterHTTPError as adapter_http_err:
         logging.error(f"Adapter HTTP Err while preparing info about target location - {adapter_http_err}")
         return None
@@ -564,117 +771,639 @@ def prepare_target_location_info(
         return None
 
 
-def main():
+def location_from_coordinates(
+    entry: get_info.CityEntry,
+) -> Dict[str, any]:
+    """
+    Build location info from coordinates given in cities file, geocoder is not called
+    :param entry:
+    :return:
+    """
+    country = entry.country or ""
+    return {
+        "longitude": str(entry.longitude),
+        "latitude": str(entry.latitude),
+        "country_name": country,
+        "country_code": country.lower() if len(country) == 2 else "",
+        "timezone_by_city": get_info.get_timezone_by_ll(
+            latitude=entry.latitude,
+            longitude=entry.longitude,
+        ),
+    }
+
+
+def locate_city(
+    city_key: str,
+) -> Dict[str, any]:
+    """
+    Location info about city, taken from coordinates in cities file if they are given
+    City name & key are kept in location info, because city key may have country & coordinates in it
+    :param city_key: Key of city from cities file or city name
+    :return:
+    """
+    entry = city_entries.get(city_key)
+    if entry is None:
+        prepared_t_l_i = prepare_target_location_info(city_key)
+        city_name = city_key
+    elif entry.latitude is not None:
+        prepared_t_l_i = location_from_coordinates(entry)
+        city_name = entry.name
+    else:
+        prepared_t_l_i = prepare_target_location_info(entry.name, entry.country)
+        city_name = entry.name
+    if prepared_t_l_i is None:
+        return None
+    return {**prepared_t_l_i, "city_name": city_name, "city_key": city_key}
+
+
+def fetch_weather_data(
+    city_key: str,
+    prepared_t_l_i: Dict[str, any],
+) -> Dict[str, any]:
+    weather_data = weather_batch.take(city_key)
+    if weather_data is not None:
+        return {"weather_data": clean_weather_data(weather_data)}
+    return {
+        "weather_data": prepare_weather_data(
+            prepared_t_l_i["country_name"],
+            prepared_t_l_i["city_name"],
+        )
+    }
+
+
+def fetch_elevation(
+    city_name: str,
+    prepared_t_l_i: Dict[str, any],
+) -> Dict[str, any]:
+    return {
+        "elevation": get_info.get_elevation_by_ll(
+            latitude=prepared_t_l_i["latitude"],
+            longitude=prepared_t_l_i["longitude"],
+        )
+    }
+
+
+def fetch_water_temp_and_geomagnetic_field(
+    city_name: str,
+    prepared_t_l_i: Dict[str, any],
+) -> Dict[str, any]:
+    water_temp, geomagnetic_field = get_info.get_water_temp_and_geomagnetic_field_by_ll(
+        latitude=float(prepared_t_l_i["latitude"]),
+        longitude=float(prepared_t_l_i["longitude"]),
+    )
+    return {
+        "water_temp": water_temp,
+        "geomagnetic_field": geomagnetic_field,
+    }
+
+
+def create_fetch_pipeline() -> pipeline.FetchPipeline:
+    """
+    Create pipeline which calls every provider needed for city report
+    :return:
+    """
+    return pipeline.FetchPipeline(
+        locate=("nominatim", locate_city),
+        fetchers={
+            "weather_data": ("weatherbit", fetch_weather_data),
+            "elevation": ("open-elevation", fetch_elevation),
+            "gismeteo": ("gismeteo", fetch_water_temp_and_geomagnetic_field),
+        },
+        workers=namespace.workers,
+    )
+
+
+def report_record(
+    record: Dict[str, any],
+):
+    """
+    Report record assembled by fetch pipeline
+    :param record:
+    :return:
+    """
+    structured = namespace.outfile and namespace.format != "markdown"
+    if structured or namespace.history:
+        row = structured_output.record_to_row(record)
+        if namespace.history:
+            get_history_store().add(row, record.get("city_key"))
+        if structured:
+            with metrics.timer("deliver", namespace.format):
+                get_observations_sink().write(row)
+            return
+    report_weather_info(
+        report_time=report_time,
+        weather_data=record["weather_data"],
+        city_name=record["city_name"],
+        timezone_by_city=record["timezone_by_city"],
+        country_name=record["country_name"],
+        elevation=record["elevation"],
+        water_temp=record["water_temp"],
+        geomagnetic_field=record["geomagnetic_field"],
+    )
+
+
+def remember_cities(
+    entries: Iterable[get_info.CityEntry],
+) -> List[str]:
+    """
+    Remember cities loaded from file, so they are located by their country & coordinates
+    :param entries:
+    :return: City keys
+    """
+    cities = []
+    for entry in entries:
+        city_entries[entry.key] = entry
+        cities.append(entry.key)
+    return cities
+
+
+def reload_cities(
+    cities_watcher: Optional[get_info.CitiesWatcher],
+    locations: Dict[str, Dict[str, any]],
+    report_scheduler: scheduler.ReportScheduler,
+    resolve: Callable[[List[str]], Dict[str, Dict[str, any]]] = None,
+):
+    """
+    Apply changes of cities file to the running schedule
+    :param cities_watcher: None if cities are not loaded from file
+    :param locations: Location info by city key, changed in place
+    :param report_scheduler:
+    :param resolve: Function which resolves locations of added cities, resolve_locations if not passed
+    :return:
+    """
+    if cities_watcher is None:
+        return
+    added, removed = cities_watcher.poll()
+    for entry in removed:
+        city_entries.pop(entry.key, None)
+        locations.pop(entry.key, None)
+        report_scheduler.remove_city(entry.key)
+    added = [entry for entry in added if in_shard(entry.key)]
+    for city_key, prepared_t_l_i in (resolve or resolve_locations)(remember_cities(added)).items():
+        if report_scheduler.add_city(city_key, prepared_t_l_i["timezone_by_city"]):
+            locations[city_key] = prepared_t_l_i
+
+
+def in_shard(
+    city_key: str,
+) -> bool:
+    """
+    Whether city belongs to shard of this process, every city does if run is not sharded
+    :param city_key:
+    :return:
+    """
+    if namespace.shard is None:
+        return True
+    index, shards = namespace.shard
+    return sharding.shard_of(city_key, shards) == index
+
+
+def create_cities_watcher() -> Optional[get_info.CitiesWatcher]:
+    """
+    Watch cities file, which is already loaded, for changes
+    :return: None if cities are not loaded from file
+    """
+    if not namespace.infile:
+        return None
+    cities_watcher = get_info.CitiesWatcher()
+    cities_watcher.poll()
+    return cities_watcher
+
+
+def resolve_locations(
+    cities: List[str],
+) -> Dict[str, Dict[str, any]]:
+    """
+    Resolve location info of every city, cities which were not resolved are skipped
+    :param cities: City keys
+    :return: Location info by city key
+    """
+    locations = {}
+    for city_key in cities:
+        prepared_t_l_i = locate_city(city_key)
+        if prepared_t_l_i is None:
+            logging.error(f"Skip {city_key}, location info is not available")
+            continue
+        locations[city_key] = prepared_t_l_i
+    return locations
+
+
+def prepare_schedule(
+    cities: List[str],
+    resolve: Callable[[List[str]], Dict[str, Dict[str, any]]] = None,
+) -> Tuple[Dict[str, Dict[str, any]], scheduler.ReportScheduler]:
+    """
+    Location never changes, so resolve it once and schedule cities by time zone
+    :param cities: City keys
+    :param resolve: Function which resolves locations, resolve_locations if not passed
+    :return: Location info by city key & scheduler
+    """
+    report_scheduler = scheduler.ReportScheduler()
+    locations = {
+        city_key: prepared_t_l_i
+        for city_key, prepared_t_l_i in (resolve or resolve_locations)(cities).items()
+        if report_scheduler.add_city(city_key, prepared_t_l_i["timezone_by_city"])
+    }
+
+    if not len(report_scheduler):
+        logging.error("No cities to report about")
+        sys.exit(1)
+    return locations, report_scheduler
+
+
+def prefetch_batches(
+    locations: Dict[str, Dict[str, any]],
+):
+    """
+    Fetch what providers allow to fetch in batches before city fetch
+    Elevation of cities which were never seen is fetched into cache
+    Weather is fetched from weatherbit if weatherbit city list is passed and its budget is not low
+    :param locations: Location info by city key
+    :return:
+    """
+    get_info.get_elevations_by_ll(
+        [(float(prepared_t_l_i["latitude"]), float(prepared_t_l_i["longitude"])) for prepared_t_l_i in locations.values()]
+    )
+    if rate_limit.is_budget_low("weatherbit"):
+        logging.warning("Weatherbit budget is almost used up, cached weather is reported where it is possible")
+    elif namespace.weatherbit_cities:
+        weather_batch.prefetch(
+            weather_api=WEATHER_API,
+            api_key=namespace.apikey,
+            weatherbit_cities_file=namespace.weatherbit_cities,
+            locations=locations,
+            batch_size=namespace.weather_batch_size,
+        )
+
+
+def cities_to_fetch(
+    cities: List[str],
+) -> List[Tuple[str, Dict[str, any]]]:
+    """
+    Resolve locations for one-shot run and fetch what can be fetched in batches
+    :param cities: City keys
+    :return: City key & location info
+    """
+    locations = resolve_locations(cities)
+    prefetch_batches(locations)
+    return list(locations.items())
+
+
+def flatten_due_cities(
+    due: Dict[str, List[str]],
+) -> List[str]:
+    """
+    Flatten cities which are due grouped by time zone
+    :param due:
+    :return:
+    """
+    due_cities = [city_key for city_keys in due.values() for city_key in city_keys]
+    if due_cities:
+        logging.info(f"It is time to report ! Will report about - {', '.join(due_cities)}")
+    return due_cities
+
+
+async def main_async(
+    cities: List[str],
+):
+    """
+    The same as main_threads, but every provider is called through async engine in one event loop
+    :param cities:
+    :return:
+    """
+    import asyncio
+
+    import async_engine
+
+    engine = async_engine.AsyncEngine(
+        api_key=namespace.apikey,
+        weather_api=WEATHER_API,
+        locate=locate_city,
+        clean_weather_data=clean_weather_data,
+        take_prefetched_weather=weather_batch.take,
+    )
+    try:
+        if namespace.telegram:
+            logging.info("Going to send reports to telegram...")
+            locations, report_scheduler = prepare_schedule(cities)
+            cities_watcher = create_cities_watcher()
+            while True:
+                await asyncio.sleep(min(report_scheduler.seconds_until_due(), get_info.CITIES_POLL_INTERVAL))
+                await asyncio.to_thread(reload_cities, cities_watcher, locations, report_scheduler)
+                metrics.log_stats_periodically()
+                due_cities = flatten_due_cities(report_scheduler.pop_due())
+                if not due_cities:
+                    continue
+                await asyncio.to_thread(prefetch_batches, {city_key: locations[city_key] for city_key in due_cities})
+                async for record in engine.fetch_cities((city_key, locations[city_key]) for city_key in due_cities):
+                    await asyncio.to_thread(report_record, record)
+                flush_outputs()
+                http_session.log_stats()
+                response_cache.log_stats()
+                single_flight.log_stats()
+                rate_limit.log_stats()
+                if telegram_queue_instance is not None:
+                    telegram_queue_instance.log_stats()
+        else:
+            async for record in engine.fetch_cities(await asyncio.to_thread(cities_to_fetch, cities)):
+                await asyncio.to_thread(report_record, record)
+    finally:
+        await engine.aclose()
+
+
+def main_threads(
+    cities: List[str],
+):
+    """
+    Fetch with worker threads
+    :param cities:
+    :return:
+    """
+    fetch_pipeline = create_fetch_pipeline()
     if namespace.telegram:
         logging.info("Going to send reports to telegram...")
-        cities = get_info.load_cities_from_file()
+        locations, report_scheduler = prepare_schedule(cities)
+        cities_watcher = create_cities_watcher()
         while True:
-            if namespace.infile:
-                for city_name in cities:
-                    prepared_t_l_i = prepare_target_location_info(city_name)
-                    if get_info.get_time_by_timezone(timezone_name=prepared_t_l_i["timezone_by_city"]).split()[1] in [
-                        "06:00:00",
-                        "08:00:00",
-                        "10:00:00",
-                        "12:00:00",
-                        "14:00:00",
-                        "16:00:00",
-                        "18:00:00",
-                        "20:00:00",
-                        "22:00:00",
-                    ]:
-                        logging.info(f"It is time to report ! Will report about - {city_name}")
-                        report_weather_info(
-                            report_time=report_time,
-                            weather_data=prepare_weather_data(
-                                prepared_t_l_i["country_name"],
-                                city_name,
-                            ),
-                            city_name=city_name,
-                            timezone_by_city=prepared_t_l_i["timezone_by_city"],
-                            country_name=prepared_t_l_i["country_name"],
-                            elevation=get_info.get_elevation_by_ll(
-                                latitude=prepared_t_l_i["latitude"],
-                                longitude=prepared_t_l_i["longitude"],
-                            ),
-                            water_temp=get_info.get_water_temp_by_ll(
-                                latitude=prepared_t_l_i["latitude"],
-                                longitude=prepared_t_l_i["longitude"],
-                            ),
-                            geomagnetic_field=get_info.get_geomagnetic_field_by_ll(
-                                latitude=prepared_t_l_i["location"].latitude,
-                                longitude=prepared_t_l_i["location"].longitude,
-                            ),
-                        )
+            due = report_scheduler.wait_for_due(max_wait=get_info.CITIES_POLL_INTERVAL)
+            reload_cities(cities_watcher, locations, report_scheduler)
+            metrics.log_stats_periodically()
+            due_cities = flatten_due_cities(due)
+            if not due_cities:
+                continue
+            prefetch_batches({city_key: locations[city_key] for city_key in due_cities})
+            for record in fetch_pipeline.fetch_cities((city_key, locations[city_key]) for city_key in due_cities):
+                report_record(record)
+            flush_outputs()
+            http_session.log_stats()
+            response_cache.log_stats()
+            single_flight.log_stats()
+            rate_limit.log_stats()
+            if telegram_queue_instance is not None:
+                telegram_queue_instance.log_stats()
+    else:
+        for record in fetch_pipeline.fetch_cities(cities_to_fetch(cities)):
+            report_record(record)
+        fetch_pipeline.shutdown()
+        if namespace.verbosity:
+            http_session.log_stats()
+            response_cache.log_stats()
+            single_flight.log_stats()
+            rate_limit.log_stats()
+            metrics.log_stats()
+
+
+def shard_worker(
+    index: int,
+    tasks,
+    results,
+    coordinator_namespace: argparse.Namespace,
+):
+    """
+    Worker process of sharded run, it locates & fetches cities of its shard and coordinator reports them
+    Tasks are locate or fetch with city entries & location info, which may be None
+    :param index: Shard index
+    :param tasks: Queue of tasks for this worker, None stops it
+    :param results: Queue shared by every worker
+    :param coordinator_namespace: Arguments coordinator was started with
+    :return:
+    """
+    global namespace
+    namespace = coordinator_namespace
+    # Metrics are served by coordinator
+    namespace.metrics_port = None
+    configure_providers()
+    # Workers count daily budget together in the budget file of their container
+    shards = namespace.shard[1] if namespace.shard is not None else 1
+    rate_limit.share_limits(namespace.processes * shards, budget_shares=shards)
+    fetch_pipeline = create_fetch_pipeline()
+
+    for task, items in iter(tasks.get, None):
+        try:
+            cities = remember_cities(entry for entry, _ in items)
+            if task == "locate":
+                for located in resolve_locations(cities).items():
+                    results.put(("result", located))
             else:
-                logging.info("Going to load cities by ...")
-                city_name = get_info.get_current_city()
-                prepared_t_l_i = prepare_target_location_info(city_name)
-                if get_info.get_time_by_timezone(timezone_name=prepared_t_l_i["timezone_by_city"]).split()[1] in [
-                    "06:00:00",
-                    "08:00:00",
-                    "10:00:00",
-                    "12:00:00",
-                    "14:00:00",
-                    "16:00:00",
-                    "18:00:00",
-                    "20:00:00",
-                    "22:00:00",
-                ]:
-                    logging.info(f"It is time to report ! Will report about - {city_name}")
-                    report_weather_info(
-                        report_time=report_time,
-                        weather_data=prepare_weather_data(
-                            prepared_t_l_i["country_name"],
-                            city_name,
-                        ),
-                        city_name=city_name,
-                        timezone_by_city=prepared_t_l_i["timezone_by_city"],
-                        country_name=prepared_t_l_i["country_name"],
-                        elevation=get_info.get_elevation_by_ll(
-                            latitude=prepared_t_l_i["latitude"],
-                            longitude=prepared_t_l_i["longitude"],
-                        ),
-                        water_temp=get_info.get_water_temp_by_ll(
-                            latitude=prepared_t_l_i["latitude"],
-                            longitude=prepared_t_l_i["longitude"],
-                        ),
-                        geomagnetic_field=get_info.get_geomagnetic_field_by_ll(
-                            latitude=prepared_t_l_i["location"].latitude,
-                            longitude=prepared_t_l_i["location"].longitude,
-                        ),
-                    )
+                locations = {entry.key: prepared_t_l_i for entry, prepared_t_l_i in items if prepared_t_l_i is not None}
+                locations.update(resolve_locations([entry.key for entry, prepared_t_l_i in items if prepared_t_l_i is None]))
+                prefetch_batches(locations)
+                for record in fetch_pipeline.fetch_cities(locations.items()):
+                    results.put(("result", record))
+        except BaseException as base_err:
+            logging.error(f"Base Err in shard {index} while doing {task} - {base_err}")
+        results.put(("done", index))
+
+    fetch_pipeline.shutdown()
+    if namespace.verbosity:
+        http_session.log_stats()
+        response_cache.log_stats()
+        rate_limit.log_stats()
+        metrics.log_stats()
+
+
+def shard_items(
+    cities: List[str],
+    shards: int,
+    locations: Optional[Dict[str, Dict[str, any]]] = None,
+) -> List[List[Tuple[get_info.CityEntry, Optional[Dict[str, any]]]]]:
+    """
+    City entries & location info split between shards
+    :param cities: City keys
+    :param shards:
+    :param locations: Location info by city key, cities without it are resolved by worker
+    :return:
+    """
+    return sharding.split(
+        [(city_entries.get(city_key, get_info.CityEntry(city_key)), (locations or {}).get(city_key)) for city_key in cities],
+        lambda item: item[0].key,
+        shards,
+        sharding.PROCESS_SALT,
+    )
+
+
+def main_sharded(
+    cities: List[str],
+):
+    """
+    Split cities between worker processes, which locate & fetch them, this process reports every record
+    Timezone lookups, parsing & provider calls use as many cores as there are workers
+    :param cities:
+    :return:
+    """
+    shard_pool = sharding.ShardPool(shard_worker, (namespace,), namespace.processes)
+
+    def resolve(city_keys: List[str]) -> Dict[str, Dict[str, any]]:
+        return dict(shard_pool.run("locate", shard_items(city_keys, len(shard_pool))))
+
+    try:
+        if namespace.telegram:
+            logging.info("Going to send reports to telegram...")
+            locations, report_scheduler = prepare_schedule(cities, resolve)
+            cities_watcher = create_cities_watcher()
+            while True:
+                due = report_scheduler.wait_for_due(max_wait=get_info.CITIES_POLL_INTERVAL)
+                reload_cities(cities_watcher, locations, report_scheduler, resolve)
+                metrics.log_stats_periodically()
+                due_cities = flatten_due_cities(due)
+                if not due_cities:
+                    continue
+                for record in shard_pool.run("fetch", shard_items(due_cities, len(shard_pool), locations)):
+                    report_record(record)
+                flush_outputs()
+                if telegram_queue_instance is not None:
+                    telegram_queue_instance.log_stats()
+        else:
+            for record in shard_pool.run("fetch", shard_items(cities, len(shard_pool))):
+                report_record(record)
+    finally:
+        shard_pool.close()
+
+
+def configure_providers():
+    """
+    Apply HTTP, cache & timezone settings from CLI
+    :return:
+    """
+    http_session.configure(
+        read_timeout=namespace.http_timeout,
+        retries=namespace.http_retries,
+    )
+    response_cache.configure(
+        ttl=namespace.cache_ttl,
+        stale_ttl=namespace.cache_stale_ttl,
+        max_size=namespace.cache_size,
+    )
+    get_info.configure_timezone_finder(in_memory=bool(namespace.timezone_in_memory))
+    rate_limit.configure("weatherbit", daily_budget=namespace.weatherbit_daily_budget)
+    rate_limit.configure("ipinfo", daily_budget=namespace.ipinfo_daily_budget)
+    if namespace.metrics_port is not None:
+        metrics.start_server(namespace.host, namespace.metrics_port)
+
+
+def observe():
+    """
+    Load cities & report weather about them
+    :return:
+    """
+    configure_providers()
+    if namespace.outfile and namespace.format != "markdown":
+        try:
+            get_observations_sink()
+        except ImportError as import_err:
+            logging.error(f"Format {namespace.format} needs package which is not installed - {import_err}")
+            sys.exit(1)
+    if namespace.infile:
+        cities = remember_cities(get_info.load_cities_from_file())
     else:
-        city_name = get_info.get_current_city()
-        prepared_t_l_i = prepare_target_location_info(city_name)
-        report_weather_info(
-            report_time=report_time,
-            weather_data=prepare_weather_data(
-                prepared_t_l_i["country_name"],
-                city_name,
-            ),
-            city_name=city_name,
-            timezone_by_city=prepared_t_l_i["timezone_by_city"],
-            country_name=prepared_t_l_i["country_name"],
-            elevation=get_info.get_elevation_by_ll(
-                latitude=prepared_t_l_i["latitude"],
-                longitude=prepared_t_l_i["longitude"],
-            ),
-            water_temp=get_info.get_water_temp_by_ll(
-                latitude=prepared_t_l_i["location"].latitude,
-                longitude=prepared_t_l_i["location"].longitude,
-            ),
-            geomagnetic_field=get_info.get_geomagnetic_field_by_ll(
-                latitude=prepared_t_l_i["location"].latitude,
-                longitude=prepared_t_l_i["location"].longitude,
-            ),
-        )
+        logging.info("Going to load cities by ...")
+        cities = [get_info.get_current_city()]
+    if namespace.shard is not None:
+        index, shards = namespace.shard
+        cities = [city_key for city_key in cities if in_shard(city_key)]
+        logging.info(f"Shard {index}/{shards} reports about {len(cities)} cities")
+        # Containers of other shards call the same providers
+        rate_limit.share_limits(shards)
+
+    try:
+        if namespace.processes > 1:
+            main_sharded(cities)
+        elif namespace.engine == "async":
+            import asyncio
 
+            asyncio.run(main_async(cities))
+        else:
+            main_threads(cities)
+    finally:
+        close_outputs()
 
-if __name__ == "__main__":
-    if namespace.apikey:
+
+def answer_weather(
+    fetch_pipeline: pipeline.FetchPipeline,
+    city_name: str,
+) -> Optional[Dict[str, any]]:
+    """
+    Fetch row about city for server, every answer is saved into history if asked
+    :param fetch_pipeline:
+    :param city_name:
+    :return:
+    """
+    record = fetch_pipeline.fetch_city(city_name)
+    if record is None:
+        return None
+    row = structured_output.record_to_row(record)
+    if namespace.history:
+        get_history_store().add(row, record.get("city_key"))
+    return row
+
+
+def serve():
+    """
+    Keep caches, sessions & timezone data warm in one process and answer weather about city over HTTP
+    :return:
+    """
+    configure_providers()
+    get_info.get_timezone_finder()
+    fetch_pipeline = create_fetch_pipeline()
+    weather_server = server.WeatherServer(
+        functools.partial(answer_weather, fetch_pipeline),
+        host=namespace.host,
+        port=namespace.port,
+    )
+    try:
+        weather_server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("Stopping...")
+    finally:
+        weather_server.shutdown()
+        fetch_pipeline.shutdown()
+        close_outputs()
+        single_flight.log_stats()
+        rate_limit.log_stats()
+        metrics.log_stats()
+
+
+def main(
+    argv: List[str] = None,
+):
+    """
+    Parse arguments & run what is asked, heavy packages are imported only by code paths which need them
+    :param argv: Arguments without program name, sys.argv if not passed
+    :return:
+    """
+    global namespace
+    namespace = get_args().parse_args(sys.argv[1:] if argv is None else argv)
+
+    if namespace.profile:
+        profiler.run(run, namespace.profile, f"{REPORT_NAME}{report_time}")
+    else:
+        run()
+
+
+def run():
+    """
+    Run what is asked by parsed arguments
+    :return:
+    """
+    if namespace.history_query:
+        print_history()
+    elif namespace.warm_up_cache:
+        logging.info("Warming up geocoding cache...")
+        warm_up_geocoding_cache()
+    elif namespace.apikey and namespace.serve:
+        logging.info("Starting up server...")
+        serve()
+    elif namespace.apikey:
         logging.info("Starting up...")
-        main()
+        observe()
     else:
         logging.error("API key did not provide")
         sys.exit(1)
+
+
+if __name__ == "__main__":
+    import multiprocessing
+
+    # Worker processes of frozen executable start through it
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,26 @@
+import pytest
+
+import get_info
+
+
+@pytest.mark.parametrize(
+    "line, entry",
+    [
+        ("Paris", get_info.CityEntry("Paris")),
+        ("Paris, FR", get_info.CityEntry("Paris", "FR")),
+        ("Paris,48.85,2.35", get_info.CityEntry("Paris", None, 48.85, 2.35)),
+        ("  Paris ,FR, 48.85 ,2.35\n", get_info.CityEntry("Paris", "FR", 48.85, 2.35)),
+    ],
+)
+def test_parse_city_line_forms(line, entry):
+    assert get_info.parse_city_line(line) == entry
+
+
+@pytest.mark.parametrize("line", ["", "   \n", "# Paris", ",FR", "Paris,north,2.35", "Paris,91,2.35", "Paris,FR,1,2,3"])
+def test_parse_city_line_skips_wrong_lines(line):
+    assert get_info.parse_city_line(line) is None
+
+
+def test_city_key_tells_apart_cities_with_the_same_name():
+    keys = {get_info.parse_city_line(line).key for line in ("Paris", "Paris,FR", "Paris,US", "Paris,US,33.66,-95.56")}
+    assert keys == {"paris", "paris, fr", "paris, us", "paris, us, 33.66, -95.56"}
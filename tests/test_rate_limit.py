@@ -0,0 +1,57 @@
+import pytest
+
+import rate_limit
+
+
+@pytest.fixture(autouse=True)
+def budget_store(tmp_path, monkeypatch):
+    store = rate_limit.BudgetStore(str(tmp_path / rate_limit.BUDGET_FILE))
+    monkeypatch.setattr(rate_limit, "budget_store", store)
+    yield store
+    store.close()
+
+
+def take(bucket: rate_limit.TokenBucket, requests: int) -> int:
+    taken = 0
+    for _ in range(requests):
+        try:
+            bucket.try_acquire()
+        except rate_limit.BudgetExhausted:
+            continue
+        taken += 1
+    return taken
+
+
+def test_budget_exhaustion():
+    bucket = rate_limit.TokenBucket("weatherbit", rate=1000, burst=1000, daily_budget=3)
+    assert take(bucket, 3) == 3
+    with pytest.raises(rate_limit.BudgetExhausted):
+        bucket.try_acquire()
+    assert bucket.remaining_budget() == 0
+    assert bucket.is_budget_low()
+    assert bucket.metrics["rejected"] == 1
+
+
+def test_budget_is_shared_through_budget_file(budget_store):
+    first = rate_limit.TokenBucket("weatherbit", rate=1000, burst=1000, daily_budget=60)
+    second = rate_limit.TokenBucket("weatherbit", rate=1000, burst=1000, daily_budget=60)
+    # First bucket reserves the whole block, so the second one gets what is left
+    assert take(first, 1) == 1
+    assert take(second, 20) == 10
+    assert take(first, 60) == rate_limit.BUDGET_BLOCK - 1
+    assert budget_store.used("weatherbit", first._day) == 60
+
+
+def test_budget_is_reset_next_day(monkeypatch):
+    bucket = rate_limit.TokenBucket("weatherbit", rate=1000, burst=1000, daily_budget=2)
+    assert take(bucket, 3) == 2
+    monkeypatch.setattr(rate_limit.TokenBucket, "_today", staticmethod(lambda: "2999-01-01"))
+    assert bucket.remaining_budget() == 2
+    assert take(bucket, 3) == 2
+
+
+def test_budget_is_not_low_without_budget():
+    bucket = rate_limit.TokenBucket("weatherbit", rate=1000, burst=1000)
+    assert take(bucket, 100) == 100
+    assert bucket.remaining_budget() is None
+    assert not bucket.is_budget_low()
@@ -0,0 +1,44 @@
+import gzip
+import os
+
+import report_writer
+
+
+def test_report_is_published_on_close(tmp_path):
+    writer = report_writer.ReportWriter(str(tmp_path / "report"), ".md", flush_every=2)
+    writer.write("a\n")
+    writer.write("b\n")
+    assert not os.path.exists(writer.path)
+    writer.close()
+    assert (tmp_path / "report.md").read_text() == "a\nb\n"
+    assert sorted(os.listdir(tmp_path)) == ["report.md"]
+
+
+def test_report_rotates_above_max_bytes(tmp_path):
+    writer = report_writer.ReportWriter(str(tmp_path / "report"), ".md", flush_every=1, max_bytes=10)
+    for section in ("aaaaaa", "bbbbbb", "cccccc", "dd"):
+        writer.write(section)
+    writer.close()
+    assert (tmp_path / "report.md").read_text() == "aaaaaabbbbbb"
+    assert (tmp_path / "report.1.md").read_text() == "ccccccdd"
+    assert sorted(os.listdir(tmp_path)) == ["report.1.md", "report.md"]
+
+
+def test_flush_publishes_next_part(tmp_path):
+    writer = report_writer.ReportWriter(str(tmp_path / "report"), ".md")
+    writer.write("a")
+    writer.flush()
+    writer.flush()
+    writer.write("b")
+    writer.close()
+    assert (tmp_path / "report.md").read_text() == "a"
+    assert (tmp_path / "report.1.md").read_text() == "b"
+
+
+def test_compressed_report_rotates(tmp_path):
+    writer = report_writer.ReportWriter(str(tmp_path / "report"), ".md", flush_every=1, compress=True, max_bytes=1)
+    writer.write("a")
+    writer.write("b")
+    writer.close()
+    assert gzip.decompress((tmp_path / "report.md.gz").read_bytes()) == b"a"
+    assert gzip.decompress((tmp_path / "report.1.md.gz").read_bytes()) == b"b"
@@ -0,0 +1,35 @@
+from datetime import datetime, timezone
+
+import scheduler
+
+
+def utc(*args) -> datetime:
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+def test_next_report_time_before_spring_forward():
+    # Madrid is UTC+1 until 2024-03-31 02:00 local time
+    assert scheduler.next_report_time("Europe/Madrid", utc(2024, 3, 30, 4, 30)) == utc(2024, 3, 30, 5)
+
+
+def test_next_report_time_across_spring_forward():
+    # 23:30 CET, next report is 06:00 CEST
+    assert scheduler.next_report_time("Europe/Madrid", utc(2024, 3, 30, 22, 30)) == utc(2024, 3, 31, 4)
+
+
+def test_next_report_time_across_fall_back():
+    # 23:30 CEST, next report is 06:00 CET
+    assert scheduler.next_report_time("Europe/Madrid", utc(2024, 10, 26, 21, 30)) == utc(2024, 10, 27, 5)
+
+
+def test_next_report_time_is_strictly_later():
+    # 22:00 local time is the last report of the day
+    assert scheduler.next_report_time("Europe/Madrid", utc(2024, 7, 1, 20)) == utc(2024, 7, 2, 4)
+
+
+def test_add_city_skips_unknown_timezone():
+    report_scheduler = scheduler.ReportScheduler()
+    assert not report_scheduler.add_city("nowhere", None)
+    assert not report_scheduler.add_city("mars", "Mars/Olympus_Mons")
+    assert report_scheduler.add_city("madrid, es", "Europe/Madrid")
+    assert len(report_scheduler) == 1
@@ -0,0 +1,39 @@
+import os
+import subprocess
+import sys
+
+import sharding
+
+CITY_KEYS = ["paris, fr", "london", "new york, us, 40.71, -74.01", "tokyo"]
+
+
+def test_shard_of_is_pinned():
+    # Changing the split moves cities between running containers, so the values must stay the same
+    assert [sharding.shard_of(city_key, 4) for city_key in CITY_KEYS] == [2, 1, 3, 0]
+    assert [sharding.shard_of(city_key, 4, sharding.PROCESS_SALT) for city_key in CITY_KEYS[:2]] == [1, 2]
+
+
+def test_shard_of_ignores_case_and_spaces():
+    assert sharding.shard_of("  New  York, US, 40.71, -74.01 ", 4) == sharding.shard_of(CITY_KEYS[2], 4)
+
+
+def test_shard_of_does_not_depend_on_hash_seed():
+    code = f"import sharding; print([sharding.shard_of(city_key, 7) for city_key in {CITY_KEYS!r}])"
+    answers = set()
+    for seed in ("1", "2"):
+        completed = subprocess.run(
+            [sys.executable, "-c", code],
+            env={**os.environ, "PYTHONHASHSEED": seed, "PYTHONPATH": os.pathsep.join(sys.path)},
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        answers.add(completed.stdout)
+    assert answers == {f"{[sharding.shard_of(city_key, 7) for city_key in CITY_KEYS]}\n"}
+
+
+def test_split_keeps_every_item():
+    items = [f"city {index}" for index in range(1000)]
+    by_shard = sharding.split(items, lambda item: item, 4)
+    assert sorted(item for shard in by_shard for item in shard) == sorted(items)
+    assert all(150 < len(shard) < 350 for shard in by_shard)
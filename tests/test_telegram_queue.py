@@ -0,0 +1,32 @@
+import telegram_queue
+
+LIMIT = telegram_queue.MESSAGE_LIMIT
+
+
+def test_pack_messages_fills_message_up_to_limit():
+    texts = ["a" * 2047, "b" * 2048]
+    assert telegram_queue.pack_messages(texts) == ["a" * 2047 + telegram_queue.SEPARATOR + "b" * 2048]
+    assert LIMIT == 4096
+
+
+def test_pack_messages_starts_next_message_above_limit():
+    texts = ["a" * 2048, "b" * 2048]
+    assert telegram_queue.pack_messages(texts) == texts
+
+
+def test_pack_messages_splits_long_report_by_lines():
+    report = "a" * 4000 + "\n" + "b" * 200
+    messages = telegram_queue.pack_messages([report])
+    assert messages == ["a" * 4000 + "\n", "b" * 200]
+
+
+def test_pack_messages_splits_long_line():
+    messages = telegram_queue.pack_messages(["a" * (LIMIT + 1)])
+    assert messages == ["a" * LIMIT, "a"]
+
+
+def test_pack_messages_never_exceeds_limit():
+    texts = [f"{index}\n" * (index * 37 % 900) for index in range(200)]
+    messages = telegram_queue.pack_messages(texts)
+    assert all(len(message) <= LIMIT for message in messages)
+    assert "".join(messages).replace(telegram_queue.SEPARATOR, "") == "".join(texts).replace("\n", "")